@@ -1,4 +1,6 @@
+import inspect
 from abc import ABC, abstractmethod
+from array import array
 from Visitor import *
 
 
@@ -248,4 +250,226 @@ class IfThenElse(Expression):
         self.e1 = e1
 
     def accept(self, visitor, arg):
-        return visitor.visit_ifThenElse(self, arg)
\ No newline at end of file
+        return visitor.visit_ifThenElse(self, arg)
+
+
+class FlatTree:
+    """
+    This class encodes expression trees as four parallel arrays of integers,
+    in post-order. Thus, a tree with millions of nodes takes a few arrays,
+    instead of millions of Python objects. The node at index i has:
+
+    - op[i]: its opcode, which is the index of its class in self.classes.
+    - left[i] and right[i]: the indices of its first two sub-expressions, or
+      -1 if it has fewer. The last sub-expression of a node always comes just
+      before it. For instance, e1 in IfThenElse(cond, e0, e1) is at i - 1.
+    - data[i]: the index, in self.consts, of the tuple with the fields that
+      are not expressions (numbers, names, etc), or -1 if there is none.
+
+    Visitors run over a FlatTree unchanged: tree.node(i) is a view of the node
+    at index i, with the same fields and the same accept method as the
+    original expression. Views are built on demand, as the visitor reads the
+    fields, and are discarded afterwards. Examples:
+
+    >>> t = FlatTree(Eql(Num(1), Var('t')))
+    >>> list(t.op), list(t.left), list(t.right), list(t.data)
+    ([1, 2, 0], [-1, -1, 0], [-1, -1, 1], [0, 1, -1])
+    >>> t.root.accept(TypeCheckVisitor(), {'t': type(1)})
+    <class 'bool'>
+
+    >>> t = FlatTree(Let('x', ArrowType(type(1), type(1)), Num(1), Var('x')))
+    >>> t.consts
+    [(1,), ('x',), ('x', <class 'int'> -> <class 'int'>)]
+    >>> e = t.expression()
+    >>> type(e).__name__, e.identifier, e.exp_def.num, e.exp_body.identifier
+    ('Let', 'x', 1, 'x')
+    """
+
+    def __init__(self, exp=None):
+        self.op = array("i")
+        self.left = array("i")
+        self.right = array("i")
+        self.data = array("i")
+        # For each opcode: its class, the names of its sub-expressions and of
+        # its constants, the layout of the arguments of its constructor, and
+        # the class of its views:
+        self.classes = []
+        self.children = []
+        self.constants = []
+        self.layouts = []
+        self.views = []
+        self.opcodes = {}
+        self.consts = []
+        self.const_ids = {}
+        if exp is not None:
+            self.add(exp)
+
+    def __len__(self):
+        return len(self.op)
+
+    @property
+    def root(self):
+        """
+        The view of the last expression added to the tree.
+        """
+        return self.node(len(self.op) - 1)
+
+    def node(self, i):
+        return self.views[self.op[i]](self, i)
+
+    def opcode(self, exp):
+        """
+        Returns the opcode of the class of exp. The first time that the tree
+        sees an instance of a class, it gives the class an opcode, and finds
+        its layout: for each argument of the constructor, whether it is the
+        k-th sub-expression, or the k-th constant of the node.
+        """
+        cls = type(exp)
+        code = self.opcodes.get(cls)
+        if code is None:
+            code = len(self.classes)
+            names = list(inspect.signature(cls.__init__).parameters)[1:]
+            children = [name for name in names
+                        if isinstance(getattr(exp, name), Expression)]
+            constants = [name for name in names if name not in children]
+            layout = []
+            fields = {"__slots__": (), "accept": cls.accept}
+            for name in names:
+                if name in children:
+                    k = children.index(name)
+                    fields[name] = property(FlatNode.child_getter(k))
+                else:
+                    k = constants.index(name)
+                    fields[name] = property(FlatNode.const_getter(k))
+                layout.append((name in children, k))
+            self.classes.append(cls)
+            self.children.append(children)
+            self.constants.append(constants)
+            self.layouts.append(layout)
+            self.views.append(type(cls.__name__ + "View", (FlatNode,), fields))
+            self.opcodes[cls] = code
+        return code
+
+    def const(self, code, values):
+        """
+        Returns the index of the tuple of constants 'values' in self.consts.
+        Nodes with the same opcode and equal constants share the same tuple.
+        """
+        key = (code, values)
+        try:
+            index = self.const_ids.get(key)
+        except TypeError:
+            # Some values, such as types with __eq__, are not hashable:
+            key = index = None
+        if index is None:
+            index = len(self.consts)
+            self.consts.append(values)
+            if key is not None:
+                self.const_ids[key] = index
+        return index
+
+    def add(self, exp):
+        """
+        Appends the nodes of exp to the tree, in post-order, and returns the
+        index of its root. The traversal uses an explicit stack, so exp can be
+        arbitrarily deep.
+        """
+        done = []
+        stack = [(exp, None)]
+        while stack:
+            node, code = stack.pop()
+            if code is None:
+                code = self.opcode(node)
+                stack.append((node, code))
+                for name in reversed(self.children[code]):
+                    stack.append((getattr(node, name), None))
+                continue
+            arity = len(self.children[code])
+            left = right = -1
+            if arity > 0:
+                left = done[-arity]
+                if arity > 1:
+                    right = done[1 - arity]
+                del done[-arity:]
+            data = -1
+            if self.constants[code]:
+                values = tuple([getattr(node, name)
+                                for name in self.constants[code]])
+                data = self.const(code, values)
+            self.op.append(code)
+            self.left.append(left)
+            self.right.append(right)
+            self.data.append(data)
+            done.append(len(self.op) - 1)
+        return done[0]
+
+    def expression(self, i=None):
+        """
+        Rebuilds the expression at index i (by default, the last one added to
+        the tree) with the original classes.
+        """
+        if i is None:
+            i = len(self.op) - 1
+        # In post-order, the nodes of the expression at i lie in first..i:
+        first = i
+        while self.children[self.op[first]]:
+            first = self.left[first]
+        done = []
+        for j in range(first, i + 1):
+            code = self.op[j]
+            arity = len(self.children[code])
+            children = done[len(done) - arity:]
+            del done[len(done) - arity:]
+            values = self.consts[self.data[j]] if self.data[j] >= 0 else ()
+            args = [children[k] if is_child else values[k]
+                    for is_child, k in self.layouts[code]]
+            done.append(self.classes[code](*args))
+        return done[0]
+
+
+class FlatNode:
+    """
+    This class is the base of the views of the nodes of a FlatTree. Each
+    opcode has its own subclass, which has the same fields as the original
+    class. Fields that are expressions are views as well. The accept method
+    of the subclass is the accept method of the original class, so visitors
+    cannot tell a view from an expression.
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @staticmethod
+    def child_getter(k):
+        """
+        Returns a function that reads the k-th sub-expression of a view.
+        """
+        if k == 0:
+            def get(view):
+                tree = view.tree
+                i = tree.left[view.index]
+                return tree.views[tree.op[i]](tree, i)
+        elif k == 1:
+            def get(view):
+                tree = view.tree
+                i = tree.right[view.index]
+                return tree.views[tree.op[i]](tree, i)
+        else:
+            def get(view):
+                tree = view.tree
+                i = view.index - 1
+                return tree.views[tree.op[i]](tree, i)
+        return get
+
+    @staticmethod
+    def const_getter(k):
+        """
+        Returns a function that reads the k-th constant of a view.
+        """
+        def get(view):
+            tree = view.tree
+            return tree.consts[tree.data[view.index]][k]
+        return get
@@ -1,7 +1,7 @@
 import sys
 
 from Expression import *
-from Lexer import Token, TokenType
+from Lexer import Token, TokenType, TokenBuffer
 
 """
 This file implements a parser for SML with anonymous functions and type
@@ -33,13 +33,74 @@ References:
     see https://www.engr.mun.ca/~theo/Misc/exp_parsing.htm#classic
 """
 
+class TokenStream:
+    """
+    This class reads tokens on demand from a token generator, such as
+    Lexer.tokens(). It only keeps the last 'capacity' tokens, in a ring buffer.
+    Thus, the memory used to store tokens does not depend on the size of the
+    input. Tokens are indexed as in a list, but an index can only refer to one
+    of the last tokens read. As the length of the stream is not known in
+    advance, indices past the end of the input give an EOF token.
+
+    >>> tks = [Token('1', TokenType.NUM), Token('+', TokenType.ADD)]
+    >>> tks += [Token('2', TokenType.NUM)]
+    >>> stream = TokenStream(tks, capacity=2)
+    >>> stream[0].text, stream[1].text, stream[2].text, stream[3].kind.name
+    ('1', '+', '2', 'EOF')
+
+    >>> stream[0]
+    Traceback (most recent call last):
+    IndexError: token 0 was discarded from the stream
+    """
+
+    def __init__(self, tokens, capacity=8):
+        self.tokens = iter(tokens)
+        self.capacity = capacity
+        self.ring = capacity * [None]
+        self.first = 0  # The index of the oldest token in the ring buffer.
+        self.end = 0  # The index of the next token that will be read.
+        self.eof = Token("", TokenType.EOF)
+
+    def __getitem__(self, i):
+        while i >= self.end:
+            token = next(self.tokens, None)
+            if token is None:
+                return self.eof
+            if self.end - self.first == self.capacity:
+                self.first += 1
+            self.ring[self.end % self.capacity] = token
+            self.end += 1
+        if i < self.first:
+            raise IndexError(f"token {i} was discarded from the stream")
+        return self.ring[i % self.capacity]
+
+
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, streaming=False):
         """
         Initializes the parser. The parser keeps track of the list of tokens
-        and the current token. For instance:
+        and the current token. If streaming is True, then the tokens are not
+        copied into a list. Instead, they are read on demand, through a
+        TokenStream, which keeps only the last few tokens in memory. Thus,
+        parsing can start before the whole input is scanned. The tokens
+        can also be a TokenBuffer, which is used as it is:
+        self.tokens.kind(i) and self.tokens.text(i) then read the i-th
+        token without creating Token objects. For instance:
+
+        >>> parser = Parser([Token('1', TokenType.NUM)], streaming=True)
+        >>> parser.tokens[0].text, parser.tokens[1].kind.name
+        ('1', 'EOF')
+
+        >>> parser = Parser(TokenBuffer("fn x => x"))
+        >>> len(parser.tokens), parser.tokens.kind(2)
+        (4, <TokenType.ARW: 219>)
         """
-        self.tokens = list(tokens)
+        if streaming:
+            self.tokens = TokenStream(tokens)
+        elif isinstance(tokens, TokenBuffer):
+            self.tokens = tokens
+        else:
+            self.tokens = list(tokens)
         self.cur_token_idx = 0 # This is just a suggestion!
         # You can (and probably should!) modify this method.
 
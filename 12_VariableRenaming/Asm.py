@@ -14,6 +14,10 @@ values. The following instructions are recognized:
     * slt rd, rs1, rs2: rd = (rs1 < rs2) ? 1 : 0 (signed comparison)
     * slti rd, rs1, imm: rd = (rs1 < imm) ? 1 : 0
 
+Besides 'eval', which runs each instruction via its own 'eval' method, the
+Program has a method 'run', which first decodes the instructions into tuples of
+integers, and then runs them in a single loop.
+
 This file uses doctests all over. To test it, just run python 3 as follows:
 "python3 -m doctest Asm.py". The program uses syntax that is excluive of
 Python 3. It will not work with standard Python 2.
@@ -23,6 +27,56 @@ import sys
 from collections import deque
 from abc import ABC, abstractmethod
 
+# The opcodes of decoded instructions. EVAL stands for any instruction that
+# Program.run does not handle by itself.
+ADDI, ADD, SUB, MUL, SLT, XORI, SLTI, XOR, DIV, EVAL = range(10)
+
+OPCODES = {"addi": ADDI, "add": ADD, "sub": SUB, "mul": MUL, "div": DIV,
+           "xor": XOR, "xori": XORI, "slt": SLT, "slti": SLTI}
+
+
+class Unset:
+    """
+    The value of registers that were not defined yet, during Program.run. Any
+    operation on it raises TypeError, and then run evaluates the instruction
+    with Inst.eval, which reports the error.
+    """
+
+    def __eq__(self, other):
+        raise TypeError("undefined register")
+
+
+UNSET = Unset()
+
+
+class Decoder(dict):
+    """
+    The Decoder maps each register name to its index in the register file
+    used by Program.run. New names get new indices as they are looked up.
+    Index 0 holds x0.
+
+    Example:
+        >>> d = Decoder({"a": 1})
+        >>> d["b"], d["a"], d["x0"], d.size
+        (2, 1, 0, 3)
+    """
+
+    def __init__(self, env):
+        super().__init__(x0=0)
+        for name in env:
+            self[name]
+
+    def __missing__(self, name):
+        index = self[name] = len(self)
+        return index
+
+    @property
+    def size(self):
+        return len(self)
+
+    def dst(self, name):
+        return self[name]
+
 
 class Program:
     """
@@ -36,6 +90,7 @@ class Program:
         self.__env = env
         self.__insts = insts
         self.pc = 0
+        self.__decoded = None
         self.__env["x0"] = 0
 
     def get_inst(self):
@@ -48,6 +103,7 @@ class Program:
 
     def add_inst(self, inst):
         self.__insts.append(inst)
+        self.__decoded = None
 
     def set_pc(self, pc):
         self.pc = pc
@@ -97,6 +153,120 @@ class Program:
             inst.eval(self)
             inst = self.get_inst()
 
+    def decode(self):
+        """
+        Translates the instructions into tuples (opcode, a, b, c) of integers,
+        where registers are replaced by their index in the register file. The
+        result is kept until the instructions change, so that each call of
+        run does not decode them again.
+
+        Example:
+            >>> insts = [Addi("t0", "x0", 2), Add("t1", "t0", "b0")]
+            >>> code, decoder = Program({"b0": 1}, insts).decode()
+            >>> code
+            [(0, 2, 0, 2), (1, 3, 2, 1)]
+
+            >>> p = Program({"b0": 1}, insts)
+            >>> p.decode() is p.decode()
+            True
+            >>> p.add_inst(Addi("t1", "t0", 1))
+            >>> len(p.decode()[0])
+            3
+        """
+        if self.__decoded is None:
+            decoder = Decoder(self.__env)
+            code = [inst.decode(decoder) for inst in self.__insts]
+            self.__decoded = code, decoder
+        return self.__decoded
+
+    def get_regs(self, decoder):
+        regs = [UNSET] * decoder.size
+        for name, index in decoder.items():
+            regs[index] = self.__env.get(name, UNSET)
+        return regs
+
+    def set_regs(self, decoder, regs):
+        for name, index in decoder.items():
+            if regs[index] is not UNSET:
+                self.__env[name] = regs[index]
+
+    def run(self):
+        """
+        Evaluates the program like eval, but runs the decoded instructions in
+        a single loop, over a list of registers. Instructions that the loop
+        does not handle, or that fail, are evaluated with Inst.eval, so that
+        the results and errors are the same as in eval.
+
+        Example:
+            >>> insts = [Add("x0", "b0", "b1"), Sub("x1", "x0", "b2")]
+            >>> p = Program({"b0":2, "b1":3, "b2": 4}, insts)
+            >>> p.run()
+            >>> p.print_env()
+            b0: 2
+            b1: 3
+            b2: 4
+            x0: 5
+            x1: 1
+
+            If an instruction fails, run stops with its error, and keeps the
+            registers and the pc that it reached, like eval:
+
+            >>> insts = [Addi("a", "b0", 1), Div("a", "a", "x0"),
+            ...          Addi("a", "x0", 0)]
+            >>> p = Program({"b0": 6}, insts)
+            >>> p.run()
+            Traceback (most recent call last):
+            ...
+            ZeroDivisionError: integer division or modulo by zero
+            >>> p.get_val("a"), p.pc
+            (7, 2)
+        """
+        code, decoder = self.decode()
+        regs = self.get_regs(decoder)
+        pc = self.pc
+        size = len(code)
+        try:
+            while 0 <= pc < size:
+                op, a, b, c = code[pc]
+                pc += 1
+                try:
+                    if op == ADDI:
+                        regs[a] = regs[b] + c
+                    elif op == ADD:
+                        regs[a] = regs[b] + regs[c]
+                    elif op == SUB:
+                        regs[a] = regs[b] - regs[c]
+                    elif op == MUL:
+                        regs[a] = regs[b] * regs[c]
+                    elif op == SLT:
+                        regs[a] = 1 if regs[b] < regs[c] else 0
+                    elif op == XORI:
+                        regs[a] = regs[b] ^ c
+                    elif op == SLTI:
+                        regs[a] = 1 if regs[b] < c else 0
+                    elif op == XOR:
+                        regs[a] = regs[b] ^ regs[c]
+                    elif op == DIV:
+                        regs[a] = regs[b] // regs[c]
+                    else:
+                        pc = self.eval_inst(pc - 1, decoder, regs)
+                except TypeError:
+                    pc = self.eval_inst(pc - 1, decoder, regs)
+        finally:
+            self.pc = pc
+            self.set_regs(decoder, regs)
+
+    def eval_inst(self, pc, decoder, regs):
+        """
+        Evaluates the instruction at pc with Inst.eval, on behalf of run, and
+        returns the next pc.
+        """
+        self.set_regs(decoder, regs)
+        self.pc = pc
+        self.get_inst().eval(self)
+        regs[:] = self.get_regs(decoder)
+        return self.pc
+
 
 def max(a, b):
     """
@@ -168,6 +338,13 @@ class Inst(ABC):
     def eval(self, prog):
         raise NotImplementedError
 
+    def decode(self, decoder):
+        """
+        Returns the tuple that represents this instruction in Program.run. By
+        default, the instruction is evaluated with its own 'eval'.
+        """
+        return (EVAL, 0, 0, 0)
+
 
 class BinOp(Inst):
     """
@@ -185,6 +362,10 @@ class BinOp(Inst):
         op = self.get_opcode()
         return f"{self.rd} = {op} {self.rs1} {self.rs2}"
 
+    def decode(self, decoder):
+        return (OPCODES[self.get_opcode()], decoder.dst(self.rd),
+                decoder[self.rs1], decoder[self.rs2])
+
 
 class BinOpImm(Inst):
     """
@@ -203,6 +384,10 @@ class BinOpImm(Inst):
         op = self.get_opcode()
         return f"{self.rd} = {op} {self.rs1} {self.imm}"
 
+    def decode(self, decoder):
+        return (OPCODES[self.get_opcode()], decoder.dst(self.rd),
+                decoder[self.rs1], self.imm)
+
 
 class Add(BinOp):
     """
@@ -437,4 +622,43 @@ class Slti(BinOpImm):
         prog.set_val(self.rd, 1 if rs1 < self.imm else 0)
 
     def get_opcode(self):
-        return "slti"
\ No newline at end of file
+        return "slti"
+
+
+def benchmark(n=100000, repeat=3):
+    """
+    Prints how long eval and run take to evaluate a sequence of n arithmetic
+    instructions. Each method runs 'repeat' times on the same program. Only
+    the first call of run decodes it, so the time of that call is shown next
+    to the best time. Decoding alone is also shown. To use it, do, for
+    instance:
+
+    python3 -c "import Asm; Asm.benchmark()"
+    """
+    import time
+
+    line = []
+    for _ in range(n // 4):
+        line += [Addi("a0", "a0", 1), Mul("a1", "a0", "a0"),
+                 Sub("a2", "a1", "a0"), Slt("a3", "a0", "a2")]
+    for name, insts, result in (("line", line, "a2"),):
+        for method in ("eval", "run", "decode"):
+            first = best = None
+            p = Program({"a0": 0}, insts)
+            for _ in range(repeat):
+                if method == "decode":
+                    p = Program({"a0": 0}, insts)
+                p.set_pc(0)
+                p.set_val("a0", 0)
+                begin = time.perf_counter()
+                getattr(p, method)()
+                elapsed = time.perf_counter() - begin
+                if first is None:
+                    first = elapsed
+                if best is None or elapsed < best:
+                    best = elapsed
+            if method == "decode":
+                print(f"{name} {method}: {best:.3f}s")
+            else:
+                print(f"{name} {method}: {p.get_val(result)}, {best:.3f}s "
+                      f"(first call: {first:.3f}s)")
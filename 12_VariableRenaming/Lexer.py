@@ -1,5 +1,9 @@
+import os
+import re
 import sys
 import enum
+import time
+from array import array
 
 
 class Token:
@@ -9,6 +13,11 @@ class Token:
     uniquely. See the TokenType to know the possible identifiers (if you want).
     You don't need to change this class.
     """
+
+    # Tokens only have these two fields. Declaring them as slots saves the
+    # dictionary that Python would otherwise allocate for each token.
+    __slots__ = ("text", "kind")
+
     def __init__(self, tokenText, tokenKind):
         # The token's actual text. Used for identifiers, strings, and numbers.
         self.text = tokenText
@@ -48,7 +57,19 @@ class TokenType(enum.Enum):
 
 
 class Lexer:
-    
+
+    def __new__(cls, source):
+        """
+        Creates the lexer selected by the LEXER environment variable, which can
+        be 'dfa' or 'regex'. If LEXER is not set, then this is just an instance
+        of Lexer. That lets us compare backends without changing the driver:
+
+        LEXER=regex python3 driver.py < big_input.txt
+        """
+        if cls is Lexer:
+            cls = BACKENDS.get(os.environ.get("LEXER"), Lexer)
+        return super().__new__(cls)
+
     def __init__(self, source):
         """
         The constructor of the lexer. It receives the string that shall be
@@ -94,4 +115,357 @@ class Lexer:
         TODO: Implement this method (you can reuse Lab 5: Visitors)!
         """
         token = None
-        return token
\ No newline at end of file
+        return token
+
+
+class DFA:
+    """
+    This class represents a deterministic finite automaton whose transitions
+    are stored in a table. Each row of the table is a state, and each column
+    is an ASCII character (plus one extra column for every other character).
+    The table is built once, when this module is imported, so that scanning a
+    character costs only two list lookups.
+    """
+
+    NCHARS = 129  # The 128 ASCII characters, plus 'anything else'.
+    DEAD = -1  # The target of missing transitions.
+    WORD = "word"  # Final states that must be classified as keywords.
+
+    def __init__(self):
+        self.table = []
+        self.accept = []
+
+    def new_state(self, kind=None):
+        """
+        Creates a new state. If kind is not None, then the state is final,
+        and recognizes tokens of that kind.
+        """
+        self.table.append(DFA.NCHARS * [DFA.DEAD])
+        self.accept.append(kind)
+        return len(self.table) - 1
+
+    def add_edge(self, src, chars, dst):
+        for c in chars:
+            self.table[src][ord(c)] = dst
+
+    def add_default_edge(self, src, dst, but=""):
+        """
+        Adds a transition from src to dst on every character, except those in
+        the string 'but'.
+        """
+        row = self.table[src]
+        for c in range(DFA.NCHARS):
+            row[c] = dst
+        for c in but:
+            row[ord(c)] = DFA.DEAD
+
+
+SYMBOLS = {
+    "=": TokenType.EQL,
+    "+": TokenType.ADD,
+    "*": TokenType.MUL,
+    "/": TokenType.DIV,
+    "~": TokenType.NEG,
+    "(": TokenType.LPR,
+    ")": TokenType.RPR,
+}
+
+KEYWORDS = {
+    "true": TokenType.TRU,
+    "false": TokenType.FLS,
+    "let": TokenType.LET,
+    "in": TokenType.INX,
+    "end": TokenType.END,
+    "not": TokenType.NOT,
+}
+
+
+def build_dfa():
+    """
+    Builds the automaton that recognizes every token in TokenType. Words
+    (identifiers and reserved words) are recognized by a single state, and are
+    then classified by the KEYWORDS table.
+
+    >>> dfa = build_dfa()
+    >>> len(dfa.table) == len(dfa.accept)
+    True
+    """
+    digits = "0123456789"
+    letters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_"
+    dfa = DFA()
+    start = dfa.new_state()
+    # Blanks and new lines:
+    wsp = dfa.new_state(TokenType.WSP)
+    dfa.add_edge(start, " \t\r", wsp)
+    dfa.add_edge(wsp, " \t\r", wsp)
+    dfa.add_edge(start, "\n", dfa.new_state(TokenType.NLN))
+    # Single-character operators:
+    for text, kind in SYMBOLS.items():
+        dfa.add_edge(start, text, dfa.new_state(kind))
+    # Less than (<), less than or equal (<=) and assignment (<-):
+    lth = dfa.new_state(TokenType.LTH)
+    dfa.add_edge(start, "<", lth)
+    dfa.add_edge(lth, "=", dfa.new_state(TokenType.LEQ))
+    dfa.add_edge(lth, "-", dfa.new_state(TokenType.ASN))
+    # Subtraction (-) and line comments (-- ...):
+    sub = dfa.new_state(TokenType.SUB)
+    line_com = dfa.new_state(TokenType.COM)
+    dfa.add_edge(start, "-", sub)
+    dfa.add_edge(sub, "-", line_com)
+    dfa.add_default_edge(line_com, line_com, but="\n")
+    # Numbers:
+    num = dfa.new_state(TokenType.NUM)
+    dfa.add_edge(start, digits, num)
+    dfa.add_edge(num, digits, num)
+    # Identifiers and reserved words:
+    word = dfa.new_state(DFA.WORD)
+    dfa.add_edge(start, letters, word)
+    dfa.add_edge(word, letters + digits, word)
+    return dfa
+
+
+SCANNER = build_dfa()
+
+
+class DfaLexer(Lexer):
+    """
+    This lexer implements getToken with the table-driven automaton in SCANNER.
+    Instead of testing each character against a chain of conditionals, the
+    scanner follows the transition table until it reaches a dead state, and
+    then returns the longest prefix that ended in a final state. The stream of
+    tokens is the same produced by the Lexer class:
+
+    >>> l = DfaLexer('1 * 2 -- 3\\n')
+    >>> [tk.kind for tk in l.tokens()]
+    [<TokenType.NUM: 3>, <TokenType.MUL: 204>, <TokenType.NUM: 3>]
+
+    >>> l = DfaLexer("let v <- 2 in v end")
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['LET', 'VAR', 'ASN', 'NUM', 'INX', 'VAR', 'END']
+
+    >>> l = DfaLexer("let x1 <- ~2 in x1 / 2 <= x1 end")
+    >>> [tk.text for tk in l.tokens()]
+    ['let', 'x1', '<-', '~', '2', 'in', 'x1', '/', '2', '<=', 'x1', 'end']
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.length = len(source)
+        self.pos = 0
+
+    def getToken(self):
+        """
+        Return the next token, or EOF if the whole source has been scanned.
+
+        >>> l = DfaLexer("x")
+        >>> [l.getToken().kind.name, l.getToken().kind.name]
+        ['VAR', 'EOF']
+
+        >>> l = DfaLexer("1 % 2")
+        >>> [tk.kind.name for tk in l.tokens()]
+        Traceback (most recent call last):
+        SystemExit: Lexical error: '%'
+        """
+        source = self.source
+        start = self.pos
+        if start >= self.length:
+            return Token("", TokenType.EOF)
+        table = SCANNER.table
+        accept = SCANNER.accept
+        state = 0
+        kind = None
+        end = start
+        i = start
+        while i < self.length:
+            c = ord(source[i])
+            state = table[state][c if c < 128 else 128]
+            if state == DFA.DEAD:
+                break
+            i += 1
+            if accept[state] is not None:
+                kind = accept[state]
+                end = i
+        if kind is None:
+            sys.exit(f"Lexical error: {source[start]!r}")
+        text = source[start:end]
+        if kind == DFA.WORD:
+            kind = KEYWORDS.get(text, TokenType.VAR)
+            if kind == TokenType.VAR:
+                # Every occurrence of a name shares the same string object.
+                text = sys.intern(text)
+        self.pos = end
+        return Token(text, kind)
+
+
+def build_regex():
+    """
+    Builds one regular expression that recognizes every token in TokenType.
+    Each kind of token is a named group, so that match.lastgroup is the name
+    of the kind of the token. Longer tokens come first, e.g., "<=" before "<",
+    and reserved words come before identifiers.
+
+    >>> [m.lastgroup for m in build_regex().finditer("let letx<-x<=1")]
+    ['LET', 'WSP', 'VAR', 'ASN', 'VAR', 'LEQ', 'NUM']
+    """
+    patterns = [
+        ("WSP", r"[ \t\r]+"),
+        ("NLN", r"\n"),
+        ("COM", r"--[^\n]*"),
+        ("LEQ", r"<="),
+        ("ASN", r"<-"),
+        ("NUM", r"[0-9]+"),
+    ]
+    for text, kind in KEYWORDS.items():
+        patterns.append((kind.name, re.escape(text) + r"(?![a-zA-Z0-9_])"))
+    patterns.append(("VAR", r"[a-zA-Z_][a-zA-Z0-9_]*"))
+    for text, kind in SYMBOLS.items():
+        patterns.append((kind.name, re.escape(text)))
+    patterns += [("LTH", r"<"), ("SUB", r"-"), ("ERR", r".")]
+    return re.compile("|".join(f"(?P<{name}>{rx})" for name, rx in patterns))
+
+
+MASTER_REGEX = build_regex()
+
+
+class RegexLexer(Lexer):
+    """
+    This lexer scans the source with a single compiled regular expression,
+    MASTER_REGEX. Thus, the loop over characters runs inside the re module,
+    and Python code only runs once per token. The stream of tokens is the
+    same produced by the Lexer class:
+
+    >>> l = RegexLexer('1 * 2 -- 3\\n')
+    >>> [tk.kind for tk in l.tokens()]
+    [<TokenType.NUM: 3>, <TokenType.MUL: 204>, <TokenType.NUM: 3>]
+
+    >>> l = RegexLexer("let v <- 2 in v end")
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['LET', 'VAR', 'ASN', 'NUM', 'INX', 'VAR', 'END']
+
+    >>> l = RegexLexer("let x1 <- ~2 in x1 / 2 <= x1 end")
+    >>> [tk.text for tk in l.tokens()]
+    ['let', 'x1', '<-', '~', '2', 'in', 'x1', '/', '2', '<=', 'x1', 'end']
+
+    >>> l = RegexLexer("1 % 2")
+    >>> [tk.kind.name for tk in l.tokens()]
+    Traceback (most recent call last):
+    SystemExit: Lexical error: '%'
+    """
+
+    def __init__(self, source):
+        self.matches = MASTER_REGEX.finditer(source)
+
+    def tokens(self):
+        kinds = TokenType.__members__
+        for match in self.matches:
+            name = match.lastgroup
+            if name == "WSP" or name == "COM" or name == "NLN":
+                continue
+            if name == "ERR":
+                sys.exit(f"Lexical error: {match.group()!r}")
+            if name == "VAR":
+                yield Token(sys.intern(match.group()), kinds[name])
+            else:
+                yield Token(match.group(), kinds[name])
+
+    def getToken(self):
+        """
+        Return the next token, or EOF if the whole source has been scanned.
+
+        >>> l = RegexLexer("x")
+        >>> [l.getToken().kind.name, l.getToken().kind.name]
+        ['VAR', 'EOF']
+        """
+        match = next(self.matches, None)
+        if match is None:
+            return Token("", TokenType.EOF)
+        if match.lastgroup == "ERR":
+            sys.exit(f"Lexical error: {match.group()!r}")
+        if match.lastgroup == "VAR":
+            return Token(sys.intern(match.group()), TokenType.VAR)
+        return Token(match.group(), TokenType[match.lastgroup])
+
+
+class TokenBuffer:
+    """
+    This class stores a sequence of tokens as a "struct of arrays": one array
+    with the kind of each token, plus two arrays with the offsets where each
+    token starts and ends in the source text. Thus, it does not keep a Token
+    object per lexeme: a token costs two bytes for the kind plus sixteen bytes
+    for the offsets. White-spaces, comments and new lines are filtered out, as in
+    RegexLexer.tokens(). The parser can read the tokens with the methods kind(i)
+    and text(i), which do not create Token objects:
+
+    >>> buf = TokenBuffer("let x <- 10 in x end -- comment")
+    >>> len(buf)
+    7
+    >>> buf.kind(2), buf.text(3)
+    (<TokenType.ASN: 212>, '10')
+
+    Indexing the buffer creates a Token on demand, so code that expects a list
+    of tokens also works:
+
+    >>> [tk.kind.name for tk in buf]
+    ['LET', 'VAR', 'ASN', 'NUM', 'INX', 'VAR', 'END']
+    >>> buf[1].text
+    'x'
+    """
+
+    KINDS = {kind.value: kind for kind in TokenType}
+
+    def __init__(self, source):
+        self.source = source
+        self.kinds = array("h")
+        self.starts = array("q")
+        self.ends = array("q")
+        codes = {kind.name: kind.value for kind in TokenType}
+        for match in MASTER_REGEX.finditer(source):
+            name = match.lastgroup
+            if name == "WSP" or name == "COM" or name == "NLN":
+                continue
+            if name == "ERR":
+                sys.exit(f"Lexical error: {match.group()!r}")
+            self.kinds.append(codes[name])
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self.kinds):
+            raise IndexError("token index out of range")
+        return Token(self.text(i), self.kind(i))
+
+    def kind(self, i):
+        return TokenBuffer.KINDS[self.kinds[i]]
+
+    def text(self, i):
+        return self.source[self.starts[i]:self.ends[i]]
+
+
+BACKENDS = {"dfa": DfaLexer, "regex": RegexLexer}
+
+
+def benchmark(source, lexers=(Lexer, DfaLexer, RegexLexer), repeat=3):
+    """
+    Prints how many tokens per second each lexer class produces when scanning
+    the source string. Scanners that are not implemented yet are skipped. To
+    use it, do, for instance:
+
+    python3 -c "import Lexer; Lexer.benchmark(open('big.txt').read())"
+    """
+    for lexer in lexers:
+        best = None
+        try:
+            for _ in range(repeat):
+                begin = time.perf_counter()
+                num_tokens = sum(1 for _ in lexer(source).tokens())
+                elapsed = time.perf_counter() - begin
+                if best is None or elapsed < best:
+                    best = elapsed
+        except (AttributeError, NotImplementedError):
+            print(f"{lexer.__name__}: not implemented")
+            continue
+        rate = num_tokens / best if best > 0 else float("inf")
+        print(f"{lexer.__name__}: {num_tokens} tokens, {rate:.0f} tokens/s")
@@ -16,15 +16,266 @@ values. The following instructions are recognized:
     * beq rs1, rs2, lab: pc = lab if rs1 == rs2 else pc + 1
     * jal rd, lab: rd = pc + 1 and pc = lab
 
+Besides 'eval', which runs each instruction via its own 'eval' method, the
+Program has a method 'run', which first decodes the instructions into tuples of
+integers, and then runs them in a single loop, and a method 'jit', which
+translates each basic block into a Python function, and runs these functions.
+
 This file uses doctests all over. To test it, just run python 3 as follows:
 "python3 -m doctest Asm.py". The program uses syntax that is excluive of
 Python 3. It will not work with standard Python 2.
 """
 
 import sys
-from collections import deque
+from collections import deque, Counter
 from abc import ABC, abstractmethod
 
+# The opcodes of decoded instructions. EVAL stands for any instruction that
+# Program.run does not handle by itself.
+ADDI, ADD, BEQ, JAL, SUB, MUL, SLT, XORI, SLTI, XOR, DIV, EVAL = range(12)
+
+OPCODES = {"addi": ADDI, "add": ADD, "sub": SUB, "mul": MUL, "div": DIV,
+           "xor": XOR, "xori": XORI, "slt": SLT, "slti": SLTI}
+
+# Superinstructions run a sequence of instructions with a single dispatch.
+# The table below maps each sequence to its superinstruction. The sequences
+# that run most often in a program can be found with Program.profile.
+(ADDI_ADD, ADDI_SUB, ADDI_MUL, ADDI_SLT, SLT_XORI, SLT_XORI_BEQ) = \
+    range(EVAL + 1, EVAL + 7)
+
+FUSIONS = {(SLT, XORI, BEQ): SLT_XORI_BEQ, (SLT, XORI): SLT_XORI,
+           (ADDI, ADD): ADDI_ADD, (ADDI, SUB): ADDI_SUB, (ADDI, MUL): ADDI_MUL,
+           (ADDI, SLT): ADDI_SLT}
+
+
+def fuse(code):
+    """
+    Replaces the first instruction of each sequence found in FUSIONS by the
+    superinstruction that runs the whole sequence. A triple is tried when its
+    first two instructions form a pair in FUSIONS. The superinstruction keeps
+    the operands of the first instruction, and reads the others from the
+    instructions that follow it, which stay in place, so that jumps into the
+    middle of a sequence still work.
+
+    Example:
+        >>> code = [(SLT, 3, 2, 0), (XORI, 3, 3, 1), (BEQ, 3, 0, 0)]
+        >>> fuse(code) == [(SLT_XORI_BEQ, 3, 2, 0)] + code[1:]
+        True
+    """
+    ops = [inst[0] for inst in code]
+    fused = list(code)
+    for i, pair in enumerate(zip(ops, ops[1:])):
+        op = FUSIONS.get(pair)
+        if op is not None:
+            if i + 2 < len(ops):
+                op = FUSIONS.get(pair + (ops[i + 2],), op)
+            fused[i] = (op,) + code[i][1:]
+    return fused
+
+
+# The Python operators of the decoded instructions that 'translate' turns
+# into a single assignment.
+OPERATORS = {ADD: "+", SUB: "-", MUL: "*", XOR: "^", DIV: "//"}
+
+
+def leaders(code):
+    """
+    Returns the addresses where basic blocks begin: the targets of branches,
+    plus the addresses that follow branches and instructions that only
+    Inst.eval can run.
+
+    Example:
+        >>> code = [(ADDI, 2, 0, 3), (BEQ, 2, 0, 4), (ADDI, 2, 2, -1),
+        ...         (JAL, 1, 1, 0), (ADD, 3, 2, 2)]
+        >>> sorted(leaders(code))
+        [1, 2, 4]
+    """
+    starts = set()
+    for pc, (op, a, b, c) in enumerate(code):
+        if op == BEQ:
+            starts.add(c)
+        elif op == JAL:
+            starts.add(b)
+        if op in (BEQ, JAL) or op == EVAL:
+            starts.add(pc + 1)
+    return starts
+
+
+def translate(code, start, starts):
+    """
+    Generates the source of a function 'block(regs)' that runs the basic
+    block beginning at 'start', and returns the pc of the next block. The
+    block ends at beq or jal, or before the next address in 'starts'.
+    The registers are kept in local variables, and are written back into
+    'regs' at the end of the block. Returns the source, the registers that
+    the block reads before writing them, and a map from the number of each
+    line of the source to the address of the instruction that it runs.
+
+    Example:
+        >>> code = [(ADDI, 2, 0, 3), (BEQ, 2, 0, 4), (ADDI, 2, 2, -1),
+        ...         (ADD, 3, 3, 2), (JAL, 1, 1, 0), (ADD, 3, 2, 2)]
+        >>> source, inputs, addresses = translate(code, 2, {1, 2, 5})
+        >>> print(source)
+        def block(regs):
+            r2 = regs[2]
+            r3 = regs[3]
+            r2 = r2 + -1
+            r3 = r3 + r2
+            r1 = 5
+            regs[2] = r2
+            regs[3] = r3
+            regs[1] = r1
+            return 1
+        >>> inputs, addresses
+        ([2, 3], {4: 2, 5: 3, 6: 4})
+    """
+    inputs = []
+    outputs = []
+
+    def reg(index):
+        return "0" if index == 0 else f"r{index}"
+
+    def use(*indices):
+        for index in indices:
+            if index and index not in inputs and index not in outputs:
+                inputs.append(index)
+
+    def define(index):
+        if index not in outputs:
+            outputs.append(index)
+
+    lines = []
+    owners = []
+    target = None
+    pc = start
+    while target is None:
+        op, a, b, c = code[pc]
+        pc += 1
+        if op in OPERATORS:
+            use(b, c)
+            define(a)
+            lines.append(f"{reg(a)} = {reg(b)} {OPERATORS[op]} {reg(c)}")
+        elif op == ADDI:
+            use(b)
+            define(a)
+            lines.append(f"{reg(a)} = {reg(b)} + {c}")
+        elif op == XORI:
+            use(b)
+            define(a)
+            lines.append(f"{reg(a)} = {reg(b)} ^ {c}")
+        elif op == SLT:
+            use(b, c)
+            define(a)
+            lines.append(f"{reg(a)} = 1 if {reg(b)} < {reg(c)} else 0")
+        elif op == SLTI:
+            use(b)
+            define(a)
+            lines.append(f"{reg(a)} = 1 if {reg(b)} < {c} else 0")
+        elif op == BEQ:
+            use(a, b)
+            target = f"{c} if {reg(a)} == {reg(b)} else {pc}"
+        elif op == JAL:
+            define(a)
+            lines.append(f"{reg(a)} = {pc}")
+            target = f"{b}"
+        owners += [pc - 1] * (len(lines) - len(owners))
+        if target is None and (pc == len(code) or pc in starts or
+                               code[pc][0] == EVAL):
+            target = f"{pc}"
+    loads = [f"r{index} = regs[{index}]" for index in inputs]
+    stores = [f"regs[{index}] = r{index}" for index in outputs]
+    body = loads + lines + stores + [f"return {target}"]
+    source = "\n    ".join([f"def block(regs):"] + body)
+    addresses = dict(enumerate(owners, len(loads) + 2))
+    return source, inputs, addresses
+
+
+def build(source):
+    """
+    Compiles the source generated by 'translate' into a function.
+
+    Example:
+        >>> block = build(translate([(ADDI, 2, 0, 3)], 0, set())[0])
+        >>> regs = [0, 0, 0]
+        >>> block(regs)
+        1
+        >>> regs
+        [0, 0, 3]
+    """
+    namespace = {}
+    exec(compile(source, "<block>", "exec"), namespace)
+    return namespace["block"]
+
+
+def unwind(error, block, addresses, regs):
+    """
+    Writes into regs the registers that a compiled block computed before it
+    raised error, and returns the address of the instruction that failed.
+
+    Example:
+        >>> code = [(ADDI, 2, 2, 1), (DIV, 3, 2, 0), (ADDI, 2, 0, 0)]
+        >>> source, inputs, addresses = translate(code, 0, set())
+        >>> block = build(source)
+        >>> regs = [0, 0, 6, 0]
+        >>> try:
+        ...     block(regs)
+        ... except ZeroDivisionError as error:
+        ...     unwind(error, block, addresses, regs)
+        1
+        >>> regs
+        [0, 0, 7, 0]
+    """
+    trace = error.__traceback__
+    while trace.tb_frame.f_code is not block.__code__:
+        trace = trace.tb_next
+    for name, value in trace.tb_frame.f_locals.items():
+        if name[0] == "r" and name[1:].isdigit():
+            regs[int(name[1:])] = value
+    return addresses[trace.tb_lineno]
+
+
+class Unset:
+    """
+    The value of registers that were not defined yet, during Program.run. Any
+    operation on it raises TypeError, and then run evaluates the instruction
+    with Inst.eval, which reports the error.
+    """
+
+    def __eq__(self, other):
+        raise TypeError("undefined register")
+
+
+UNSET = Unset()
+
+
+class Decoder(dict):
+    """
+    The Decoder maps each register name to its index in the register file
+    used by Program.run. New names get new indices as they are looked up.
+    Index 0 holds x0, and writes on x0 go to index 1, which is never read.
+
+    Example:
+        >>> d = Decoder({"a": 1})
+        >>> d["b"], d.dst("a"), d.dst("x0"), d["x0"], d.size
+        (3, 2, 1, 0, 4)
+    """
+
+    def __init__(self, env):
+        super().__init__(x0=0)
+        for name in env:
+            self[name]
+
+    def __missing__(self, name):
+        index = self[name] = len(self) + 1
+        return index
+
+    @property
+    def size(self):
+        return len(self) + 1
+
+    def dst(self, name):
+        return 1 if name == "x0" else self[name]
+
 
 class Program:
     """
@@ -38,6 +289,8 @@ class Program:
         self.__env = env
         self.__insts = insts
         self.pc = 0
+        self.__decoded = None
+        self.__fused = None
         self.__env["x0"] = 0
 
     def get_inst(self):
@@ -53,6 +306,8 @@ class Program:
 
     def add_inst(self, inst):
         self.__insts.append(inst)
+        self.__decoded = None
+        self.__fused = None
 
     def get_pc(self):
         return self.pc
@@ -119,6 +374,283 @@ class Program:
             inst.eval(self)
             inst = self.get_inst()
 
+    def decode(self):
+        """
+        Translates the instructions into tuples (opcode, a, b, c) of integers,
+        where registers are replaced by their index in the register file. The
+        result is kept until the instructions change, so that each call of
+        run does not decode them again.
+
+        Example:
+            >>> insts = [Addi("t0", "x0", 2), Beq("t0", "b0", 0)]
+            >>> code, decoder = Program({"b0": 1}, insts).decode()
+            >>> code
+            [(0, 3, 0, 2), (2, 3, 2, 0)]
+
+            >>> p = Program({"b0": 1}, insts)
+            >>> p.decode() is p.decode()
+            True
+            >>> p.add_inst(Addi("t1", "t0", 1))
+            >>> len(p.decode()[0])
+            3
+        """
+        if self.__decoded is None:
+            decoder = Decoder(self.__env)
+            code = [inst.decode(decoder) for inst in self.__insts]
+            self.__decoded = code, decoder
+        return self.__decoded
+
+    def get_regs(self, decoder):
+        regs = [UNSET] * decoder.size
+        for name, index in decoder.items():
+            regs[index] = self.__env.get(name, UNSET)
+        return regs
+
+    def set_regs(self, decoder, regs):
+        for name, index in decoder.items():
+            if regs[index] is not UNSET:
+                self.__env[name] = regs[index]
+
+    def run(self, fused=True):
+        """
+        Evaluates the program like eval, but runs the decoded instructions in
+        a single loop, over a list of registers. Instructions that the loop
+        does not handle, or that fail, are evaluated with Inst.eval, so that
+        the results and errors are the same as in eval. If fused is True,
+        sequences of instructions are replaced by superinstructions.
+
+        Example:
+            >>> insts = [Add("t0", "b0", "b1"), Sub("x1", "t0", "b2")]
+            >>> p = Program({"b0":2, "b1":3, "b2": 4}, insts)
+            >>> p.run()
+            >>> p.print_env()
+            b0: 2
+            b1: 3
+            b2: 4
+            t0: 5
+            x0: 0
+            x1: 1
+
+            >>> insts = [Addi("a", "x0", 5), Beq("a", "x0", 5),
+            ...          Add("s", "s", "a"), Addi("a", "a", -1), Jal("x0", 1)]
+            >>> p = Program({"s": 0}, insts)
+            >>> p.run()
+            >>> p.get_val("s"), p.get_pc()
+            (15, 5)
+
+            If an instruction fails, run stops with its error, and keeps the
+            registers and the pc that it reached, like eval:
+
+            >>> insts = [Addi("a", "b0", 1), Div("a", "a", "x0"),
+            ...          Addi("a", "x0", 0)]
+            >>> p = Program({"b0": 6}, insts)
+            >>> p.run()
+            Traceback (most recent call last):
+            ...
+            ZeroDivisionError: integer division or modulo by zero
+            >>> p.get_val("a"), p.get_pc()
+            (7, 2)
+        """
+        code, decoder = self.decode()
+        if fused:
+            if self.__fused is None:
+                self.__fused = fuse(code)
+            code = self.__fused
+        regs = self.get_regs(decoder)
+        pc = self.pc
+        size = len(code)
+        try:
+            while 0 <= pc < size:
+                op, a, b, c = code[pc]
+                pc += 1
+                try:
+                    # The opcodes are split in two groups, so that each one is
+                    # found after a few comparisons.
+                    if op < SUB:
+                        if op == ADDI:
+                            regs[a] = regs[b] + c
+                        elif op == ADD:
+                            regs[a] = regs[b] + regs[c]
+                        elif op == BEQ:
+                            if regs[a] == regs[b]:
+                                pc = c
+                        else:
+                            regs[a] = pc
+                            pc = b
+                    elif op > EVAL:
+                        if op == ADDI_ADD:
+                            regs[a] = regs[b] + c
+                            _, a, b, c = code[pc]
+                            pc += 1
+                            regs[a] = regs[b] + regs[c]
+                        elif op == ADDI_SUB:
+                            regs[a] = regs[b] + c
+                            _, a, b, c = code[pc]
+                            pc += 1
+                            regs[a] = regs[b] - regs[c]
+                        elif op == ADDI_MUL:
+                            regs[a] = regs[b] + c
+                            _, a, b, c = code[pc]
+                            pc += 1
+                            regs[a] = regs[b] * regs[c]
+                        elif op == ADDI_SLT:
+                            regs[a] = regs[b] + c
+                            _, a, b, c = code[pc]
+                            pc += 1
+                            regs[a] = 1 if regs[b] < regs[c] else 0
+                        elif op == SLT_XORI:
+                            regs[a] = 1 if regs[b] < regs[c] else 0
+                            _, a, b, c = code[pc]
+                            pc += 1
+                            regs[a] = regs[b] ^ c
+                        else:
+                            regs[a] = 1 if regs[b] < regs[c] else 0
+                            _, a, b, c = code[pc]
+                            pc += 1
+                            regs[a] = regs[b] ^ c
+                            _, a, b, c = code[pc]
+                            pc += 1
+                            if regs[a] == regs[b]:
+                                pc = c
+                    elif op == SUB:
+                        regs[a] = regs[b] - regs[c]
+                    elif op == MUL:
+                        regs[a] = regs[b] * regs[c]
+                    elif op == SLT:
+                        regs[a] = 1 if regs[b] < regs[c] else 0
+                    elif op == XORI:
+                        regs[a] = regs[b] ^ c
+                    elif op == SLTI:
+                        regs[a] = 1 if regs[b] < c else 0
+                    elif op == XOR:
+                        regs[a] = regs[b] ^ regs[c]
+                    elif op == DIV:
+                        regs[a] = regs[b] // regs[c]
+                    else:
+                        pc = self.eval_inst(pc - 1, decoder, regs)
+                except TypeError:
+                    pc = self.eval_inst(pc - 1, decoder, regs)
+        finally:
+            self.pc = pc
+            self.set_regs(decoder, regs)
+
+    def eval_inst(self, pc, decoder, regs):
+        """
+        Evaluates the instruction at pc with Inst.eval, on behalf of run, and
+        returns the next pc.
+        """
+        self.set_regs(decoder, regs)
+        self.pc = pc
+        self.get_inst().eval(self)
+        regs[:] = self.get_regs(decoder)
+        return self.pc
+
+    def jit(self):
+        """
+        Evaluates the program like run, but translates each basic block into
+        a Python function, where registers are local variables. Blocks are
+        compiled when they run for the first time, and are cached by their
+        first address. Then, the program goes from block to block. A block
+        that reads undefined registers is not compiled: its first instruction
+        is evaluated with Inst.eval, which reports the error. Once defined, a
+        register stays defined, so compiled blocks never meet these errors.
+        Compiling a block costs much more than running it once, so jit only
+        pays off for code that runs many times, such as loops.
+
+        Example:
+            >>> insts = [Addi("a", "x0", 5), Beq("a", "x0", 5),
+            ...          Add("s", "s", "a"), Addi("a", "a", -1), Jal("x0", 1)]
+            >>> p = Program({"s": 0}, insts)
+            >>> p.jit()
+            >>> p.get_val("s"), p.get_pc()
+            (15, 5)
+
+            If an instruction fails, jit writes back the registers that the
+            block computed before it (see 'unwind'), and evaluates it with
+            Inst.eval, which reports the error. Thus, jit keeps the registers
+            and the pc that it reached, like run:
+
+            >>> insts = [Addi("a", "b0", 1), Div("a", "a", "x0"),
+            ...          Addi("a", "x0", 0)]
+            >>> p = Program({"b0": 6}, insts)
+            >>> p.jit()
+            Traceback (most recent call last):
+            ...
+            ZeroDivisionError: integer division or modulo by zero
+            >>> p.get_val("a"), p.get_pc()
+            (7, 2)
+        """
+        code, decoder = self.decode()
+        starts = leaders(code)
+        regs = self.get_regs(decoder)
+        blocks = {}
+        pc = self.pc
+        size = len(code)
+        try:
+            while 0 <= pc < size:
+                entry = blocks.get(pc)
+                if entry is None and code[pc][0] != EVAL:
+                    source, inputs, addresses = translate(code, pc, starts)
+                    if all(regs[index] is not UNSET for index in inputs):
+                        entry = blocks[pc] = build(source), addresses
+                if entry is None:
+                    pc = self.eval_inst(pc, decoder, regs)
+                else:
+                    block, addresses = entry
+                    failed = None
+                    try:
+                        pc = block(regs)
+                    except Exception as error:
+                        failed = unwind(error, block, addresses, regs)
+                    if failed is not None:
+                        # Inst.eval reports the error, which leaves pc after
+                        # the failing instruction, as in run.
+                        pc = failed + 1
+                        pc = self.eval_inst(failed, decoder, regs)
+        finally:
+            self.pc = pc
+            self.set_regs(decoder, regs)
+
+    def profile(self, length=3):
+        """
+        Evaluates the program like eval, and counts how many times each
+        sequence of two up to 'length' instructions ran. Only instructions at
+        consecutive addresses form a sequence, because only these can be
+        fused into superinstructions. Returns a Counter that maps sequences of
+        opcodes to their counts.
+
+        Example:
+            >>> insts = [Addi("a", "x0", 3), Slt("t", "x0", "a"),
+            ...          Xori("t", "t", 1), Beq("t", "x0", 5),
+            ...          Jal("x0", 9), Add("s", "s", "a"),
+            ...          Addi("one", "x0", 1), Sub("a", "a", "one"),
+            ...          Jal("x0", 1)]
+            >>> p = Program({"s": 0}, insts)
+            >>> for seq, count in p.profile().most_common(3):
+            ...     print(seq, count)
+            ('slt', 'xori') 4
+            ('xori', 'beq') 4
+            ('slt', 'xori', 'beq') 4
+            >>> p.get_val("s")
+            6
+        """
+        counts = Counter()
+        names = []
+        last = None
+        inst = self.get_inst()
+        while inst:
+            if last is None or self.pc - 1 != last + 1:
+                names = []
+            last = self.pc - 1
+            names.append(inst.get_opcode())
+            if len(names) > length:
+                del names[0]
+            for size in range(2, len(names) + 1):
+                counts[tuple(names[-size:])] += 1
+            inst.eval(self)
+            inst = self.get_inst()
+        return counts
+
 
 def max(a, b):
     """
@@ -190,6 +722,13 @@ class Inst(ABC):
     def eval(self, prog):
         raise NotImplementedError
 
+    def decode(self, decoder):
+        """
+        Returns the tuple that represents this instruction in Program.run. By
+        default, the instruction is evaluated with its own 'eval'.
+        """
+        return (EVAL, 0, 0, 0)
+
 
 class BranchOp(Inst):
     """
@@ -228,6 +767,11 @@ class Beq(BranchOp):
         if prog.get_val(self.rs1) == prog.get_val(self.rs2):
             prog.set_pc(self.lab)
 
+    def decode(self, decoder):
+        if self.lab is None:
+            return super().decode(decoder)
+        return (BEQ, decoder[self.rs1], decoder[self.rs2], self.lab)
+
 
 class Jal(BranchOp):
     """
@@ -256,6 +800,12 @@ class Jal(BranchOp):
             self.rd = prog.get_pc + 1
         prog.set_pc(self.lab)
 
+    def decode(self, decoder):
+        # Only plain jumps are decoded. Links are left to 'eval'.
+        if self.lab is None or self.rd != "x0":
+            return super().decode(decoder)
+        return (JAL, 1, self.lab, 0)
+
 
 class BinOp(Inst):
     """
@@ -274,6 +824,10 @@ class BinOp(Inst):
         op = self.get_opcode()
         return f"{self.rd} = {op} {self.rs1} {self.rs2}"
 
+    def decode(self, decoder):
+        return (OPCODES[self.get_opcode()], decoder.dst(self.rd),
+                decoder[self.rs1], decoder[self.rs2])
+
 
 class BinOpImm(Inst):
     """
@@ -292,6 +846,10 @@ class BinOpImm(Inst):
         op = self.get_opcode()
         return f"{self.rd} = {op} {self.rs1} {self.imm}"
 
+    def decode(self, decoder):
+        return (OPCODES[self.get_opcode()], decoder.dst(self.rd),
+                decoder[self.rs1], self.imm)
+
 
 class Add(BinOp):
     """
@@ -526,4 +1084,56 @@ class Slti(BinOpImm):
         prog.set_val(self.rd, 1 if rs1 < self.imm else 0)
 
     def get_opcode(self):
-        return "slti"
\ No newline at end of file
+        return "slti"
+
+
+def benchmark(n=100000, repeat=3):
+    """
+    Prints how long eval and run take to evaluate three programs: a sequence
+    of n arithmetic instructions, a loop that adds up 1..n, and the same loop
+    with a condition computed like the GenVisitor would do. Each method runs
+    'repeat' times on the same program. Only the first call of run decodes
+    and fuses it, so the time of that call is shown next to the best time.
+    The times of run without superinstructions, of jit, and of decoding
+    alone, are also shown. To use it, do, for instance:
+
+    python3 -c "import Asm; Asm.benchmark()"
+    """
+    import time
+
+    line = []
+    for _ in range(n // 4):
+        line += [Addi("a0", "a0", 1), Mul("a1", "a0", "a0"),
+                 Sub("a2", "a1", "a0"), Slt("a3", "a0", "a2")]
+    loop = [Addi("a0", "x0", n), Addi("a1", "x0", 0), Beq("a0", "x0", 6),
+            Add("a1", "a1", "a0"), Addi("a0", "a0", -1), Jal("x0", 2)]
+    cond = [Addi("a0", "x0", n), Addi("a1", "x0", 0), Slt("a2", "x0", "a0"),
+            Xori("a2", "a2", 1), Beq("a2", "x0", 6), Jal("x0", 10),
+            Add("a1", "a1", "a0"), Addi("a3", "x0", 1), Sub("a0", "a0", "a3"),
+            Jal("x0", 2)]
+    methods = (("eval", Program.eval), ("run", Program.run),
+               ("unfused", lambda p: p.run(False)), ("jit", Program.jit),
+               ("decode", Program.decode))
+    programs = (("line", line, "a2"), ("loop", loop, "a1"),
+                ("cond", cond, "a1"))
+    for name, insts, result in programs:
+        for method, function in methods:
+            first = best = None
+            p = Program({"a0": 0}, insts)
+            for _ in range(repeat):
+                if method == "decode":
+                    p = Program({"a0": 0}, insts)
+                p.set_pc(0)
+                p.set_val("a0", 0)
+                begin = time.perf_counter()
+                function(p)
+                elapsed = time.perf_counter() - begin
+                if first is None:
+                    first = elapsed
+                if best is None or elapsed < best:
+                    best = elapsed
+            if method == "decode":
+                print(f"{name} {method}: {best:.3f}s")
+            else:
+                print(f"{name} {method}: {p.get_val(result)}, {best:.3f}s "
+                      f"(first call: {first:.3f}s)")
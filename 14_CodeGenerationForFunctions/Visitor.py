@@ -1,4 +1,5 @@
 import sys
+import copy
 from abc import ABC, abstractmethod
 from Expression import *
 import Asm as AsmModule
@@ -622,6 +623,543 @@ class GenVisitor(Visitor):
         raise NotImplementedError
 
 
+class FoldVisitor(Visitor):
+    """
+    The FoldVisitor simplifies an expression before code generation. It
+    returns a new expression where:
+
+    1. Operations whose operands are constants of the right type are replaced
+       by their values, e.g., 2 * 3 becomes 6.
+    2. Identities are simplified: x * 1, 1 * x, x + 0, 0 + x and x - 0 become
+       x, and not (not x) becomes x.
+    3. Conditionals whose condition is a constant are replaced by one of
+       their branches.
+
+    The simplified expression has the same behavior as the original one. In
+    particular, divisions by zero are not folded, so that they still fail
+    when the program runs, and the identities only apply if x is known to be
+    a number (or a boolean, for 'not').
+
+    Examples:
+    >>> e = Add(Mul(Num(2), Num(3)), Mul(Neg(Var('x')), Sub(Num(4), Num(3))))
+    >>> f = e.accept(FoldVisitor(), None)
+    >>> type(f).__name__, f.left.num, type(f.right).__name__
+    ('Add', 6, 'Neg')
+
+    >>> e = Mul(Add(Var('x'), Num(1)), Add(Num(0), Num(1)))
+    >>> f = e.accept(FoldVisitor(), None)
+    >>> type(f).__name__, type(f.left).__name__, f.right.num
+    ('Add', 'Var', 1)
+
+    >>> e = IfThenElse(Lth(Num(2), Num(3)), Var('a'), Div(Num(1), Num(0)))
+    >>> e.accept(FoldVisitor(), None).identifier
+    'a'
+
+    >>> e = Div(Num(1), Sub(Num(2), Num(2)))
+    >>> f = e.accept(FoldVisitor(), None)
+    >>> type(f).__name__, f.left.num, f.right.num
+    ('Div', 1, 0)
+
+    >>> e = Not(Not(Leq(Var('x'), Num(2))))
+    >>> type(e.accept(FoldVisitor(), None)).__name__
+    'Leq'
+    """
+
+    def numeric(self, exp):
+        """
+        Tells if exp certainly evaluates to a number (if it evaluates at all).
+        """
+        return isinstance(exp, (Num, Add, Sub, Mul, Div, Neg))
+
+    def boolean(self, exp):
+        """
+        Tells if exp certainly evaluates to a boolean (if it evaluates at all).
+        """
+        return isinstance(exp, (Bln, Eql, Leq, Lth, And, Or, Not))
+
+    def visit_var(self, exp, arg):
+        return exp
+
+    def visit_bln(self, exp, arg):
+        return exp
+
+    def visit_num(self, exp, arg):
+        return exp
+
+    def fold(self, exp, arg, op):
+        """
+        Folds the binary expression exp, if both operands are numbers.
+        Otherwise, returns a copy of exp with simplified operands.
+        """
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Num and type(right) is Num:
+            val = op(left.num, right.num)
+            return Num(val) if type(val) is int else Bln(val)
+        return type(exp)(left, right)
+
+    def visit_eql(self, exp, arg):
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Num and type(right) is Num:
+            return Bln(left.num == right.num)
+        if type(left) is Bln and type(right) is Bln:
+            return Bln(left.bln == right.bln)
+        return Eql(left, right)
+
+    def logic(self, exp, arg, short):
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Bln:
+            if left.bln == short:
+                return left
+            if self.boolean(right):
+                return right
+        return type(exp)(left, right)
+
+    def visit_and(self, exp, arg):
+        return self.logic(exp, arg, False)
+
+    def visit_or(self, exp, arg):
+        return self.logic(exp, arg, True)
+
+    def visit_add(self, exp, arg):
+        f = self.fold(exp, arg, int.__add__)
+        if type(f) is Add:
+            if type(f.right) is Num and f.right.num == 0 and \
+                    self.numeric(f.left):
+                return f.left
+            if type(f.left) is Num and f.left.num == 0 and \
+                    self.numeric(f.right):
+                return f.right
+        return f
+
+    def visit_sub(self, exp, arg):
+        f = self.fold(exp, arg, int.__sub__)
+        if type(f) is Sub and type(f.right) is Num and f.right.num == 0 and \
+                self.numeric(f.left):
+            return f.left
+        return f
+
+    def visit_mul(self, exp, arg):
+        f = self.fold(exp, arg, int.__mul__)
+        if type(f) is Mul:
+            if type(f.right) is Num and f.right.num == 1 and \
+                    self.numeric(f.left):
+                return f.left
+            if type(f.left) is Num and f.left.num == 1 and \
+                    self.numeric(f.right):
+                return f.right
+        return f
+
+    def visit_div(self, exp, arg):
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Num and type(right) is Num and right.num != 0:
+            return Num(left.num // right.num)
+        return Div(left, right)
+
+    def visit_leq(self, exp, arg):
+        return self.fold(exp, arg, int.__le__)
+
+    def visit_lth(self, exp, arg):
+        return self.fold(exp, arg, int.__lt__)
+
+    def visit_neg(self, exp, arg):
+        sub = exp.exp.accept(self, arg)
+        if type(sub) is Num:
+            return Num(-sub.num)
+        return Neg(sub)
+
+    def visit_not(self, exp, arg):
+        sub = exp.exp.accept(self, arg)
+        if type(sub) is Bln:
+            return Bln(not sub.bln)
+        if type(sub) is Not and self.boolean(sub.exp):
+            return sub.exp
+        return Not(sub)
+
+    def visit_let(self, exp, arg):
+        return Let(exp.identifier, exp.exp_def.accept(self, arg),
+                   exp.exp_body.accept(self, arg))
+
+    def visit_ifThenElse(self, exp, arg):
+        cond = exp.cond.accept(self, arg)
+        if type(cond) is Bln:
+            branch = exp.e0 if cond.bln else exp.e1
+            return branch.accept(self, arg)
+        return IfThenElse(cond, exp.e0.accept(self, arg),
+                          exp.e1.accept(self, arg))
+
+    def visit_fn(self, exp, arg):
+        return Fn(exp.formal, exp.body.accept(self, arg))
+
+    def visit_app(self, exp, arg):
+        return App(exp.function.accept(self, arg), exp.actual.accept(self, arg))
+
+
+class SubstVisitor(Visitor):
+    """
+    The SubstVisitor replaces the only free use of the variable 'name' by the
+    expression 'exp'. It assumes that this use is not inside a function body.
+    The inherited attribute tells if the use would be captured, i.e., if we
+    are inside a let that binds a free variable of 'exp'. In this case, the
+    substitution is not valid, and the field 'captured' becomes True.
+    """
+
+    def __init__(self, name, exp, free):
+        self.name = name
+        self.exp = exp
+        self.free = free
+        self.captured = False
+
+    def visit_var(self, exp, blocked):
+        if exp.identifier == self.name:
+            self.captured = self.captured or blocked
+            return self.exp
+        return exp
+
+    def visit_bln(self, exp, blocked):
+        return exp
+
+    def visit_num(self, exp, blocked):
+        return exp
+
+    def binary(self, exp, blocked):
+        return type(exp)(exp.left.accept(self, blocked),
+                         exp.right.accept(self, blocked))
+
+    def unary(self, exp, blocked):
+        return type(exp)(exp.exp.accept(self, blocked))
+
+    visit_eql = visit_and = visit_or = binary
+    visit_add = visit_sub = visit_mul = visit_div = binary
+    visit_leq = visit_lth = binary
+    visit_neg = visit_not = unary
+
+    def visit_let(self, exp, blocked):
+        exp_def = exp.exp_def.accept(self, blocked)
+        if exp.identifier == self.name:
+            return Let(exp.identifier, exp_def, exp.exp_body)
+        blocked = blocked or exp.identifier in self.free
+        return Let(exp.identifier, exp_def, exp.exp_body.accept(self, blocked))
+
+    def visit_ifThenElse(self, exp, blocked):
+        return IfThenElse(exp.cond.accept(self, blocked),
+                          exp.e0.accept(self, blocked),
+                          exp.e1.accept(self, blocked))
+
+    def visit_fn(self, exp, blocked):
+        return exp
+
+    def visit_app(self, exp, blocked):
+        return App(exp.function.accept(self, blocked),
+                   exp.actual.accept(self, blocked))
+
+
+class InlineLetVisitor(Visitor):
+    """
+    The InlineLetVisitor removes let bindings that are never used, and
+    replaces bindings that are used only once by their definitions. It only
+    does so if the definition is pure, i.e., if evaluating it never fails and
+    always terminates. Thus, 'let x = 1 div 0 in 2' keeps its binding. Uses
+    inside function bodies count as many uses, because the body may run many
+    times.
+
+    Each visit returns a triple (exp, uses, kind): the simplified expression,
+    a dictionary that counts the uses of each free variable of it, like the
+    set of free variables of the UseDefVisitor in 5_Visitors, and the kind of
+    the expression: None if it is not pure, or else "num", "bool", "fn" or
+    "any", telling what we know about its value. The inherited attribute maps
+    the names of the variables in scope to their kinds. We do not call the
+    UseDefVisitor itself: it is an exercise that 5_Visitors leaves for the
+    students to implement, and a set of free variables does not tell a
+    binding used once from a binding used many times.
+
+    Examples:
+    >>> e = Let('x', Num(2), Let('y', Num(3), Add(Var('x'), Var('x'))))
+    >>> f = InlineLetVisitor().inline(e)
+    >>> type(f).__name__, f.identifier, type(f.exp_body).__name__
+    ('Let', 'x', 'Add')
+
+    >>> e = Let('x', Add(Num(2), Var('z')), Mul(Var('x'), Num(3)))
+    >>> f = InlineLetVisitor().inline(e, ['z'])
+    >>> type(f).__name__
+    'Let'
+
+    >>> e = Let('x', Sub(Num(2), Num(3)), Mul(Var('x'), Num(3)))
+    >>> f = InlineLetVisitor().inline(e)
+    >>> type(f).__name__, type(f.left).__name__
+    ('Mul', 'Sub')
+
+    >>> e = Let('x', Div(Num(2), Num(0)), Num(3))
+    >>> type(InlineLetVisitor().inline(e)).__name__
+    'Let'
+
+    >>> e = Let('x', Num(2), Fn('y', Add(Var('x'), Var('y'))))
+    >>> type(InlineLetVisitor().inline(e)).__name__
+    'Let'
+    """
+
+    def inline(self, exp, names=()):
+        """
+        Simplifies exp, assuming that the given names are bound to values.
+        """
+        return exp.accept(self, {name: "any" for name in names})[0]
+
+    def merge(self, *uses):
+        total = {}
+        for use in uses:
+            for name, count in use.items():
+                total[name] = total.get(name, 0) + count
+        return total
+
+    def function(self, uses, *names):
+        """
+        Returns the uses of the free variables of a function whose body has
+        the given uses, and whose parameter is one of the given names. Uses
+        count twice, because the body may run many times.
+        """
+        return {name: 2 * count for name, count in uses.items()
+                if name not in names}
+
+    def visit_var(self, exp, kinds):
+        return exp, {exp.identifier: 1}, kinds.get(exp.identifier)
+
+    def visit_bln(self, exp, kinds):
+        return exp, {}, "bool"
+
+    def visit_num(self, exp, kinds):
+        return exp, {}, "num"
+
+    def binary(self, exp, kinds, operand, result):
+        """
+        Simplifies a binary expression. It is pure if both operands are pure
+        and of the given kind.
+        """
+        left, left_uses, left_kind = exp.left.accept(self, kinds)
+        right, right_uses, right_kind = exp.right.accept(self, kinds)
+        kind = None
+        if left_kind == operand and right_kind == operand:
+            kind = result
+        return type(exp)(left, right), self.merge(left_uses, right_uses), kind
+
+    def visit_eql(self, exp, kinds):
+        left, left_uses, left_kind = exp.left.accept(self, kinds)
+        right, right_uses, right_kind = exp.right.accept(self, kinds)
+        kind = None
+        if left_kind == right_kind and left_kind in ("num", "bool"):
+            kind = "bool"
+        return Eql(left, right), self.merge(left_uses, right_uses), kind
+
+    def visit_and(self, exp, kinds):
+        return self.binary(exp, kinds, "bool", "bool")
+
+    def visit_or(self, exp, kinds):
+        return self.binary(exp, kinds, "bool", "bool")
+
+    def visit_add(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "num")
+
+    def visit_sub(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "num")
+
+    def visit_mul(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "num")
+
+    def division(self, exp, kinds):
+        new, uses, kind = self.binary(exp, kinds, "num", "num")
+        if type(new.right) is not Num or new.right.num == 0:
+            kind = None
+        return new, uses, kind
+
+    visit_div = division
+
+    def visit_leq(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "bool")
+
+    def visit_lth(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "bool")
+
+    def visit_neg(self, exp, kinds):
+        sub, uses, kind = exp.exp.accept(self, kinds)
+        return Neg(sub), uses, "num" if kind == "num" else None
+
+    def visit_not(self, exp, kinds):
+        sub, uses, kind = exp.exp.accept(self, kinds)
+        return Not(sub), uses, "bool" if kind == "bool" else None
+
+    def visit_let(self, exp, kinds):
+        name = exp.identifier
+        exp_def, def_uses, def_kind = exp.exp_def.accept(self, kinds)
+        body_kinds = {**kinds, name: def_kind or "any"}
+        body, body_uses, body_kind = exp.exp_body.accept(self, body_kinds)
+        count = body_uses.pop(name, 0)
+        if def_kind is not None and count == 0:
+            return body, body_uses, body_kind
+        if def_kind is not None and count == 1:
+            subst = SubstVisitor(name, exp_def, def_uses)
+            new_body = body.accept(subst, False)
+            if not subst.captured:
+                return new_body, self.merge(def_uses, body_uses), body_kind
+        kind = body_kind if def_kind is not None else None
+        return Let(name, exp_def, body), self.merge(def_uses, body_uses), kind
+
+    def visit_ifThenElse(self, exp, kinds):
+        cond, cond_uses, cond_kind = exp.cond.accept(self, kinds)
+        e0, e0_uses, e0_kind = exp.e0.accept(self, kinds)
+        e1, e1_uses, e1_kind = exp.e1.accept(self, kinds)
+        kind = None
+        if cond_kind == "bool" and e0_kind and e1_kind:
+            kind = e0_kind if e0_kind == e1_kind else "any"
+        uses = self.merge(cond_uses, e0_uses, e1_uses)
+        return IfThenElse(cond, e0, e1), uses, kind
+
+    def visit_fn(self, exp, kinds):
+        body, uses, _ = exp.body.accept(self, {**kinds, exp.formal: "any"})
+        return Fn(exp.formal, body), self.function(uses, exp.formal), "fn"
+
+    def visit_app(self, exp, kinds):
+        function, function_uses, _ = exp.function.accept(self, kinds)
+        actual, actual_uses, _ = exp.actual.accept(self, kinds)
+        uses = self.merge(function_uses, actual_uses)
+        return App(function, actual), uses, None
+
+
+class Binding:
+    """
+    This class represents the binding of a variable in the BetaVisitor. If
+    the variable is bound to a function literal, 'fn' is that literal, and
+    'captured' maps its free variables to their bindings, and 'size' is the
+    size of the let that replaces a call to it.
+    """
+
+    __slots__ = ("fn", "captured", "size")
+
+    def __init__(self, fn=None, captured=None, size=0):
+        self.fn = fn
+        self.captured = captured
+        self.size = size
+
+
+class BetaVisitor(Visitor):
+    """
+    The BetaVisitor replaces applications of anonymous functions by let
+    bindings. An application such as '(fn x => e0) e1' becomes
+    'let x = e1 in e0', which evaluates to the same value, but does not
+    create a closure, nor call it. If a variable f is bound to a function
+    literal by a let, then calls 'f e1' are replaced in the same way, with a
+    copy of the body of f, as long as the body has at most 'max_size' nodes,
+    and its free variables still have the same bindings at the call site. If
+    all the uses of f are replaced, the let that binds f is removed.
+
+    Each visit returns a triple (exp, free, size): the new expression, the
+    set of its free variables, and its number of nodes. The inherited
+    attribute maps the variables in scope to their Binding.
+
+    Examples:
+    >>> e = App(Fn('x', Add(Var('x'), Num(1))), Num(3))
+    >>> f = BetaVisitor().reduce(e)
+    >>> type(f).__name__, f.identifier, f.exp_def.num
+    ('Let', 'x', 3)
+
+    >>> e = Let('f', Fn('x', Mul(Var('x'), Var('y'))),\
+            Add(App(Var('f'), Num(2)), App(Var('f'), Num(3))))
+    >>> f = BetaVisitor().reduce(e)
+    >>> type(f).__name__, type(f.left).__name__, type(f.right).__name__
+    ('Add', 'Let', 'Let')
+
+    >>> e = Let('f', Fn('x', Mul(Var('x'), Var('y'))),\
+            Let('y', Num(2), App(Var('f'), Num(3))))
+    >>> type(BetaVisitor().reduce(e)).__name__
+    'Let'
+
+    >>> e = Let('f', Fn('x', Mul(Var('x'), Var('y'))),\
+            Add(App(Var('f'), Num(2)), App(Var('f'), Num(3))))
+    >>> f = BetaVisitor(max_size=2).reduce(e)
+    >>> type(f).__name__, type(f.exp_body.left).__name__
+    ('Let', 'App')
+    """
+
+    def __init__(self, max_size=20):
+        self.max_size = max_size
+
+    def reduce(self, exp):
+        return exp.accept(self, {})[0]
+
+    def visit_var(self, exp, scope):
+        return exp, {exp.identifier}, 1
+
+    def visit_bln(self, exp, scope):
+        return exp, set(), 1
+
+    def visit_num(self, exp, scope):
+        return exp, set(), 1
+
+    def binary(self, exp, scope):
+        left, left_free, left_size = exp.left.accept(self, scope)
+        right, right_free, right_size = exp.right.accept(self, scope)
+        return (type(exp)(left, right), left_free | right_free,
+                left_size + right_size + 1)
+
+    def unary(self, exp, scope):
+        sub, free, size = exp.exp.accept(self, scope)
+        return type(exp)(sub), free, size + 1
+
+    visit_eql = visit_and = visit_or = binary
+    visit_add = visit_sub = visit_mul = visit_div = binary
+    visit_leq = visit_lth = binary
+    visit_neg = visit_not = unary
+
+    def visit_let(self, exp, scope):
+        name = exp.identifier
+        exp_def, def_free, def_size = exp.exp_def.accept(self, scope)
+        binding = Binding()
+        if type(exp_def) is Fn and def_size - 1 <= self.max_size:
+            captured = {v: scope.get(v) for v in def_free}
+            binding = Binding(exp_def, captured, def_size)
+        body, body_free, body_size = \
+            exp.exp_body.accept(self, {**scope, name: binding})
+        if binding.fn is not None and name not in body_free:
+            # Every call was replaced, and creating a closure has no effect.
+            return body, body_free, body_size
+        free = def_free | (body_free - {name})
+        return Let(name, exp_def, body), free, def_size + body_size + 1
+
+    def visit_ifThenElse(self, exp, scope):
+        cond, cond_free, cond_size = exp.cond.accept(self, scope)
+        e0, e0_free, e0_size = exp.e0.accept(self, scope)
+        e1, e1_free, e1_size = exp.e1.accept(self, scope)
+        return (IfThenElse(cond, e0, e1), cond_free | e0_free | e1_free,
+                cond_size + e0_size + e1_size + 1)
+
+    def visit_fn(self, exp, scope):
+        body, free, size = \
+            exp.body.accept(self, {**scope, exp.formal: Binding()})
+        return Fn(exp.formal, body), free - {exp.formal}, size + 1
+
+    def visit_app(self, exp, scope):
+        actual, actual_free, actual_size = exp.actual.accept(self, scope)
+        function = exp.function
+        if type(function) is Var and function.identifier in scope:
+            known = scope[function.identifier]
+            if known.fn is not None and all(
+                    scope.get(v) is binding
+                    for v, binding in known.captured.items()):
+                # The copy keeps the tree free of shared nodes.
+                body = copy.deepcopy(known.fn.body)
+                free = actual_free | set(known.captured)
+                return (Let(known.fn.formal, actual, body), free,
+                        known.size + actual_size)
+        function, function_free, function_size = function.accept(self, scope)
+        if type(function) is Fn:
+            size = function_size + actual_size
+            free = actual_free | function_free
+            return Let(function.formal, actual, function.body), free, size
+        return (App(function, actual), function_free | actual_free,
+                function_size + actual_size + 1)
+
+
 class RenameVisitor(ABC):
     """
     This visitor traverses the AST of a program, renaming variables to ensure
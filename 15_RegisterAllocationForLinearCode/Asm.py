@@ -19,15 +19,130 @@ values. The following instructions are recognized:
     * sw reg, offset(rs1): mem[offset+rs1] = reg
     * lw reg, offset(rs1): reg = mem[offset+rs1]
 
+Besides 'eval', which runs each instruction via its own 'eval' method, the
+Program has a method 'run', which first decodes the instructions into tuples of
+integers, and then runs them in a single loop.
+
+The memory of a Program is a list of Python integers by default. For large
+memories, it can also be a compact array of 64-bit words (see 'allocate').
+
 This file uses doctests all over. To test it, just run python 3 as follows:
 "python3 -m doctest Asm.py". The program uses syntax that is excluive of
 Python 3. It will not work with standard Python 2.
 """
 
 import sys
+import mmap
+from array import array
 from collections import deque
 from abc import ABC, abstractmethod
 
+# The opcodes of decoded instructions. EVAL stands for any instruction that
+# Program.run does not handle by itself.
+(ADDI, ADD, BEQ, JAL, LW, SW, JALR, SUB, MUL, SLT, XORI, SLTI, XOR, DIV,
+ EVAL) = range(15)
+
+OPCODES = {"addi": ADDI, "add": ADD, "sub": SUB, "mul": MUL, "div": DIV,
+           "xor": XOR, "xori": XORI, "slt": SLT, "slti": SLTI}
+
+
+def allocate(size, backend="list"):
+    """
+    Returns a memory with 'size' words, all zero. The backends are:
+
+    * "list": a list of Python integers, which can hold integers of any size.
+    * "array": an array('q') of 64-bit signed words, which takes 8 bytes per
+      word.
+    * "mmap": 64-bit signed words in an anonymous mmap. Like "array", it takes
+      8 bytes per word, but the pages are only allocated once they are used.
+
+    The last two backends cannot store values that do not fit in 64 bits,
+    unless the Program is created with wrap=True, which makes it keep only
+    the lower 64 bits of these values (see 'to_word').
+
+    Example:
+        >>> for backend in ("list", "array", "mmap"):
+        ...     print(backend, list(allocate(3, backend)))
+        list [0, 0, 0]
+        array [0, 0, 0]
+        mmap [0, 0, 0]
+        >>> allocate(10 ** 7, "array").itemsize
+        8
+    """
+    if backend == "list":
+        return size * [0]
+    elif backend == "array":
+        return array("q", [0]) * size
+    elif backend == "mmap":
+        # An mmap cannot be empty, so we always map at least one word.
+        buffer = mmap.mmap(-1, 8 * size or 8)
+        return memoryview(buffer).cast("q")[:size]
+    else:
+        sys.exit(f"Invalid memory backend: {backend}")
+
+
+def to_word(value):
+    """
+    Keeps the lower 64 bits of value, read as a signed integer, like a 64-bit
+    RISC-V machine does when a value overflows.
+
+    Example:
+        >>> to_word(2 ** 63), to_word(-2 ** 63 - 1), to_word(-5)
+        (-9223372036854775808, 9223372036854775807, -5)
+    """
+    return (value + 2 ** 63) % 2 ** 64 - 2 ** 63
+
+
+class Unset:
+    """
+    The value of registers that were not defined yet, during Program.run. Any
+    operation on it raises TypeError, and then run evaluates the instruction
+    with Inst.eval, which reports the error.
+    """
+
+    def __eq__(self, other):
+        raise TypeError("undefined register")
+
+
+UNSET = Unset()
+
+
+class Decoder(dict):
+    """
+    The Decoder maps each register name to its index in the register file
+    used by Program.run. New names get new indices as they are looked up.
+    Index 0 holds x0, and index 1 receives the return address of jumps that
+    do not save it. Only the given registers, except x0, can be written.
+
+    Example:
+        >>> d = Decoder({"a": 1}, {"a", "x0"})
+        >>> d["b"], d.dst("a"), d.dst("b"), d.dst("x0"), d["x0"], d.size
+        (3, 2, None, None, 0, 4)
+    """
+
+    def __init__(self, env, registers):
+        super().__init__(x0=0)
+        self.registers = registers
+        for name in env:
+            self[name]
+
+    def __missing__(self, name):
+        index = self[name] = len(self) + 1
+        return index
+
+    @property
+    def size(self):
+        return len(self) + 1
+
+    def dst(self, name):
+        """
+        Returns the index where writes on name go, or None, if name cannot be
+        written.
+        """
+        if name in self.registers and name != "x0":
+            return self[name]
+        return None
+
 
 class Program:
     """
@@ -35,13 +150,24 @@ class Program:
     names with values, plus a program counter, which marks the next instruction
     that must be executed. The environment contains a special variable x0,
     which always contains the value zero.
+
+    Example:
+        >>> Program(4, {}, [], backend="list", wrap=True)
+        Traceback (most recent call last):
+        ...
+        SystemExit: Invalid memory backend for wrap: list
     """
 
-    def __init__(self, memory_size, env, insts):
-        self.__mem = memory_size * [0]
+    def __init__(self, memory_size, env, insts, backend="list", wrap=False):
+        # Only memories of 64-bit words can wrap values around.
+        if wrap and backend == "list":
+            sys.exit(f"Invalid memory backend for wrap: {backend}")
+        self.__mem = allocate(memory_size, backend)
+        self.__wrap = wrap
         self.__env = env
         self.__insts = insts
         self.pc = 0
+        self.__decoded = None
         self.registers = {"x0", "a0", "a1", "a2", "a3", "ra", "sp"}
         for reg in self.registers:
             self.__env[reg] = 0
@@ -65,6 +191,7 @@ class Program:
 
     def add_inst(self, inst):
         self.__insts.append(inst)
+        self.__decoded = None
 
     def get_pc(self):
         return self.pc
@@ -79,6 +206,17 @@ class Program:
             sys.exit(f"Undefined register: {name}")
 
     def set_mem(self, addr, value):
+        """
+        Stores value at addr. If the program wraps values around, only the
+        lower 64 bits of value are stored:
+
+        >>> p = Program(2, {}, [], backend="array", wrap=True)
+        >>> p.set_mem(0, 2 ** 64 + 3)
+        >>> p.get_mem(0)
+        3
+        """
+        if self.__wrap:
+            value = to_word(value)
         self.__mem[addr] = value
 
     def get_mem(self, addr):
@@ -86,6 +224,52 @@ class Program:
             sys.exit(f"Invalid memory address: {addr}")
         return self.__mem[addr]
 
+    def load_mem(self, addr, words):
+        """
+        Stores the sequence of integers 'words' into the memory, starting at
+        addr. If words is an array('q'), the copy does not use Python loops.
+
+        Example:
+            >>> p = Program(4, {}, [], backend="mmap")
+            >>> p.load_mem(1, array("q", [5, 6]))
+            >>> p.dump_mem()
+            array('q', [0, 5, 6, 0])
+        """
+        mem = self.__mem
+        if self.__wrap and not isinstance(words, array):
+            words = [to_word(word) for word in words]
+        if not isinstance(mem, list) and not isinstance(words, array):
+            words = array("q", words)
+        size = len(words)
+        if addr < 0 or addr + size > len(mem):
+            sys.exit(f"Invalid memory address: {addr}")
+        mem[addr:addr + size] = words
+
+    def dump_mem(self, addr=0, size=None):
+        """
+        Returns a copy of the 'size' words of memory that start at addr, or
+        of all the words from addr on, if size is None. The copy is a list
+        with the "list" backend, and an array('q') otherwise; it is made
+        without Python loops.
+
+        Example:
+            >>> p = Program(4, {}, [])
+            >>> p.load_mem(0, [1, 2 ** 70, 3])
+            >>> p.dump_mem(1, 2)
+            [1180591620717411303424, 3]
+        """
+        mem = self.__mem
+        if size is None:
+            size = len(mem) - addr
+        if addr < 0 or addr + size > len(mem):
+            sys.exit(f"Invalid memory address: {addr}")
+        words = mem[addr:addr + size]
+        if isinstance(words, memoryview):
+            copy = array("q")
+            copy.frombytes(words.cast("B"))
+            return copy
+        return words
+
     def get_val(self, name):
         """
         The register x0 always contains the value zero:
@@ -115,6 +299,7 @@ class Program:
 
     def set_insts(self, insts):
         self.__insts = insts
+        self.__decoded = None
 
     def eval(self):
         """
@@ -149,6 +334,160 @@ class Program:
             inst.eval(self)
             inst = self.get_inst()
 
+    def decode(self):
+        """
+        Translates the instructions into tuples (opcode, a, b, c) of integers,
+        where registers are replaced by their index in the register file. The
+        result is kept until the instructions change, so that each call of
+        run does not decode them again.
+
+        Example:
+            >>> insts = [Addi("a0", "x0", 2), Beq("a0", "b0", 0)]
+            >>> code, decoder = Program(0, {"b0": 1}, insts).decode()
+            >>> [op for op, a, b, c in code]
+            [0, 2]
+            >>> code[0][1] == code[1][1] == decoder["a0"]
+            True
+
+            >>> p = Program(0, {"b0": 1}, insts)
+            >>> p.decode() is p.decode()
+            True
+            >>> p.add_inst(Addi("t1", "t0", 1))
+            >>> len(p.decode()[0])
+            3
+        """
+        if self.__decoded is None:
+            decoder = Decoder(self.__env, self.registers)
+            code = []
+            for inst in self.__insts:
+                decoded = inst.decode(decoder)
+                # Writes on registers that do not exist, and jumps to unknown
+                # labels, are left to Inst.eval.
+                if None in decoded:
+                    decoded = (EVAL, 0, 0, 0)
+                code.append(decoded)
+            self.__decoded = code, decoder
+        return self.__decoded
+
+    def get_regs(self, decoder):
+        regs = [UNSET] * decoder.size
+        for name, index in decoder.items():
+            regs[index] = self.__env.get(name, UNSET)
+        return regs
+
+    def set_regs(self, decoder, regs):
+        for name, index in decoder.items():
+            if regs[index] is not UNSET:
+                self.__env[name] = regs[index]
+
+    def run(self):
+        """
+        Evaluates the program like eval, but runs the decoded instructions in
+        a single loop, over a list of registers. Instructions that the loop
+        does not handle, or that fail, are evaluated with Inst.eval, so that
+        the results and errors are the same as in eval.
+
+        Example:
+            >>> insts = [Add("a0", "b0", "b1"), Sub("a1", "a0", "b2")]
+            >>> p = Program(0, {"b0":2, "b1":3, "b2": 4}, insts)
+            >>> p.run()
+            >>> p.get_val("a0"), p.get_val("a1")
+            (5, 1)
+
+            >>> insts = [Addi("a0", "x0", 5), Beq("a0", "x0", 5),
+            ...          Add("a1", "a1", "a0"), Addi("a0", "a0", -1),
+            ...          Jal("x0", 1)]
+            >>> p = Program(0, {"a1": 0}, insts)
+            >>> p.run()
+            >>> p.get_val("a1"), p.get_pc()
+            (15, 5)
+
+            If an instruction fails, run stops with its error, and keeps the
+            registers and the pc that it reached, like eval:
+
+            >>> insts = [Addi("a1", "x0", 6), Addi("a0", "a1", 1),
+            ...          Div("a0", "a0", "x0"), Addi("a0", "x0", 0)]
+            >>> p = Program(0, {}, insts)
+            >>> p.run()
+            Traceback (most recent call last):
+            ...
+            ZeroDivisionError: integer division or modulo by zero
+            >>> p.get_val("a0"), p.get_pc()
+            (7, 3)
+        """
+        code, decoder = self.decode()
+        regs = self.get_regs(decoder)
+        mem = self.__mem
+        pc = self.pc
+        size = len(code)
+        try:
+            while 0 <= pc < size:
+                op, a, b, c = code[pc]
+                pc += 1
+                try:
+                    # The opcodes are split in two groups, so that each one is
+                    # found after a few comparisons.
+                    if op < SUB:
+                        if op == ADDI:
+                            regs[a] = regs[b] + c
+                        elif op == ADD:
+                            regs[a] = regs[b] + regs[c]
+                        elif op == BEQ:
+                            if regs[a] == regs[b]:
+                                pc = c
+                        elif op == JAL:
+                            regs[a] = pc
+                            pc = b
+                        elif op == LW:
+                            addr = regs[b] + c
+                            if 0 <= addr < len(mem):
+                                regs[a] = mem[addr]
+                            else:
+                                pc = self.eval_inst(pc - 1, decoder, regs)
+                        elif op == SW:
+                            val = regs[a]
+                            if val is UNSET:
+                                raise TypeError("undefined register")
+                            mem[regs[b] + c] = val
+                        else:
+                            target = regs[b] + c
+                            regs[a] = pc
+                            pc = target
+                    elif op == SUB:
+                        regs[a] = regs[b] - regs[c]
+                    elif op == MUL:
+                        regs[a] = regs[b] * regs[c]
+                    elif op == SLT:
+                        regs[a] = 1 if regs[b] < regs[c] else 0
+                    elif op == XORI:
+                        regs[a] = regs[b] ^ c
+                    elif op == SLTI:
+                        regs[a] = 1 if regs[b] < c else 0
+                    elif op == XOR:
+                        regs[a] = regs[b] ^ regs[c]
+                    elif op == DIV:
+                        regs[a] = regs[b] // regs[c]
+                    else:
+                        pc = self.eval_inst(pc - 1, decoder, regs)
+                except (TypeError, OverflowError, ValueError):
+                    # OverflowError and ValueError come from values that do not
+                    # fit in the words of typed memories.
+                    pc = self.eval_inst(pc - 1, decoder, regs)
+        finally:
+            self.pc = pc
+            self.set_regs(decoder, regs)
+
+    def eval_inst(self, pc, decoder, regs):
+        """
+        Evaluates the instruction at pc with Inst.eval, on behalf of run, and
+        returns the next pc.
+        """
+        self.set_regs(decoder, regs)
+        self.pc = pc
+        self.get_inst().eval(self)
+        regs[:] = self.get_regs(decoder)
+        return self.pc
+
 
 def max(a, b):
     """
@@ -220,6 +559,13 @@ class Inst(ABC):
     def eval(self, prog):
         raise NotImplementedError
 
+    def decode(self, decoder):
+        """
+        Returns the tuple that represents this instruction in Program.run. By
+        default, the instruction is evaluated with its own 'eval'.
+        """
+        return (EVAL, 0, 0, 0)
+
 
 class BranchOp(Inst):
     """
@@ -258,6 +604,9 @@ class Beq(BranchOp):
         if prog.get_val(self.rs1) == prog.get_val(self.rs2):
             prog.set_pc(self.lab)
 
+    def decode(self, decoder):
+        return (BEQ, decoder[self.rs1], decoder[self.rs2], self.lab)
+
 
 class Jal(BranchOp):
     """
@@ -304,6 +653,10 @@ class Jal(BranchOp):
             prog.set_val(self.rd, prog.get_pc())
         prog.set_pc(self.lab)
 
+    def decode(self, decoder):
+        rd = 1 if self.rd == "x0" else decoder.dst(self.rd)
+        return (JAL, rd, self.lab, 0)
+
 
 class Jalr(BranchOp):
     """
@@ -349,6 +702,10 @@ class Jalr(BranchOp):
             prog.set_val(self.rd, prog.get_pc())
         prog.set_pc(rs_val + self.offset)
 
+    def decode(self, decoder):
+        rd = 1 if self.rd == "x0" else decoder.dst(self.rd)
+        return (JALR, rd, decoder[self.rs], self.offset)
+
 
 class MemOp(Inst):
     """
@@ -393,6 +750,9 @@ class Sw(MemOp):
         addr = prog.get_val(self.rs1) + self.offset
         prog.set_mem(addr, val)
 
+    def decode(self, decoder):
+        return (SW, decoder[self.reg], decoder[self.rs1], self.offset)
+
     def get_opcode(self):
         return "sw"
 
@@ -429,6 +789,9 @@ class Lw(MemOp):
         val = prog.get_mem(addr)
         prog.set_val(self.reg, val)
 
+    def decode(self, decoder):
+        return (LW, decoder.dst(self.reg), decoder[self.rs1], self.offset)
+
     def get_opcode(self):
         return "lw"
 
@@ -449,6 +812,10 @@ class BinOp(Inst):
         op = self.get_opcode()
         return f"{self.rd} = {op} {self.rs1} {self.rs2}"
 
+    def decode(self, decoder):
+        return (OPCODES[self.get_opcode()], decoder.dst(self.rd),
+                decoder[self.rs1], decoder[self.rs2])
+
 
 class BinOpImm(Inst):
     """
@@ -467,6 +834,10 @@ class BinOpImm(Inst):
         op = self.get_opcode()
         return f"{self.rd} = {op} {self.rs1} {self.imm}"
 
+    def decode(self, decoder):
+        return (OPCODES[self.get_opcode()], decoder.dst(self.rd),
+                decoder[self.rs1], self.imm)
+
 
 class Add(BinOp):
     """
@@ -701,4 +1072,45 @@ class Slti(BinOpImm):
         prog.set_val(self.rd, 1 if rs1 < self.imm else 0)
 
     def get_opcode(self):
-        return "slti"
\ No newline at end of file
+        return "slti"
+
+
+def benchmark(n=100000, repeat=3):
+    """
+    Prints how long eval and run take to evaluate two programs: a sequence of
+    n arithmetic instructions, and a loop that adds up 1..n. Each method runs
+    'repeat' times on the same program. Only the first call of run decodes
+    it, so the time of that call is shown next to the best time. Decoding
+    alone is also shown. To use it, do, for instance:
+
+    python3 -c "import Asm; Asm.benchmark()"
+    """
+    import time
+
+    line = []
+    for _ in range(n // 4):
+        line += [Addi("a0", "a0", 1), Mul("a1", "a0", "a0"),
+                 Sub("a2", "a1", "a0"), Slt("a3", "a0", "a2")]
+    loop = [Addi("a0", "x0", n), Addi("a1", "x0", 0), Beq("a0", "x0", 6),
+            Add("a1", "a1", "a0"), Addi("a0", "a0", -1), Jal("x0", 2)]
+    for name, insts, result in (("line", line, "a2"), ("loop", loop, "a1")):
+        for method in ("eval", "run", "decode"):
+            first = best = None
+            p = Program(0, {"a0": 0}, insts)
+            for _ in range(repeat):
+                if method == "decode":
+                    p = Program(0, {"a0": 0}, insts)
+                p.set_pc(0)
+                p.set_val("a0", 0)
+                begin = time.perf_counter()
+                getattr(p, method)()
+                elapsed = time.perf_counter() - begin
+                if first is None:
+                    first = elapsed
+                if best is None or elapsed < best:
+                    best = elapsed
+            if method == "decode":
+                print(f"{name} {method}: {best:.3f}s")
+            else:
+                print(f"{name} {method}: {p.get_val(result)}, {best:.3f}s "
+                      f"(first call: {first:.3f}s)")
@@ -1,5 +1,10 @@
+import os
+import re
 import sys
 import enum
+import mmap
+import time
+from array import array
 
 
 class Token:
@@ -9,6 +14,11 @@ class Token:
     uniquely. See the TokenType to know the possible identifiers (if you want).
     You don't need to change this class.
     """
+
+    # Tokens only have these two fields. Declaring them as slots saves the
+    # dictionary that Python would otherwise allocate for each token.
+    __slots__ = ("text", "kind")
+
     def __init__(self, tokenText, tokenKind):
         # The token's actual text. Used for identifiers, strings, and numbers.
         self.text = tokenText
@@ -45,7 +55,19 @@ class TokenType(enum.Enum):
 
 
 class Lexer:
-    
+
+    def __new__(cls, source):
+        """
+        Creates the lexer selected by the LEXER environment variable, which can
+        be 'dfa' or 'regex'. If LEXER is not set, then this is just an instance
+        of Lexer. That lets us compare backends without changing the driver:
+
+        LEXER=regex python3 driver.py < big_input.txt
+        """
+        if cls is Lexer:
+            cls = BACKENDS.get(os.environ.get("LEXER"), Lexer)
+        return super().__new__(cls)
+
     def __init__(self, source):
         """
         The constructor of the lexer. It receives the string that shall be
@@ -115,4 +137,476 @@ class Lexer:
         TODO: Implement this method!
         """
         token = None
-        return token
\ No newline at end of file
+        return token
+
+
+class DFA:
+    """
+    This class represents a deterministic finite automaton whose transitions
+    are stored in a table. Each row of the table is a state, and each column
+    is an ASCII character (plus one extra column for every other character).
+    The table is built once, when this module is imported, so that scanning a
+    character costs only two list lookups.
+    """
+
+    NCHARS = 129  # The 128 ASCII characters, plus 'anything else'.
+    DEAD = -1  # The target of missing transitions.
+    WORD = "word"  # Final states that must be classified as keywords.
+
+    def __init__(self):
+        self.table = []
+        self.accept = []
+
+    def new_state(self, kind=None):
+        """
+        Creates a new state. If kind is not None, then the state is final,
+        and recognizes tokens of that kind.
+        """
+        self.table.append(DFA.NCHARS * [DFA.DEAD])
+        self.accept.append(kind)
+        return len(self.table) - 1
+
+    def add_edge(self, src, chars, dst):
+        for c in chars:
+            self.table[src][ord(c)] = dst
+
+    def add_default_edge(self, src, dst, but=""):
+        """
+        Adds a transition from src to dst on every character, except those in
+        the string 'but'.
+        """
+        row = self.table[src]
+        for c in range(DFA.NCHARS):
+            row[c] = dst
+        for c in but:
+            row[ord(c)] = DFA.DEAD
+
+
+SYMBOLS = {
+    "=": TokenType.EQL,
+    "+": TokenType.ADD,
+    "*": TokenType.MUL,
+    "/": TokenType.DIV,
+    "~": TokenType.NEG,
+    ")": TokenType.RPR,
+}
+
+KEYWORDS = {
+    "true": TokenType.TRU,
+    "false": TokenType.FLS,
+    "not": TokenType.NOT,
+}
+
+
+def build_dfa():
+    """
+    Builds the automaton that recognizes every token in TokenType. Words
+    (sequences of letters) are recognized by a single state, and are then
+    classified by the KEYWORDS table.
+
+    >>> dfa = build_dfa()
+    >>> len(dfa.table) == len(dfa.accept)
+    True
+    """
+    digits = "0123456789"
+    hexdigits = digits + "abcdefABCDEF"
+    letters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    dfa = DFA()
+    start = dfa.new_state()
+    # Blanks and new lines:
+    wsp = dfa.new_state(TokenType.WSP)
+    dfa.add_edge(start, " \t\r", wsp)
+    dfa.add_edge(wsp, " \t\r", wsp)
+    dfa.add_edge(start, "\n", dfa.new_state(TokenType.NLN))
+    # Single-character operators:
+    for text, kind in SYMBOLS.items():
+        dfa.add_edge(start, text, dfa.new_state(kind))
+    # Less than (<) and less than or equal (<=):
+    lth = dfa.new_state(TokenType.LTH)
+    dfa.add_edge(start, "<", lth)
+    dfa.add_edge(lth, "=", dfa.new_state(TokenType.LEQ))
+    # Subtraction (-) and line comments (-- ...):
+    sub = dfa.new_state(TokenType.SUB)
+    line_com = dfa.new_state(TokenType.COM)
+    dfa.add_edge(start, "-", sub)
+    dfa.add_edge(sub, "-", line_com)
+    dfa.add_default_edge(line_com, line_com, but="\n")
+    # Left parenthesis and block comments (* ... *):
+    lpr = dfa.new_state(TokenType.LPR)
+    block_com = dfa.new_state()
+    block_star = dfa.new_state()
+    dfa.add_edge(start, "(", lpr)
+    dfa.add_edge(lpr, "*", block_com)
+    dfa.add_default_edge(block_com, block_com)
+    dfa.add_edge(block_com, "*", block_star)
+    dfa.add_default_edge(block_star, block_com)
+    dfa.add_edge(block_star, "*", block_star)
+    dfa.add_edge(block_star, ")", dfa.new_state(TokenType.COM))
+    # Numbers. A zero can start an octal, binary or hexadecimal number:
+    zero = dfa.new_state(TokenType.INT)
+    dec = dfa.new_state(TokenType.INT)
+    dfa.add_edge(start, "0", zero)
+    dfa.add_edge(start, "123456789", dec)
+    dfa.add_edge(dec, digits, dec)
+    octal = dfa.new_state(TokenType.OCT)
+    dfa.add_edge(zero, digits, octal)
+    dfa.add_edge(octal, digits, octal)
+    binary = dfa.new_state(TokenType.BIN)
+    dfa.add_edge(zero, "bB", binary)
+    dfa.add_edge(binary, "01", binary)
+    hexa = dfa.new_state(TokenType.HEX)
+    dfa.add_edge(zero, "xX", hexa)
+    dfa.add_edge(hexa, hexdigits, hexa)
+    # Words: true, false and not.
+    word = dfa.new_state(DFA.WORD)
+    dfa.add_edge(start, letters, word)
+    dfa.add_edge(word, letters, word)
+    return dfa
+
+
+SCANNER = build_dfa()
+
+
+class DfaLexer(Lexer):
+    """
+    This lexer implements getToken with the table-driven automaton in SCANNER.
+    Instead of testing each character against a chain of conditionals, the
+    scanner follows the transition table until it reaches a dead state, and
+    then returns the longest prefix that ended in a final state. The stream of
+    tokens is the same produced by the Lexer class:
+
+    >>> l = DfaLexer("0X1 + 0xA + 0B01010101 + 012 - 10")
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['HEX', 'ADD', 'HEX', 'ADD', 'BIN', 'ADD', 'OCT', 'SUB', 'INT']
+
+    >>> l = DfaLexer("0b1 + 0xA + 0B01010101 + 0xA0B1C2D3E4F5")
+    >>> [tk.text for tk in l.tokens()]
+    ['0b1', '+', '0xA', '+', '0B01010101', '+', '0xA0B1C2D3E4F5']
+
+    >>> l = DfaLexer('1 * 2 - 3 -- alkdjf adkjf dlkjf \\n0x23 + 012')
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['INT', 'MUL', 'INT', 'SUB', 'INT', 'COM', 'HEX', 'ADD', 'OCT']
+
+    >>> l = DfaLexer('(* a (comment) **) not (true <= false)')
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['COM', 'NOT', 'LPR', 'TRU', 'LEQ', 'FLS', 'RPR']
+
+    >>> l = DfaLexer('~1 < 2 = 2 / 3')
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['NEG', 'INT', 'LTH', 'INT', 'EQL', 'INT', 'DIV', 'INT']
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.length = len(source)
+        self.pos = 0
+
+    def getToken(self):
+        """
+        Return the next token, or EOF if the whole source has been scanned.
+
+        >>> l = DfaLexer("1")
+        >>> [l.getToken().kind.name, l.getToken().kind.name]
+        ['INT', 'EOF']
+
+        >>> l = DfaLexer("1 % 2")
+        >>> [tk.kind.name for tk in l.tokens()]
+        Traceback (most recent call last):
+        SystemExit: Lexical error: '%'
+
+        >>> l = DfaLexer("1 + abc")
+        >>> [tk.kind.name for tk in l.tokens()]
+        Traceback (most recent call last):
+        SystemExit: Lexical error: 'abc'
+        """
+        source = self.source
+        start = self.pos
+        if start >= self.length:
+            return Token("", TokenType.EOF)
+        table = SCANNER.table
+        accept = SCANNER.accept
+        state = 0
+        kind = None
+        end = start
+        i = start
+        while i < self.length:
+            c = ord(source[i])
+            state = table[state][c if c < 128 else 128]
+            if state == DFA.DEAD:
+                break
+            i += 1
+            if accept[state] is not None:
+                kind = accept[state]
+                end = i
+        if kind is None:
+            sys.exit(f"Lexical error: {source[start]!r}")
+        text = source[start:end]
+        if kind == DFA.WORD:
+            if text not in KEYWORDS:
+                sys.exit(f"Lexical error: {text!r}")
+            kind = KEYWORDS[text]
+        self.pos = end
+        return Token(text, kind)
+
+
+def build_regex():
+    """
+    Builds one regular expression that recognizes every token in TokenType.
+    Each kind of token is a named group, so that match.lastgroup is the name
+    of the kind of the token. Longer tokens come first, e.g., "<=" before "<".
+
+    >>> [m.lastgroup for m in build_regex().finditer("0x1F <= (* c *) 012")]
+    ['HEX', 'WSP', 'LEQ', 'WSP', 'COM', 'WSP', 'OCT']
+    """
+    patterns = [
+        ("WSP", r"[ \t\r]+"),
+        ("NLN", r"\n"),
+        ("COM", r"--[^\n]*|\(\*[\s\S]*?\*\)"),
+        ("LEQ", r"<="),
+        ("HEX", r"0[xX][0-9a-fA-F]*"),
+        ("BIN", r"0[bB][01]*"),
+        ("OCT", r"0[0-9]+"),
+        ("INT", r"0|[1-9][0-9]*"),
+    ]
+    for text, kind in KEYWORDS.items():
+        patterns.append((kind.name, re.escape(text) + r"(?![a-zA-Z])"))
+    for text, kind in SYMBOLS.items():
+        patterns.append((kind.name, re.escape(text)))
+    patterns += [("LPR", r"\("), ("LTH", r"<"), ("SUB", r"-")]
+    # Words that are not keywords are reported whole, as in DfaLexer:
+    patterns.append(("ERR", r"[a-zA-Z]+|."))
+    return re.compile("|".join(f"(?P<{name}>{rx})" for name, rx in patterns))
+
+
+MASTER_REGEX = build_regex()
+
+
+class RegexLexer(Lexer):
+    """
+    This lexer scans the source with a single compiled regular expression,
+    MASTER_REGEX. Thus, the loop over characters runs inside the re module,
+    and Python code only runs once per token. The stream of tokens is the
+    same produced by the Lexer class:
+
+    >>> l = RegexLexer("0X1 + 0xA + 0B01010101 + 012 - 10")
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['HEX', 'ADD', 'HEX', 'ADD', 'BIN', 'ADD', 'OCT', 'SUB', 'INT']
+
+    >>> l = RegexLexer('1 * 2 - 3 -- alkdjf adkjf dlkjf \\n0x23 + 012')
+    >>> [tk.text for tk in l.tokens()]
+    ['1', '*', '2', '-', '3', '-- alkdjf adkjf dlkjf ', '0x23', '+', '012']
+
+    >>> l = RegexLexer('(* a (comment) **) not (true <= false)')
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['COM', 'NOT', 'LPR', 'TRU', 'LEQ', 'FLS', 'RPR']
+
+    >>> l = RegexLexer('~1 < 2 = 2 / 3')
+    >>> [tk.kind.name for tk in l.tokens()]
+    ['NEG', 'INT', 'LTH', 'INT', 'EQL', 'INT', 'DIV', 'INT']
+
+    >>> l = RegexLexer("1 % 2")
+    >>> [tk.kind.name for tk in l.tokens()]
+    Traceback (most recent call last):
+    SystemExit: Lexical error: '%'
+
+    >>> l = RegexLexer("1 + abc")
+    >>> [tk.kind.name for tk in l.tokens()]
+    Traceback (most recent call last):
+    SystemExit: Lexical error: 'abc'
+    """
+
+    def __init__(self, source):
+        self.matches = MASTER_REGEX.finditer(source)
+
+    def tokens(self):
+        kinds = TokenType.__members__
+        for match in self.matches:
+            name = match.lastgroup
+            if name == "WSP" or name == "NLN":
+                continue
+            if name == "ERR":
+                sys.exit(f"Lexical error: {match.group()!r}")
+            yield Token(match.group(), kinds[name])
+
+    def getToken(self):
+        """
+        Return the next token, or EOF if the whole source has been scanned.
+
+        >>> l = RegexLexer("1")
+        >>> [l.getToken().kind.name, l.getToken().kind.name]
+        ['INT', 'EOF']
+        """
+        match = next(self.matches, None)
+        if match is None:
+            return Token("", TokenType.EOF)
+        if match.lastgroup == "ERR":
+            sys.exit(f"Lexical error: {match.group()!r}")
+        return Token(match.group(), TokenType[match.lastgroup])
+
+
+# The regular expression of RegexLexer, but over bytes instead of strings:
+MASTER_BYTES_REGEX = re.compile(MASTER_REGEX.pattern.encode("ascii"))
+
+# The text of the tokens that are always spelled in the same way:
+SPELLINGS = {kind.name: text for text, kind in SYMBOLS.items()}
+SPELLINGS.update({kind.name: text for text, kind in KEYWORDS.items()})
+SPELLINGS.update(LPR="(", LTH="<", LEQ="<=", SUB="-")
+
+
+class BufferLexer(RegexLexer):
+    """
+    This lexer scans bytes, instead of a string. The source can be any object
+    that supports the buffer protocol, such as bytes, a memoryview or an mmap.
+    The regular expression runs directly over the buffer, so the input is not
+    copied into a Python string. Only the text of numbers and comments is
+    decoded. The other tokens always have the same text, given by SPELLINGS:
+
+    >>> l = BufferLexer(memoryview(b"0x1F <= not 7 -- c"))
+    >>> [(tk.kind.name, tk.text) for tk in l.tokens()]
+    [('HEX', '0x1F'), ('LEQ', '<='), ('NOT', 'not'), ('INT', '7'), ('COM', '-- c')]
+
+    >>> l = BufferLexer(b"1 % 2")
+    >>> [tk.kind.name for tk in l.tokens()]
+    Traceback (most recent call last):
+    SystemExit: Lexical error: '%'
+    """
+
+    def __init__(self, source):
+        self.matches = MASTER_BYTES_REGEX.finditer(source)
+
+    @classmethod
+    def from_file(cls, file):
+        """
+        Creates a lexer that scans a file mapped into memory. The file is
+        either a path or a file descriptor, e.g., sys.stdin.fileno() when the
+        standard input is redirected from a file.
+
+        >>> import tempfile
+        >>> with tempfile.NamedTemporaryFile(suffix=".txt") as f:
+        ...     _ = f.write(b"0b11 * (2 - 1)")
+        ...     f.flush()
+        ...     [tk.text for tk in BufferLexer.from_file(f.name).tokens()]
+        ['0b11', '*', '(', '2', '-', '1', ')']
+        """
+        with open(file, "rb", closefd=not isinstance(file, int)) as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(b"")
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def tokens(self):
+        kinds = TokenType.__members__
+        for match in self.matches:
+            name = match.lastgroup
+            if name == "WSP" or name == "NLN":
+                continue
+            if name == "ERR":
+                text = match.group().decode(errors="replace")
+                sys.exit(f"Lexical error: {text!r}")
+            if name in SPELLINGS:
+                yield Token(SPELLINGS[name], kinds[name])
+            else:
+                yield Token(match.group().decode(), kinds[name])
+
+    def getToken(self):
+        """
+        Return the next token, or EOF if the whole source has been scanned.
+
+        >>> l = BufferLexer(b"1")
+        >>> [l.getToken().kind.name, l.getToken().kind.name]
+        ['INT', 'EOF']
+        """
+        match = next(self.matches, None)
+        if match is None:
+            return Token("", TokenType.EOF)
+        if match.lastgroup == "ERR":
+            text = match.group().decode(errors="replace")
+            sys.exit(f"Lexical error: {text!r}")
+        name = match.lastgroup
+        if name in SPELLINGS:
+            return Token(SPELLINGS[name], TokenType[name])
+        return Token(match.group().decode(), TokenType[name])
+
+
+class TokenBuffer:
+    """
+    This class stores a sequence of tokens as a "struct of arrays": one array
+    with the kind of each token, plus two arrays with the offsets where each
+    token starts and ends in the source text. Thus, it does not keep a Token
+    object per lexeme: a token costs two bytes for the kind plus sixteen bytes
+    for the offsets. White-spaces and new lines are filtered out, as in
+    RegexLexer.tokens(). The parser can read the tokens with the methods kind(i)
+    and text(i), which do not create Token objects:
+
+    >>> buf = TokenBuffer("2 * (3 - 1)")
+    >>> len(buf)
+    7
+    >>> buf.kind(1), buf.text(3)
+    (<TokenType.MUL: 204>, '3')
+
+    Indexing the buffer creates a Token on demand, so code that expects a list
+    of tokens also works:
+
+    >>> [tk.kind.name for tk in buf]
+    ['INT', 'MUL', 'LPR', 'INT', 'SUB', 'INT', 'RPR']
+    >>> buf[1].text
+    '*'
+    """
+
+    KINDS = {kind.value: kind for kind in TokenType}
+
+    def __init__(self, source):
+        self.source = source
+        self.kinds = array("h")
+        self.starts = array("q")
+        self.ends = array("q")
+        codes = {kind.name: kind.value for kind in TokenType}
+        for match in MASTER_REGEX.finditer(source):
+            name = match.lastgroup
+            if name == "WSP" or name == "NLN":
+                continue
+            if name == "ERR":
+                sys.exit(f"Lexical error: {match.group()!r}")
+            self.kinds.append(codes[name])
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self.kinds):
+            raise IndexError("token index out of range")
+        return Token(self.text(i), self.kind(i))
+
+    def kind(self, i):
+        return TokenBuffer.KINDS[self.kinds[i]]
+
+    def text(self, i):
+        return self.source[self.starts[i]:self.ends[i]]
+
+
+BACKENDS = {"dfa": DfaLexer, "regex": RegexLexer}
+
+
+def benchmark(source, lexers=(Lexer, DfaLexer, RegexLexer), repeat=3):
+    """
+    Prints how many tokens per second each lexer class produces when scanning
+    the source string. Scanners that are not implemented yet are skipped. To
+    use it, do, for instance:
+
+    python3 -c "import Lexer; Lexer.benchmark(open('big.txt').read())"
+    """
+    for lexer in lexers:
+        best = None
+        try:
+            for _ in range(repeat):
+                begin = time.perf_counter()
+                num_tokens = sum(1 for _ in lexer(source).tokens())
+                elapsed = time.perf_counter() - begin
+                if best is None or elapsed < best:
+                    best = elapsed
+        except (AttributeError, NotImplementedError):
+            print(f"{lexer.__name__}: not implemented")
+            continue
+        rate = num_tokens / best if best > 0 else float("inf")
+        print(f"{lexer.__name__}: {num_tokens} tokens, {rate:.0f} tokens/s")
@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-from Visitor import *
 
 class Expression(ABC):
     @abstractmethod
@@ -454,4 +453,43 @@ class IfThenElse(Expression):
         >>> e.accept(ev, {})
         30
         """
-        return visitor.visit_ifThenElse(self, arg)
\ No newline at end of file
+        return visitor.visit_ifThenElse(self, arg)
+
+class ResolvedVar(Var):
+    """
+    This class represents an identifier whose binding was found by the
+    ResolveVisitor. Besides the name, it holds the lexical address of the
+    binding: 'depth' is the number of frames that we must go up, following
+    parent pointers, and 'slot' is the index of the value within that frame.
+    """
+    def __init__(self, identifier, depth, slot):
+        super().__init__(identifier)
+        self.depth = depth
+        self.slot = slot
+
+class ResolvedLet(Let):
+    """
+    This class represents a let expression whose identifier was assigned a
+    slot in the frame of the enclosing function by the ResolveVisitor.
+    """
+    def __init__(self, identifier, exp_def, exp_body, slot):
+        super().__init__(identifier, exp_def, exp_body)
+        self.slot = slot
+
+class ClosureFn(Fn):
+    """
+    This class represents an anonymous function produced by the
+    ConvertVisitor. 'captures' holds one ResolvedVar for each free variable
+    of the function, and it is evaluated in the frame where the function is
+    created. If the ConvertVisitor lifts the function, then 'value' is the
+    function value, which is built only once.
+    """
+    def __init__(self, formal, body, captures, value=None):
+        super().__init__(formal, body)
+        self.captures = captures
+        self.value = value
+
+
+# Visitor.py imports this module; importing it last lets either module be
+# imported first. The visitors are only used in the doctests above.
+from Visitor import *
\ No newline at end of file
@@ -1,7 +1,7 @@
 import sys
 
 from Expression import *
-from Lexer import Token, TokenType
+from Lexer import Token, TokenType, TokenBuffer
 
 """
 This file implements a parser for SML with anonymous functions. The grammar is
@@ -29,13 +29,74 @@ References:
     see https://www.engr.mun.ca/~theo/Misc/exp_parsing.htm#classic
 """
 
+class TokenStream:
+    """
+    This class reads tokens on demand from a token generator, such as
+    Lexer.tokens(). It only keeps the last 'capacity' tokens, in a ring buffer.
+    Thus, the memory used to store tokens does not depend on the size of the
+    input. Tokens are indexed as in a list, but an index can only refer to one
+    of the last tokens read. As the length of the stream is not known in
+    advance, indices past the end of the input give an EOF token.
+
+    >>> tks = [Token('1', TokenType.NUM), Token('+', TokenType.ADD)]
+    >>> tks += [Token('2', TokenType.NUM)]
+    >>> stream = TokenStream(tks, capacity=2)
+    >>> stream[0].text, stream[1].text, stream[2].text, stream[3].kind.name
+    ('1', '+', '2', 'EOF')
+
+    >>> stream[0]
+    Traceback (most recent call last):
+    IndexError: token 0 was discarded from the stream
+    """
+
+    def __init__(self, tokens, capacity=8):
+        self.tokens = iter(tokens)
+        self.capacity = capacity
+        self.ring = capacity * [None]
+        self.first = 0  # The index of the oldest token in the ring buffer.
+        self.end = 0  # The index of the next token that will be read.
+        self.eof = Token("", TokenType.EOF)
+
+    def __getitem__(self, i):
+        while i >= self.end:
+            token = next(self.tokens, None)
+            if token is None:
+                return self.eof
+            if self.end - self.first == self.capacity:
+                self.first += 1
+            self.ring[self.end % self.capacity] = token
+            self.end += 1
+        if i < self.first:
+            raise IndexError(f"token {i} was discarded from the stream")
+        return self.ring[i % self.capacity]
+
+
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, streaming=False):
         """
         Initializes the parser. The parser keeps track of the list of tokens
-        and the current token. For instance:
+        and the current token. If streaming is True, then the tokens are not
+        copied into a list. Instead, they are read on demand, through a
+        TokenStream, which keeps only the last few tokens in memory. Thus,
+        parsing can start before the whole input is scanned. The tokens
+        can also be a TokenBuffer, which is used as it is:
+        self.tokens.kind(i) and self.tokens.text(i) then read the i-th
+        token without creating Token objects. For instance:
+
+        >>> parser = Parser([Token('1', TokenType.NUM)], streaming=True)
+        >>> parser.tokens[0].text, parser.tokens[1].kind.name
+        ('1', 'EOF')
+
+        >>> parser = Parser(TokenBuffer("fn x => x"))
+        >>> len(parser.tokens), parser.tokens.kind(2)
+        (4, <TokenType.ARW: 219>)
         """
-        self.tokens = list(tokens)
+        if streaming:
+            self.tokens = TokenStream(tokens)
+        elif isinstance(tokens, TokenBuffer):
+            self.tokens = tokens
+        else:
+            self.tokens = list(tokens)
         self.cur_token_idx = 0 # This is just a suggestion!
 
     def parse(self):
@@ -267,4 +328,259 @@ class Parser:
         3
         """
         # TODO: implement this method.
-        return None
\ No newline at end of file
+        return None
+
+
+class StackParser(Parser):
+    """
+    This parser recognizes the same grammar as Parser, and builds the same
+    expression trees, but it does not use recursion. Instead, it keeps an
+    explicit stack of frames. Each frame is a construct that is still open,
+    such as "fn x => _", "if c then _ else _", "( _ )" or "e + _". The parser
+    alternates between two phases:
+
+    1. shift: reads the tokens that open new constructs, pushing one frame for
+       each of them, until it finds an atom (a variable, number or boolean).
+    2. reduce: pops frames, plugging the expression built so far into each of
+       them, until it finds a frame that still needs more tokens.
+
+    Each token is read once, and each frame is pushed and popped once. Thus,
+    the parser runs in linear time and memory, and the depth of nesting is
+    bounded only by memory, not by sys.getrecursionlimit(). Examples:
+
+    >>> n = 100000
+    >>> tks = [Token('(', TokenType.LPR)] * n + [Token('1', TokenType.NUM)]
+    >>> tks += [Token(')', TokenType.RPR)] * n
+    >>> StackParser(tks).parse().num
+    1
+
+    >>> fn = [Token('fn', TokenType.FNX), Token('x', TokenType.VAR)]
+    >>> tks = (fn + [Token('=>', TokenType.ARW)]) * n
+    >>> exp = StackParser(tks + [Token('x', TokenType.VAR)]).parse()
+    >>> depth = 0
+    >>> while isinstance(exp, Fn):
+    ...     exp, depth = exp.body, depth + 1
+    >>> depth, exp.identifier
+    (100000, 'x')
+
+    >>> let = [Token('let', TokenType.LET), Token('v', TokenType.VAR)]
+    >>> let += [Token('<-', TokenType.ASN), Token('1', TokenType.NUM)]
+    >>> tks = (let + [Token('in', TokenType.INX)]) * n
+    >>> tks += [Token('v', TokenType.VAR), Token('+', TokenType.ADD)]
+    >>> tks += [Token('2', TokenType.NUM)] + [Token('end', TokenType.END)] * n
+    >>> exp = StackParser(tks).parse()
+    >>> for _ in range(n - 1):
+    ...     exp = exp.exp_body
+    >>> type(exp.exp_body).__name__, exp.exp_body.right.num
+    ('Add', 2)
+
+    The parser reads each token through kind() and text(). Thus, it can also
+    parse a TokenBuffer, without creating Token objects:
+
+    >>> exp = StackParser(TokenBuffer("let x <- 2 in x * x end")).parse()
+    >>> exp.identifier, type(exp.exp_body).__name__, exp.exp_def.num
+    ('x', 'Mul', 2)
+    """
+
+    # The kinds of expressions that the shift phase might be looking for:
+    FN_EXP, IF_EXP, UNARY_EXP, VAL_TK = range(4)
+
+    # The precedence and the expression built by each binary operator. All
+    # these operators are left-associative:
+    BINARY = {
+        TokenType.ORX: (1, Or),
+        TokenType.AND: (2, And),
+        TokenType.EQL: (3, Eql),
+        TokenType.LEQ: (4, Leq),
+        TokenType.LTH: (4, Lth),
+        TokenType.ADD: (5, Add),
+        TokenType.SUB: (5, Sub),
+        TokenType.MUL: (6, Mul),
+        TokenType.DIV: (6, Div),
+    }
+
+    # The tokens that can start a val_tk:
+    ATOMS = {TokenType.VAR, TokenType.LPR, TokenType.NUM, TokenType.TRU,
+             TokenType.FLS}
+
+    def read_tokens(self):
+        """
+        Sets self.kinds, the list with the kind of each token, and text_at(i),
+        which reads the text of the i-th token. The kinds of a TokenBuffer are
+        decoded from its array in a single pass, and the texts are sliced from
+        the source only when the parser asks for them. Thus, no Token object
+        is created. A TokenStream cannot be copied into lists; hence, its
+        tokens are read one at a time.
+        """
+        tokens = self.tokens
+        if isinstance(tokens, TokenBuffer):
+            self.kinds = list(map(TokenBuffer.KINDS.__getitem__, tokens.kinds))
+            self.text_at = tokens.text
+        elif isinstance(tokens, TokenStream):
+            self.kind = lambda: tokens[self.cur_token_idx].kind
+            self.text_at = lambda i: tokens[i].text
+        else:
+            self.kinds = [token.kind for token in tokens]
+            self.text_at = [token.text for token in tokens].__getitem__
+
+    def kind(self):
+        """
+        Returns the kind of the current token, or EOF if all the tokens have
+        been read.
+        """
+        try:
+            return self.kinds[self.cur_token_idx]
+        except IndexError:
+            return TokenType.EOF
+
+    def text(self):
+        """
+        Returns the text of the current token, or "" if all the tokens have
+        been read.
+        """
+        try:
+            return self.text_at(self.cur_token_idx)
+        except IndexError:
+            return ""
+
+    def expect(self, kind):
+        """
+        Consumes the current token, which must have the given kind.
+        """
+        if self.kind() != kind:
+            sys.exit(f"Parse error: expected {kind.name}, found {self.text()!r}")
+        self.cur_token_idx += 1
+
+    def var(self):
+        """
+        Consumes the current token, which must be a variable, and returns its
+        name.
+        """
+        name = self.text()
+        self.expect(TokenType.VAR)
+        return name
+
+    def parse(self):
+        self.read_tokens()
+        stack = []
+        goal = StackParser.FN_EXP
+        while True:
+            exp = self.shift(goal, stack)
+            goal = None
+            while goal is None:
+                if not stack:
+                    self.expect(TokenType.EOF)
+                    return exp
+                exp, goal = self.reduce(stack.pop(), exp, stack)
+
+    def shift(self, goal, stack):
+        """
+        Reads the tokens that start an expression of the kind 'goal', pushing
+        a frame for each construct that they open, and returns the first atom.
+        """
+        while True:
+            kind = self.kind()
+            if goal == StackParser.FN_EXP:
+                if kind == TokenType.FNX:
+                    self.cur_token_idx += 1
+                    formal = self.var()
+                    self.expect(TokenType.ARW)
+                    stack.append(("fn", formal))
+                    continue
+                goal = StackParser.IF_EXP
+            if goal == StackParser.IF_EXP:
+                if kind == TokenType.IFX:
+                    self.cur_token_idx += 1
+                    stack.append(("if_cond",))
+                    continue
+                stack.append(("binary", 1))
+                goal = StackParser.UNARY_EXP
+            if goal == StackParser.UNARY_EXP:
+                if kind == TokenType.NOT:
+                    self.cur_token_idx += 1
+                    stack.append(("not",))
+                    continue
+                if kind == TokenType.NEG:
+                    self.cur_token_idx += 1
+                    stack.append(("neg",))
+                    continue
+                if kind == TokenType.LET:
+                    self.cur_token_idx += 1
+                    name = self.var()
+                    self.expect(TokenType.ASN)
+                    stack.append(("let_def", name))
+                    goal = StackParser.FN_EXP
+                    continue
+                stack.append(("app", None))
+                goal = StackParser.VAL_TK
+            if kind == TokenType.VAR:
+                exp = Var(self.text())
+            elif kind == TokenType.NUM:
+                exp = Num(int(self.text()))
+            elif kind == TokenType.TRU:
+                exp = Bln(True)
+            elif kind == TokenType.FLS:
+                exp = Bln(False)
+            elif kind == TokenType.LPR:
+                self.cur_token_idx += 1
+                stack.append(("paren",))
+                goal = StackParser.FN_EXP
+                continue
+            else:
+                sys.exit(f"Parse error: unexpected token {self.text()!r}")
+            self.cur_token_idx += 1
+            return exp
+
+    def reduce(self, frame, exp, stack):
+        """
+        Plugs exp into the open construct 'frame'. Returns the resulting
+        expression, if the construct is complete. Otherwise, pushes the frames
+        that the construct still needs, and returns the kind of expression
+        that must be read next.
+        """
+        tag = frame[0]
+        if tag == "app":
+            if frame[1] is not None:
+                exp = App(frame[1], exp)
+            if self.kind() in StackParser.ATOMS:
+                stack.append(("app", exp))
+                return None, StackParser.VAL_TK
+            return exp, None
+        elif tag == "binary":
+            op = StackParser.BINARY.get(self.kind())
+            if op is not None and op[0] >= frame[1]:
+                self.cur_token_idx += 1
+                stack.append(("operator", frame[1], exp, op[1]))
+                stack.append(("binary", op[0] + 1))
+                return None, StackParser.UNARY_EXP
+            return exp, None
+        elif tag == "operator":
+            # Other operators of the same precedence might follow:
+            stack.append(("binary", frame[1]))
+            return frame[3](frame[2], exp), None
+        elif tag == "not":
+            return Not(exp), None
+        elif tag == "neg":
+            return Neg(exp), None
+        elif tag == "paren":
+            self.expect(TokenType.RPR)
+            return exp, None
+        elif tag == "fn":
+            return Fn(frame[1], exp), None
+        elif tag == "if_cond":
+            self.expect(TokenType.THN)
+            stack.append(("if_then", exp))
+            return None, StackParser.FN_EXP
+        elif tag == "if_then":
+            self.expect(TokenType.ELS)
+            stack.append(("if_else", frame[1], exp))
+            return None, StackParser.FN_EXP
+        elif tag == "if_else":
+            return IfThenElse(frame[1], frame[2], exp), None
+        elif tag == "let_def":
+            self.expect(TokenType.INX)
+            stack.append(("let_body", frame[1], exp))
+            return None, StackParser.FN_EXP
+        elif tag == "let_body":
+            self.expect(TokenType.END)
+            return Let(frame[1], frame[2], exp), None
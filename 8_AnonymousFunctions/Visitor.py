@@ -207,4 +207,384 @@ class EvalVisitor(Visitor):
         of code! You must implement the evaluation of a function application.
         """
         # TODO: Implement this method.
-        raise NotImplementedException
\ No newline at end of file
+        raise NotImplementedException
+
+
+class ResolveVisitor(Visitor):
+    """
+    The ResolveVisitor computes the lexical address of every variable. It
+    returns a copy of the expression where each Var bound in the program
+    becomes a ResolvedVar(name, depth, slot), and each Let becomes a
+    ResolvedLet that knows the slot where its value is stored. Variables that
+    are not bound anywhere are kept as they are, so that their evaluation
+    fails with "Def error", like in the EvalVisitor.
+
+    Every function body has a frame: slot 0 points to the frame where the
+    function was created, slot 1 holds the parameter, and the other slots hold
+    the values of the let expressions in the body. The inherited attribute is
+    a triple (names, level, size): names maps each visible identifier to its
+    (level, slot) binding, level is the number of enclosing functions, and
+    size is a one-element list with the number of slots of the current frame.
+
+    Example:
+    >>> e = Let('y', Num(2), Fn('x', Add(Var('x'), Var('y'))))
+    >>> r = ResolveVisitor().resolve(e, ['z'])
+    >>> r.slot, r.exp_body.body.left.depth, r.exp_body.body.left.slot
+    (2, 0, 1)
+    >>> r.exp_body.body.right.depth, r.exp_body.body.right.slot
+    (1, 2)
+    """
+
+    def resolve(self, exp, names=()):
+        """
+        Resolves exp in a frame whose slots 1, 2, ... hold the values of the
+        given names.
+        """
+        scope = {name: (0, slot) for slot, name in enumerate(names, 1)}
+        return exp.accept(self, (scope, 0, [len(scope) + 1]))
+
+    def visit_var(self, exp, arg):
+        names, level, _ = arg
+        if exp.identifier in names:
+            bound, slot = names[exp.identifier]
+            return ResolvedVar(exp.identifier, level - bound, slot)
+        return exp
+
+    def visit_bln(self, exp, arg):
+        return exp
+
+    def visit_num(self, exp, arg):
+        return exp
+
+    def binary(self, exp, arg):
+        return type(exp)(exp.left.accept(self, arg),
+                         exp.right.accept(self, arg))
+
+    def unary(self, exp, arg):
+        return type(exp)(exp.exp.accept(self, arg))
+
+    visit_eql = visit_and = visit_or = binary
+    visit_add = visit_sub = visit_mul = visit_div = binary
+    visit_leq = visit_lth = binary
+    visit_neg = visit_not = unary
+
+    def visit_let(self, exp, arg):
+        names, level, size = arg
+        exp_def = exp.exp_def.accept(self, arg)
+        slot = size[0]
+        size[0] += 1
+        names = {**names, exp.identifier: (level, slot)}
+        exp_body = exp.exp_body.accept(self, (names, level, size))
+        return ResolvedLet(exp.identifier, exp_def, exp_body, slot)
+
+    def visit_ifThenElse(self, exp, arg):
+        return IfThenElse(exp.cond.accept(self, arg),
+                          exp.e0.accept(self, arg),
+                          exp.e1.accept(self, arg))
+
+    def visit_fn(self, exp, arg):
+        names, level, _ = arg
+        names = {**names, exp.formal: (level + 1, 1)}
+        body = exp.body.accept(self, (names, level + 1, [2]))
+        return Fn(exp.formal, body)
+
+    def visit_app(self, exp, arg):
+        return App(exp.function.accept(self, arg),
+                   exp.actual.accept(self, arg))
+
+
+class FrameVisitor(Visitor):
+    """
+    The FrameVisitor evaluates expressions produced by the ResolveVisitor. The
+    inherited attribute is a frame: a list whose first element is the parent
+    frame. Reading a variable follows 'depth' parent pointers and then indexes
+    the frame, and creating a function just captures the current frame, so
+    neither operation hashes names or copies environments. Values are the same
+    as in the EvalVisitor: numbers, booleans and Function (whose env is now a
+    frame).
+
+    Examples:
+    >>> e0 = Let('v', Add(Num(40), Num(2)), Sub(Var('v'), Num(2)))
+    >>> e1 = Lth(e0, Var('x'))
+    >>> FrameVisitor().evaluate(e1, {'x': 41})
+    True
+
+    >>> e0 = Let('w', Num(3), App(Var('f'), Num(1)))
+    >>> e1 = Let('f', Fn('v', Add(Var('v'), Var('w'))), e0)
+    >>> e2 = Let('w', Num(2), e1)
+    >>> FrameVisitor().evaluate(e2, {})
+    3
+
+    >>> e0 = Let('k', Fn('x', Fn('y', Var('x'))), App(App(Var('k'), Num(3)),\
+            Bln(True)))
+    >>> FrameVisitor().evaluate(e0, {})
+    3
+    """
+
+    def __init__(self):
+        self.resolver = ResolveVisitor()
+        self.trees = {}
+
+    def evaluate(self, exp, env):
+        """
+        Evaluates exp in the environment env, which maps names to values.
+        The resolved copy of exp is cached, so it is computed only once for
+        each set of names in env.
+        """
+        names = tuple(env)
+        tree = self.trees.get((exp, names))
+        if tree is None:
+            tree = self.resolver.resolve(exp, names)
+            self.trees[(exp, names)] = tree
+        return tree.accept(self, [None, *env.values()])
+
+    def visit_var(self, exp, frame):
+        try:
+            depth = exp.depth
+        except AttributeError:
+            sys.exit("Def error")
+        while depth:
+            frame = frame[0]
+            depth -= 1
+        return frame[exp.slot]
+
+    def visit_bln(self, exp, frame):
+        return exp.bln
+
+    def visit_num(self, exp, frame):
+        return exp.num
+
+    def visit_eql(self, exp, frame):
+        val_left = exp.left.accept(self, frame)
+        val_right = exp.right.accept(self, frame)
+        if type(val_left) == type(val_right):
+            return val_left == val_right
+        else:
+            sys.exit("Type error")
+
+    def logic(self, exp, frame, short):
+        val = exp.left.accept(self, frame)
+        if type(val) is not bool:
+            sys.exit("Type error")
+        if val == short:
+            return val
+        val = exp.right.accept(self, frame)
+        if type(val) is not bool:
+            sys.exit("Type error")
+        return val
+
+    def visit_and(self, exp, frame):
+        return self.logic(exp, frame, False)
+
+    def visit_or(self, exp, frame):
+        return self.logic(exp, frame, True)
+
+    def arith(self, exp, frame, op):
+        val_left = exp.left.accept(self, frame)
+        val_right = exp.right.accept(self, frame)
+        if type(val_left) is int and type(val_right) is int:
+            return op(val_left, val_right)
+        sys.exit("Type error")
+
+    def visit_add(self, exp, frame):
+        return self.arith(exp, frame, int.__add__)
+
+    def visit_sub(self, exp, frame):
+        return self.arith(exp, frame, int.__sub__)
+
+    def visit_mul(self, exp, frame):
+        return self.arith(exp, frame, int.__mul__)
+
+    def visit_div(self, exp, frame):
+        return self.arith(exp, frame, int.__floordiv__)
+
+    def visit_leq(self, exp, frame):
+        return self.arith(exp, frame, int.__le__)
+
+    def visit_lth(self, exp, frame):
+        return self.arith(exp, frame, int.__lt__)
+
+    def visit_neg(self, exp, frame):
+        val = exp.exp.accept(self, frame)
+        if type(val) is int:
+            return -val
+        sys.exit("Type error")
+
+    def visit_not(self, exp, frame):
+        val = exp.exp.accept(self, frame)
+        if type(val) is bool:
+            return not val
+        sys.exit("Type error")
+
+    def visit_let(self, exp, frame):
+        val = exp.exp_def.accept(self, frame)
+        # Frames grow on demand: each let of a function body has its own
+        # slot, and a let runs at most once per activation of the body.
+        slot = exp.slot
+        if slot >= len(frame):
+            frame.extend([None] * (slot + 1 - len(frame)))
+        frame[slot] = val
+        return exp.exp_body.accept(self, frame)
+
+    def visit_ifThenElse(self, exp, frame):
+        val = exp.cond.accept(self, frame)
+        if type(val) is not bool:
+            sys.exit("Type error")
+        if val:
+            return exp.e0.accept(self, frame)
+        return exp.e1.accept(self, frame)
+
+    def visit_fn(self, exp, frame):
+        return Function(exp.formal, exp.body, frame)
+
+    def visit_app(self, exp, frame):
+        fval = exp.function.accept(self, frame)
+        if not isinstance(fval, Function):
+            sys.exit("Type error")
+        pval = exp.actual.accept(self, frame)
+        return fval.body.accept(self, [fval.env, pval])
+
+
+class ConvertVisitor(ResolveVisitor):
+    """
+    The ConvertVisitor does closure conversion. Like the ResolveVisitor, it
+    gives each variable a lexical address, but slot 0 of a function frame no
+    longer points to the frame where the function was created. It holds,
+    instead, a tuple with the values of the free variables of the function.
+    Thus, every variable is either a local (depth 0), or an entry of that
+    tuple (depth 1), and a closure keeps alive only the values that its body
+    may read. Each Fn becomes a ClosureFn, whose 'captures' are evaluated in
+    the enclosing frame to build the tuple.
+    Functions without free variables are lambda-lifted: their value is built
+    once, here, and every evaluation of the function returns it. Eql compares
+    functions by identity, so sharing the value would make two evaluations of
+    such a function equal. Thus, if the expression has an Eql whose operands
+    might both be functions, every evaluation creates a new value instead.
+
+    The inherited attribute is a quadruple (names, level, size, captured),
+    where the first three fields are like in the ResolveVisitor, and
+    captured maps each free variable of the current function to its index
+    in the tuple.
+
+    Example:
+    >>> e = Let('y', Num(2), Let('z', Num(3),\
+            Fn('x', Add(Var('x'), Var('z')))))
+    >>> f = ConvertVisitor().resolve(e).exp_body.exp_body
+    >>> [(v.identifier, v.depth, v.slot) for v in f.captures]
+    [('z', 0, 2)]
+    >>> f.body.right.depth, f.body.right.slot
+    (1, 0)
+
+    >>> e = Fn('x', Fn('y', Var('y')))
+    >>> f = ConvertVisitor().resolve(e)
+    >>> f.captures, f.value is None, f.body.captures, f.body.value is None
+    ((), False, (), False)
+
+    >>> f = ConvertVisitor().resolve(Eql(e, e))
+    >>> f.left.value is None, f.left.body.value is None
+    (True, True)
+    """
+
+    # Expressions whose values are never functions.
+    SCALARS = (Num, Bln, Add, Sub, Mul, Div, Neg, Eql, Leq, Lth, And, Or, Not)
+
+    def resolve(self, exp, names=()):
+        """
+        Converts exp in a frame whose slots 1, 2, ... hold the values of the
+        given names.
+        """
+        scope = {name: (0, slot) for slot, name in enumerate(names, 1)}
+        self.lifted = []
+        self.compares_functions = False
+        exp = exp.accept(self, (scope, 0, [len(scope) + 1], {}))
+        if not self.compares_functions:
+            for fn, value in self.lifted:
+                fn.value = value
+        return exp
+
+    def visit_var(self, exp, arg):
+        names, level, _, captured = arg
+        if exp.identifier not in names:
+            return exp
+        bound, slot = names[exp.identifier]
+        if bound == level:
+            return ResolvedVar(exp.identifier, 0, slot)
+        index = captured.setdefault(exp.identifier, len(captured))
+        return ResolvedVar(exp.identifier, 1, index)
+
+    def visit_let(self, exp, arg):
+        names, level, size, captured = arg
+        exp_def = exp.exp_def.accept(self, arg)
+        slot = size[0]
+        size[0] += 1
+        names = {**names, exp.identifier: (level, slot)}
+        exp_body = exp.exp_body.accept(self, (names, level, size, captured))
+        return ResolvedLet(exp.identifier, exp_def, exp_body, slot)
+
+    def captures(self, captured, arg):
+        """
+        Reads the free variables of a function in the enclosing frame. This
+        may, in turn, add them to the free variables of the enclosing
+        function.
+        """
+        return tuple(Var(name).accept(self, arg) for name in captured)
+
+    def visit_eql(self, exp, arg):
+        if not isinstance(exp.left, self.SCALARS) and \
+                not isinstance(exp.right, self.SCALARS):
+            self.compares_functions = True
+        return super().visit_eql(exp, arg)
+
+    def visit_fn(self, exp, arg):
+        names, level, _, _ = arg
+        names = {**names, exp.formal: (level + 1, 1)}
+        captured = {}
+        body = exp.body.accept(self, (names, level + 1, [2], captured))
+        captures = self.captures(captured, arg)
+        fn = ClosureFn(exp.formal, body, captures)
+        if not captures:
+            self.lifted.append((fn, Function(exp.formal, body, ())))
+        return fn
+
+
+class ClosureVisitor(FrameVisitor):
+    """
+    The ClosureVisitor evaluates expressions produced by the ConvertVisitor.
+    It works like the FrameVisitor, except that the env of a function value
+    is the tuple with the values of its free variables, instead of the frame
+    where the function was created. A lifted function evaluates to the value
+    that the ConvertVisitor built for it, unless the expression might compare
+    functions with Eql: then each evaluation creates a new value, and Eql
+    tells them apart, as the EvalVisitor does.
+
+    Examples:
+    >>> e0 = Let('w', Num(3), App(Var('f'), Num(1)))
+    >>> e1 = Let('f', Fn('v', Add(Var('v'), Var('w'))), e0)
+    >>> e2 = Let('w', Num(2), e1)
+    >>> ClosureVisitor().evaluate(e2, {})
+    3
+
+    >>> e0 = Let('k', Fn('x', Fn('y', Var('x'))), App(App(Var('k'), Num(3)),\
+            Bln(True)))
+    >>> ClosureVisitor().evaluate(e0, {})
+    3
+
+    >>> e0 = Let('a', Num(1), Let('b', Num(2), Fn('x', Var('b'))))
+    >>> ClosureVisitor().evaluate(e0, {}).env
+    (2,)
+
+    >>> e0 = Let('mk', Fn('x', Fn('y', Var('y'))),\
+            Eql(App(Var('mk'), Num(1)), App(Var('mk'), Num(2))))
+    >>> ClosureVisitor().evaluate(e0, {})
+    False
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.resolver = ConvertVisitor()
+
+    def visit_fn(self, exp, frame):
+        if exp.value is not None:
+            return exp.value
+        env = tuple([var.accept(self, frame) for var in exp.captures])
+        return Function(exp.formal, exp.body, env)
\ No newline at end of file
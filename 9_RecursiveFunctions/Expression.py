@@ -1,5 +1,8 @@
+import sys
+import struct
+import inspect
 from abc import ABC, abstractmethod
-from Visitor import *
+from array import array
 
 """
 This file adds recursive functions to our language. You can follow the
@@ -24,6 +27,10 @@ eval(applyrec(Function, Actual), Env, Value) :-
 
 
 class Expression(ABC):
+    # Expressions have no __dict__: each subclass lists its fields in
+    # __slots__, which saves memory in large trees.
+    __slots__ = ()
+
     @abstractmethod
     def accept(self, visitor, arg):
         raise NotImplementedError
@@ -35,6 +42,8 @@ class Var(Expression):
     indentifier is the value associated with it in the environment table.
     """
 
+    __slots__ = ("identifier",)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
@@ -61,6 +70,8 @@ class Bln(Expression):
     the boolean itself.
     """
 
+    __slots__ = ("bln",)
+
     def __init__(self, bln):
         self.bln = bln
 
@@ -81,6 +92,8 @@ class Num(Expression):
     an expression is the number itself.
     """
 
+    __slots__ = ("num",)
+
     def __init__(self, num):
         self.num = num
 
@@ -101,6 +114,8 @@ class BinaryExpression(Expression):
     sub-expressions: the left operand and the right operand.
     """
 
+    __slots__ = ("left", "right")
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -117,6 +132,8 @@ class Eql(BinaryExpression):
     otherwise.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -143,6 +160,8 @@ class Add(BinaryExpression):
     an expression is the addition of the two subexpression's values.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -163,6 +182,8 @@ class And(BinaryExpression):
     subexpression's values.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -190,6 +211,8 @@ class Or(BinaryExpression):
     subexpression's values.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -216,6 +239,8 @@ class Sub(BinaryExpression):
     an expression is the subtraction of the two subexpression's values.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -235,6 +260,8 @@ class Mul(BinaryExpression):
     such an expression is the product of the two subexpression's values.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -255,6 +282,8 @@ class Div(BinaryExpression):
     subexpression's values.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -282,6 +311,8 @@ class Mod(BinaryExpression):
     subexpression's values.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -310,6 +341,8 @@ class Leq(BinaryExpression):
     right operand. It is false otherwise.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -345,6 +378,8 @@ class Lth(BinaryExpression):
     operand. It is false otherwise.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -378,6 +413,8 @@ class UnaryExpression(Expression):
     sub-expression.
     """
 
+    __slots__ = ("exp",)
+
     def __init__(self, exp):
         self.exp = exp
 
@@ -392,6 +429,8 @@ class Neg(UnaryExpression):
     inverse of a number n is the number -n, so that the sum of both is zero.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -416,6 +455,8 @@ class Not(UnaryExpression):
     boolean expression is the logical complement of that expression.
     """
 
+    __slots__ = ()
+
     def accept(self, visitor, arg):
         """
         Example:
@@ -442,6 +483,8 @@ class Let(Expression):
     2. Evaluate e1 in the new environment env' = env + {v:e0_val}
     """
 
+    __slots__ = ("identifier", "exp_def", "exp_body")
+
     def __init__(self, identifier, exp_def, exp_body):
         self.identifier = identifier
         self.exp_def = exp_def
@@ -478,6 +521,8 @@ class Fn(Expression):
         Fn(v)
     """
 
+    __slots__ = ("formal", "body")
+
     def __init__(self, formal, body):
         self.formal = formal
         self.body = body
@@ -497,6 +542,8 @@ class Fun(Expression):
         Fun f(v)
     """
 
+    __slots__ = ("name", "formal", "body")
+
     def __init__(self, name, formal, body):
         self.name = name
         self.formal = formal
@@ -547,6 +594,8 @@ class App(Expression):
         49
     """
 
+    __slots__ = ("function", "actual")
+
     def __init__(self, function, actual):
         self.function = function
         self.actual = actual
@@ -566,6 +615,8 @@ class IfThenElse(Expression):
     "if True then 0 else 1 div 0" will return 0 indeed.
     """
 
+    __slots__ = ("cond", "e0", "e1")
+
     def __init__(self, cond, e0, e1):
         self.cond = cond
         self.e0 = e0
@@ -584,4 +635,539 @@ class IfThenElse(Expression):
         >>> e.accept(ev, {})
         30
         """
-        return visitor.visit_ifThenElse(self, arg)
\ No newline at end of file
+        return visitor.visit_ifThenElse(self, arg)
+
+
+class ResolvedVar(Var):
+    """
+    This class represents an identifier whose binding was found by the
+    ResolveVisitor. Besides the name, it holds the lexical address of the
+    binding: 'depth' is the number of frames that we must go up, following
+    parent pointers, and 'slot' is the index of the value within that frame.
+    """
+
+    __slots__ = ("depth", "slot")
+
+    def __init__(self, identifier, depth, slot):
+        super().__init__(identifier)
+        self.depth = depth
+        self.slot = slot
+
+
+class ResolvedLet(Let):
+    """
+    This class represents a let expression whose identifier was assigned a
+    slot in the frame of the enclosing function by the ResolveVisitor.
+    """
+
+    __slots__ = ("slot",)
+
+    def __init__(self, identifier, exp_def, exp_body, slot):
+        super().__init__(identifier, exp_def, exp_body)
+        self.slot = slot
+
+
+class ClosureFn(Fn):
+    """
+    This class represents an anonymous function produced by the
+    ConvertVisitor. 'captures' holds one ResolvedVar for each free variable
+    of the function, and it is evaluated in the frame where the function is
+    created. If the ConvertVisitor lifts the function, then 'value' is the
+    function value, which is built only once.
+    """
+
+    __slots__ = ("captures", "value")
+
+    def __init__(self, formal, body, captures, value=None):
+        super().__init__(formal, body)
+        self.captures = captures
+        self.value = value
+
+
+class ClosureFun(Fun):
+    """
+    This class represents a named function produced by the ConvertVisitor.
+    The fields 'captures' and 'value' are like in ClosureFn.
+    """
+
+    __slots__ = ("captures", "value")
+
+    def __init__(self, name, formal, body, captures, value=None):
+        super().__init__(name, formal, body)
+        self.captures = captures
+        self.value = value
+
+
+class HashCons:
+    """
+    This class is a factory of expressions that builds only one node for each
+    distinct expression: if two expressions have the same class and the same
+    fields, then they are the same object. Thus, structural equality between
+    expressions built by the same factory is just "is", and programs that
+    repeat subterms take less memory. Fields that are expressions are already
+    unique, so they are hashed and compared by identity, in O(1). Nodes are
+    shared, so they must not be modified after built. Example:
+
+    >>> h = HashCons()
+    >>> e0 = h(Add, h(Var, 'x'), h(Num, 1))
+    >>> e1 = h(Add, h(Var, 'x'), h(Num, 1))
+    >>> e0 is e1, e0 is Add(Var('x'), Num(1)), len(h)
+    (True, False, 3)
+
+    >>> e = h.cons(Mul(Add(Var('x'), Num(1)), Add(Var('x'), Num(1))))
+    >>> e.left is e.right is e0, len(h)
+    (True, 4)
+    """
+
+    def __init__(self):
+        self.table = {}
+        self.fields = {}
+
+    def __len__(self):
+        return len(self.table)
+
+    def __call__(self, cls, *fields):
+        """
+        Returns the unique expression of type cls with the given fields, which
+        are passed to the constructor of cls. Sub-expressions must have been
+        built by this factory.
+        """
+        key = (cls, *fields)
+        exp = self.table.get(key)
+        if exp is None:
+            exp = cls(*fields)
+            self.table[key] = exp
+        return exp
+
+    def field_names(self, cls):
+        """
+        Returns the names of the fields of cls, in the order that its
+        constructor takes them, or None if cls is not an expression.
+        """
+        try:
+            return self.fields[cls]
+        except KeyError:
+            names = None
+            if issubclass(cls, Expression):
+                names = tuple(name for klass in reversed(cls.__mro__)
+                              for name in klass.__dict__.get("__slots__", ()))
+            self.fields[cls] = names
+            return names
+
+    def cons(self, exp):
+        """
+        Returns the unique expression that is structurally equal to exp. The
+        traversal uses an explicit stack, so exp can be arbitrarily deep.
+        """
+        # Expressions are hashed by identity, so unique maps each node of exp
+        # to its unique copy. Fields that are not expressions are not keys.
+        unique = {}
+        stack = [(exp, None)]
+        while stack:
+            node, fields = stack.pop()
+            if fields is not None:
+                fields = [unique.get(field, field) for field in fields]
+                unique[node] = self(type(node), *fields)
+            elif node not in unique:
+                fields = [getattr(node, name)
+                          for name in self.field_names(type(node))]
+                children = [field for field in fields
+                            if self.field_names(type(field)) is not None]
+                if children:
+                    stack.append((node, fields))
+                    stack.extend((child, None) for child in children)
+                else:
+                    unique[node] = self(type(node), *fields)
+        return unique[exp]
+
+
+class FlatTree:
+    """
+    This class encodes expression trees as four parallel arrays of integers,
+    in post-order. Thus, a tree with millions of nodes takes a few arrays,
+    instead of millions of Python objects. The node at index i has:
+
+    - op[i]: its opcode, which is the index of its class in self.classes.
+    - left[i] and right[i]: the indices of its first two sub-expressions, or
+      -1 if it has fewer. The last sub-expression of a node always comes just
+      before it. For instance, e1 in IfThenElse(cond, e0, e1) is at i - 1.
+    - data[i]: the index, in self.consts, of the tuple with the fields that
+      are not expressions (numbers, names, etc), or -1 if there is none.
+
+    Visitors run over a FlatTree unchanged: tree.node(i) is a view of the node
+    at index i, with the same fields and the same accept method as the
+    original expression. Views are built on demand, as the visitor reads the
+    fields, and are discarded afterwards. Examples:
+
+    >>> t = FlatTree(Let('x', Num(42), Eql(Var('x'), Num(42))))
+    >>> list(t.op), list(t.left), list(t.right), list(t.data)
+    ([1, 3, 1, 2, 0], [-1, -1, -1, 1, 0], [-1, -1, -1, 2, 3], [0, 1, 0, -1, 2])
+    >>> t.consts
+    [(42,), ('x',), ('x',)]
+    >>> t.root.identifier, t.root.exp_body.left.identifier
+    ('x', 'x')
+    >>> t.root.exp_body.accept(EvalVisitor(), {'x': 42})
+    True
+
+    >>> e = t.expression()
+    >>> type(e).__name__, e.exp_def.num, type(e.exp_body).__name__
+    ('Let', 42, 'Eql')
+    """
+
+    def __init__(self, exp=None):
+        self.op = array("i")
+        self.left = array("i")
+        self.right = array("i")
+        self.data = array("i")
+        # For each opcode: its class, the names of its sub-expressions and of
+        # its constants, the layout of the arguments of its constructor, and
+        # the class of its views:
+        self.classes = []
+        self.children = []
+        self.constants = []
+        self.layouts = []
+        self.views = []
+        self.opcodes = {}
+        self.consts = []
+        self.const_ids = {}
+        if exp is not None:
+            self.add(exp)
+
+    def __len__(self):
+        return len(self.op)
+
+    @property
+    def root(self):
+        """
+        The view of the last expression added to the tree.
+        """
+        return self.node(len(self.op) - 1)
+
+    def node(self, i):
+        return self.views[self.op[i]](self, i)
+
+    def opcode(self, exp):
+        """
+        Returns the opcode of the class of exp. The first time that the tree
+        sees an instance of a class, it gives the class an opcode.
+        """
+        cls = type(exp)
+        code = self.opcodes.get(cls)
+        if code is None:
+            names = list(inspect.signature(cls.__init__).parameters)[1:]
+            code = self.define(cls, [isinstance(getattr(exp, name), Expression)
+                                     for name in names])
+        return code
+
+    def define(self, cls, is_child):
+        """
+        Gives cls a new opcode, and returns it. The list is_child tells, for
+        each argument of the constructor of cls, whether it is an expression.
+        From it, we find the layout of cls: for each argument, whether it is
+        the k-th sub-expression, or the k-th constant of the node.
+        """
+        code = len(self.classes)
+        names = list(inspect.signature(cls.__init__).parameters)[1:]
+        children = [name for name, b in zip(names, is_child) if b]
+        constants = [name for name, b in zip(names, is_child) if not b]
+        layout = []
+        fields = {"__slots__": (), "accept": cls.accept}
+        for name in names:
+            if name in children:
+                k = children.index(name)
+                fields[name] = property(FlatNode.child_getter(k))
+            else:
+                k = constants.index(name)
+                fields[name] = property(FlatNode.const_getter(k))
+            layout.append((name in children, k))
+        self.classes.append(cls)
+        self.children.append(children)
+        self.constants.append(constants)
+        self.layouts.append(layout)
+        self.views.append(type(cls.__name__ + "View", (FlatNode,), fields))
+        self.opcodes[cls] = code
+        return code
+
+    def const(self, code, values):
+        """
+        Returns the index of the tuple of constants 'values' in self.consts.
+        Nodes with the same opcode and equal constants share the same tuple.
+        """
+        key = (code, values)
+        try:
+            index = self.const_ids.get(key)
+        except TypeError:
+            # Some values, such as types with __eq__, are not hashable:
+            key = index = None
+        if index is None:
+            index = len(self.consts)
+            self.consts.append(values)
+            if key is not None:
+                self.const_ids[key] = index
+        return index
+
+    def add(self, exp):
+        """
+        Appends the nodes of exp to the tree, in post-order, and returns the
+        index of its root. The traversal uses an explicit stack, so exp can be
+        arbitrarily deep.
+        """
+        done = []
+        stack = [(exp, None)]
+        while stack:
+            node, code = stack.pop()
+            if code is None:
+                code = self.opcode(node)
+                stack.append((node, code))
+                for name in reversed(self.children[code]):
+                    stack.append((getattr(node, name), None))
+                continue
+            arity = len(self.children[code])
+            left = right = -1
+            if arity > 0:
+                left = done[-arity]
+                if arity > 1:
+                    right = done[1 - arity]
+                del done[-arity:]
+            data = -1
+            if self.constants[code]:
+                values = tuple([getattr(node, name)
+                                for name in self.constants[code]])
+                data = self.const(code, values)
+            self.op.append(code)
+            self.left.append(left)
+            self.right.append(right)
+            self.data.append(data)
+            done.append(len(self.op) - 1)
+        return done[0]
+
+    def expression(self, i=None):
+        """
+        Rebuilds the expression at index i (by default, the last one added to
+        the tree) with the original classes.
+        """
+        if i is None:
+            i = len(self.op) - 1
+        # In post-order, the nodes of the expression at i lie in first..i:
+        first = i
+        while self.children[self.op[first]]:
+            first = self.left[first]
+        done = []
+        for j in range(first, i + 1):
+            code = self.op[j]
+            arity = len(self.children[code])
+            children = done[len(done) - arity:]
+            del done[len(done) - arity:]
+            values = self.consts[self.data[j]] if self.data[j] >= 0 else ()
+            args = [children[k] if is_child else values[k]
+                    for is_child, k in self.layouts[code]]
+            done.append(self.classes[code](*args))
+        return done[0]
+
+    # The format of serialized trees. Integers are little-endian:
+    #   "FLT1", number of nodes, number of classes, number of constants (u32)
+    #   per class: length of its name (u16), name, arguments (u8), mask (u8)
+    #   per tuple of constants: its size (u16), then, for each constant:
+    #     kind (b"b", b"i" or b"s"), length (u32), bool/int/str as text
+    #   the columns op, left, right and data: one i32 per node each
+    MAGIC = b"FLT1"
+
+    def to_bytes(self):
+        """
+        Serializes the tree into a compact binary format. The tree is not
+        pickled, and only booleans, integers and strings can be constants.
+
+        >>> t = FlatTree(Let('x', Num(42), Eql(Var('x'), Num(42))))
+        >>> data = t.to_bytes()
+        >>> len(data)
+        149
+        >>> u = FlatTree.from_bytes(data)
+        >>> u.op == t.op and u.consts == t.consts, u.root.exp_def.num
+        (True, 42)
+        """
+        out = [struct.pack("<4sIII", FlatTree.MAGIC, len(self.op),
+                           len(self.classes), len(self.consts))]
+        for code, cls in enumerate(self.classes):
+            name = cls.__name__.encode()
+            mask = sum(1 << k for k, (is_child, _)
+                       in enumerate(self.layouts[code]) if is_child)
+            layout = len(self.layouts[code])
+            out.append(struct.pack("<H", len(name)) + name)
+            out.append(struct.pack("<BB", layout, mask))
+        for values in self.consts:
+            out.append(struct.pack("<H", len(values)))
+            for value in values:
+                if isinstance(value, bool):
+                    kind, text = b"b", str(int(value))
+                elif isinstance(value, int):
+                    kind, text = b"i", str(value)
+                elif isinstance(value, str):
+                    kind, text = b"s", value
+                else:
+                    raise TypeError(f"Cannot serialize {value!r}")
+                text = text.encode()
+                out.append(kind + struct.pack("<I", len(text)) + text)
+        for column in (self.op, self.left, self.right, self.data):
+            if sys.byteorder == "big":
+                column = array("i", column)
+                column.byteswap()
+            out.append(column.tobytes())
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Builds a tree out of the bytes produced by to_bytes. Classes are found
+        by name in this module. Raises ValueError if the data is malformed.
+        """
+        view = memoryview(data)
+        try:
+            magic, size, n_classes, n_consts = struct.unpack_from("<4sIII",
+                                                                  view)
+            if magic != FlatTree.MAGIC:
+                raise ValueError("Not a serialized FlatTree")
+            tree = cls()
+            pos = 16
+            for _ in range(n_classes):
+                (length,) = struct.unpack_from("<H", view, pos)
+                name = bytes(view[pos + 2:pos + 2 + length]).decode()
+                pos += 2 + length
+                layout, mask = struct.unpack_from("<BB", view, pos)
+                pos += 2
+                exp_cls = globals().get(name)
+                if not (isinstance(exp_cls, type)
+                        and issubclass(exp_cls, Expression)):
+                    raise ValueError(f"Unknown expression {name}")
+                params = inspect.signature(exp_cls.__init__).parameters
+                if layout != len(params) - 1:
+                    raise ValueError(f"Invalid layout for {name}")
+                tree.define(exp_cls, [bool(mask >> k & 1)
+                                      for k in range(layout)])
+            for _ in range(n_consts):
+                (count,) = struct.unpack_from("<H", view, pos)
+                pos += 2
+                values = []
+                for _ in range(count):
+                    kind = bytes(view[pos:pos + 1])
+                    (length,) = struct.unpack_from("<I", view, pos + 1)
+                    text = bytes(view[pos + 5:pos + 5 + length]).decode()
+                    pos += 5 + length
+                    if kind == b"s":
+                        values.append(text)
+                    elif kind == b"i":
+                        values.append(int(text))
+                    elif kind == b"b":
+                        values.append(text == "1")
+                    else:
+                        raise ValueError(f"Unknown constant kind {kind!r}")
+                tree.consts.append(tuple(values))
+            for column in (tree.op, tree.left, tree.right, tree.data):
+                column.frombytes(view[pos:pos + 4 * size])
+                pos += 4 * size
+                if sys.byteorder == "big":
+                    column.byteswap()
+            if pos != len(view) or len(tree.data) != size:
+                raise ValueError("Truncated serialized FlatTree")
+        except (struct.error, UnicodeDecodeError) as error:
+            raise ValueError("Malformed serialized FlatTree") from error
+        tree.check()
+        return tree
+
+    def check(self):
+        """
+        Raises ValueError unless the columns describe trees in post-order.
+        Every opcode must have a class, every node must have the constants
+        that its class expects, and the sub-expressions of a node must be the
+        trees that end right before it. Thus, a tree that passes this check
+        can be read by views, or rebuilt with expression(), without errors.
+
+        >>> t = FlatTree(Add(Num(1), Num(2)))
+        >>> t.check()
+        >>> t.left[2] = 7
+        >>> t.check()
+        Traceback (most recent call last):
+        ValueError: Invalid sub-expressions at node 2
+
+        >>> data = bytearray(FlatTree(Neg(Num(1))).to_bytes())
+        >>> data[-8] = 2  # The data of node 0 starts 8 bytes before the end.
+        >>> FlatTree.from_bytes(bytes(data))
+        Traceback (most recent call last):
+        ValueError: Invalid constants at node 0
+        """
+        # The indices of the trees that were not yet used as sub-expressions:
+        roots = []
+        for i in range(len(self.op)):
+            code = self.op[i]
+            if not 0 <= code < len(self.classes):
+                raise ValueError(f"Invalid opcode at node {i}")
+            arity = len(self.children[code])
+            if arity > len(roots):
+                raise ValueError(f"Missing sub-expressions at node {i}")
+            children = roots[len(roots) - arity:]
+            left = children[0] if arity > 0 else -1
+            right = children[1] if arity > 1 else -1
+            if self.left[i] != left or self.right[i] != right:
+                raise ValueError(f"Invalid sub-expressions at node {i}")
+            del roots[len(roots) - arity:]
+            roots.append(i)
+            data = self.data[i]
+            if not self.constants[code]:
+                valid = data == -1
+            else:
+                valid = 0 <= data < len(self.consts) and \
+                    len(self.consts[data]) == len(self.constants[code])
+            if not valid:
+                raise ValueError(f"Invalid constants at node {i}")
+
+
+class FlatNode:
+    """
+    This class is the base of the views of the nodes of a FlatTree. Each
+    opcode has its own subclass, which has the same fields as the original
+    class. Fields that are expressions are views as well. The accept method
+    of the subclass is the accept method of the original class, so visitors
+    cannot tell a view from an expression.
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @staticmethod
+    def child_getter(k):
+        """
+        Returns a function that reads the k-th sub-expression of a view.
+        """
+        if k == 0:
+            def get(view):
+                tree = view.tree
+                i = tree.left[view.index]
+                return tree.views[tree.op[i]](tree, i)
+        elif k == 1:
+            def get(view):
+                tree = view.tree
+                i = tree.right[view.index]
+                return tree.views[tree.op[i]](tree, i)
+        else:
+            def get(view):
+                tree = view.tree
+                i = view.index - 1
+                return tree.views[tree.op[i]](tree, i)
+        return get
+
+    @staticmethod
+    def const_getter(k):
+        """
+        Returns a function that reads the k-th constant of a view.
+        """
+        def get(view):
+            tree = view.tree
+            return tree.consts[tree.data[view.index]][k]
+        return get
+
+
+# Visitor.py imports this module; importing it last lets either module be
+# imported first. The visitors are only used in the doctests above.
+from Visitor import *
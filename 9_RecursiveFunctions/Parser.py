@@ -1,7 +1,12 @@
+import os
 import sys
+import bisect
+import hashlib
+import operator
+from collections import OrderedDict
 
 from Expression import *
-from Lexer import Token, TokenType
+from Lexer import Token, TokenType, TokenBuffer, MASTER_REGEX, RegexLexer
 
 """
 This file implements a parser for SML with anonymous functions. The grammar is
@@ -32,13 +37,74 @@ References:
     see https://www.engr.mun.ca/~theo/Misc/exp_parsing.htm#classic
 """
 
+class TokenStream:
+    """
+    This class reads tokens on demand from a token generator, such as
+    Lexer.tokens(). It only keeps the last 'capacity' tokens, in a ring buffer.
+    Thus, the memory used to store tokens does not depend on the size of the
+    input. Tokens are indexed as in a list, but an index can only refer to one
+    of the last tokens read. As the length of the stream is not known in
+    advance, indices past the end of the input give an EOF token.
+
+    >>> tks = [Token('1', TokenType.NUM), Token('+', TokenType.ADD)]
+    >>> tks += [Token('2', TokenType.NUM)]
+    >>> stream = TokenStream(tks, capacity=2)
+    >>> stream[0].text, stream[1].text, stream[2].text, stream[3].kind.name
+    ('1', '+', '2', 'EOF')
+
+    >>> stream[0]
+    Traceback (most recent call last):
+    IndexError: token 0 was discarded from the stream
+    """
+
+    def __init__(self, tokens, capacity=8):
+        self.tokens = iter(tokens)
+        self.capacity = capacity
+        self.ring = capacity * [None]
+        self.first = 0  # The index of the oldest token in the ring buffer.
+        self.end = 0  # The index of the next token that will be read.
+        self.eof = Token("", TokenType.EOF)
+
+    def __getitem__(self, i):
+        while i >= self.end:
+            token = next(self.tokens, None)
+            if token is None:
+                return self.eof
+            if self.end - self.first == self.capacity:
+                self.first += 1
+            self.ring[self.end % self.capacity] = token
+            self.end += 1
+        if i < self.first:
+            raise IndexError(f"token {i} was discarded from the stream")
+        return self.ring[i % self.capacity]
+
+
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, streaming=False):
         """
         Initializes the parser. The parser keeps track of the list of tokens
-        and the current token. For instance:
+        and the current token. If streaming is True, then the tokens are not
+        copied into a list. Instead, they are read on demand, through a
+        TokenStream, which keeps only the last few tokens in memory. Thus,
+        parsing can start before the whole input is scanned. The tokens
+        can also be a TokenBuffer, which is used as it is:
+        self.tokens.kind(i) and self.tokens.text(i) then read the i-th
+        token without creating Token objects. For instance:
+
+        >>> parser = Parser([Token('1', TokenType.NUM)], streaming=True)
+        >>> parser.tokens[0].text, parser.tokens[1].kind.name
+        ('1', 'EOF')
+
+        >>> parser = Parser(TokenBuffer("fn x => x"))
+        >>> len(parser.tokens), parser.tokens.kind(2)
+        (4, <TokenType.ARW: 219>)
         """
-        self.tokens = list(tokens)
+        if streaming:
+            self.tokens = TokenStream(tokens)
+        elif isinstance(tokens, TokenBuffer):
+            self.tokens = tokens
+        else:
+            self.tokens = list(tokens)
         self.cur_token_idx = 0 # This is just a suggestion!
         # TODO: you might want to implement more stuff in the initializer :)
 
@@ -291,4 +357,632 @@ class Parser:
         4
         """
         # TODO: implement this method.
-        return None
\ No newline at end of file
+        return None
+
+
+class StackParser(Parser):
+    """
+    This parser recognizes the same grammar as Parser, and builds the same
+    expression trees, but it does not use recursion. Instead, it keeps an
+    explicit stack of frames. Each frame is a construct that is still open,
+    such as "fn x => _", "if c then _ else _", "( _ )" or "e + _". The parser
+    alternates between two phases:
+
+    1. shift: reads the tokens that open new constructs, pushing one frame for
+       each of them, until it finds an atom (a variable, number or boolean).
+    2. reduce: pops frames, plugging the expression built so far into each of
+       them, until it finds a frame that still needs more tokens.
+
+    Each token is read once, and each frame is pushed and popped once. Thus,
+    the parser runs in linear time and memory, and the depth of nesting is
+    bounded only by memory, not by sys.getrecursionlimit(). Examples:
+
+    >>> n = 100000
+    >>> tks = [Token('(', TokenType.LPR)] * n + [Token('1', TokenType.NUM)]
+    >>> tks += [Token(')', TokenType.RPR)] * n
+    >>> StackParser(tks).parse().num
+    1
+
+    >>> fn = [Token('fn', TokenType.FNX), Token('x', TokenType.VAR)]
+    >>> tks = (fn + [Token('=>', TokenType.ARW)]) * n
+    >>> exp = StackParser(tks + [Token('x', TokenType.VAR)]).parse()
+    >>> depth = 0
+    >>> while isinstance(exp, Fn):
+    ...     exp, depth = exp.body, depth + 1
+    >>> depth, exp.identifier
+    (100000, 'x')
+
+    >>> let = [Token('let', TokenType.LET), Token('val', TokenType.VAL)]
+    >>> let += [Token('v', TokenType.VAR), Token('=', TokenType.EQL)]
+    >>> let += [Token('1', TokenType.NUM), Token('in', TokenType.INX)]
+    >>> tks = let * n + [Token('v', TokenType.VAR), Token('mod', TokenType.MOD)]
+    >>> tks += [Token('2', TokenType.NUM)] + [Token('end', TokenType.END)] * n
+    >>> exp = StackParser(tks).parse()
+    >>> for _ in range(n - 1):
+    ...     exp = exp.exp_body
+    >>> type(exp.exp_body).__name__, exp.exp_body.right.num
+    ('Mod', 2)
+
+    >>> t0 = Token('let', TokenType.LET)
+    >>> t1 = Token('fun', TokenType.FUN)
+    >>> t2 = Token('f', TokenType.VAR)
+    >>> t3 = Token('v', TokenType.VAR)
+    >>> t4 = Token('=', TokenType.EQL)
+    >>> t5 = Token('v', TokenType.VAR)
+    >>> t6 = Token('in', TokenType.INX)
+    >>> t7 = Token('f', TokenType.VAR)
+    >>> t8 = Token('2', TokenType.NUM)
+    >>> t9 = Token('end', TokenType.END)
+    >>> exp = StackParser([t0, t1, t2, t3, t4, t5, t6, t7, t8, t9]).parse()
+    >>> exp.identifier, exp.exp_def.name, exp.exp_def.formal
+    ('f', 'f', 'v')
+    >>> type(exp.exp_body).__name__, exp.exp_body.actual.num
+    ('App', 2)
+
+    The parser reads each token through kind() and text(). Thus, it can also
+    parse a TokenBuffer, without creating Token objects:
+
+    >>> exp = StackParser(TokenBuffer("let val x = 2 in x * x end")).parse()
+    >>> exp.identifier, type(exp.exp_body).__name__, exp.exp_def.num
+    ('x', 'Mul', 2)
+    """
+
+    # The kinds of expressions that the shift phase might be looking for:
+    FN_EXP, IF_EXP, UNARY_EXP, VAL_TK = range(4)
+
+    # The precedence and the expression built by each binary operator. All
+    # these operators are left-associative:
+    BINARY = {
+        TokenType.ORX: (1, Or),
+        TokenType.AND: (2, And),
+        TokenType.EQL: (3, Eql),
+        TokenType.LEQ: (4, Leq),
+        TokenType.LTH: (4, Lth),
+        TokenType.ADD: (5, Add),
+        TokenType.SUB: (5, Sub),
+        TokenType.MUL: (6, Mul),
+        TokenType.DIV: (6, Div),
+        TokenType.MOD: (6, Mod),
+    }
+
+    # The tokens that can start a val_tk:
+    ATOMS = {TokenType.VAR, TokenType.LPR, TokenType.NUM, TokenType.TRU,
+             TokenType.FLS}
+
+    def read_tokens(self):
+        """
+        Sets self.kinds, the list with the kind of each token, and text_at(i),
+        which reads the text of the i-th token. The kinds of a TokenBuffer are
+        decoded from its array in a single pass, and the texts are sliced from
+        the source only when the parser asks for them. Thus, no Token object
+        is created. A TokenStream cannot be copied into lists; hence, its
+        tokens are read one at a time.
+        """
+        tokens = self.tokens
+        if isinstance(tokens, TokenBuffer):
+            self.kinds = list(map(TokenBuffer.KINDS.__getitem__, tokens.kinds))
+            self.text_at = tokens.text
+        elif isinstance(tokens, TokenStream):
+            self.kind = lambda: tokens[self.cur_token_idx].kind
+            self.text_at = lambda i: tokens[i].text
+        else:
+            self.kinds = [token.kind for token in tokens]
+            self.text_at = [token.text for token in tokens].__getitem__
+
+    def kind(self):
+        """
+        Returns the kind of the current token, or EOF if all the tokens have
+        been read.
+        """
+        try:
+            return self.kinds[self.cur_token_idx]
+        except IndexError:
+            return TokenType.EOF
+
+    def text(self):
+        """
+        Returns the text of the current token, or "" if all the tokens have
+        been read.
+        """
+        try:
+            return self.text_at(self.cur_token_idx)
+        except IndexError:
+            return ""
+
+    def expect(self, kind):
+        """
+        Consumes the current token, which must have the given kind.
+        """
+        if self.kind() != kind:
+            sys.exit(f"Parse error: expected {kind.name}, found {self.text()!r}")
+        self.cur_token_idx += 1
+
+    def var(self):
+        """
+        Consumes the current token, which must be a variable, and returns its
+        name.
+        """
+        name = self.text()
+        self.expect(TokenType.VAR)
+        return name
+
+    def parse(self):
+        self.read_tokens()
+        stack = []
+        goal = StackParser.FN_EXP
+        while True:
+            exp = self.shift(goal, stack)
+            goal = None
+            while goal is None:
+                if not stack:
+                    self.expect(TokenType.EOF)
+                    return exp
+                exp, goal = self.reduce(stack.pop(), exp, stack)
+
+    def enter_fn_exp(self, stack):
+        """
+        This method is called whenever the parser starts reading a fn_exp.
+        Subclasses can override it to reuse expressions built before: in this
+        case, the method moves cur_token_idx past the tokens of the expression,
+        and returns it. By default, it returns None, and nothing is reused.
+        """
+        return None
+
+    def shift(self, goal, stack):
+        """
+        Reads the tokens that start an expression of the kind 'goal', pushing
+        a frame for each construct that they open, and returns the first atom.
+        """
+        while True:
+            kind = self.kind()
+            if goal == StackParser.FN_EXP:
+                exp = self.enter_fn_exp(stack)
+                if exp is not None:
+                    return exp
+                if kind == TokenType.FNX:
+                    self.cur_token_idx += 1
+                    formal = self.var()
+                    self.expect(TokenType.ARW)
+                    stack.append(("fn", formal))
+                    continue
+                goal = StackParser.IF_EXP
+            if goal == StackParser.IF_EXP:
+                if kind == TokenType.IFX:
+                    self.cur_token_idx += 1
+                    stack.append(("if_cond",))
+                    continue
+                stack.append(("binary", 1))
+                goal = StackParser.UNARY_EXP
+            if goal == StackParser.UNARY_EXP:
+                if kind == TokenType.NOT:
+                    self.cur_token_idx += 1
+                    stack.append(("not",))
+                    continue
+                if kind == TokenType.NEG:
+                    self.cur_token_idx += 1
+                    stack.append(("neg",))
+                    continue
+                if kind == TokenType.LET:
+                    self.cur_token_idx += 1
+                    if self.kind() == TokenType.FUN:
+                        self.cur_token_idx += 1
+                        name = self.var()
+                        formal = self.var()
+                        self.expect(TokenType.EQL)
+                        stack.append(("fun_def", name, formal))
+                    else:
+                        self.expect(TokenType.VAL)
+                        name = self.var()
+                        self.expect(TokenType.EQL)
+                        stack.append(("let_def", name))
+                    goal = StackParser.FN_EXP
+                    continue
+                stack.append(("app", None))
+                goal = StackParser.VAL_TK
+            if kind == TokenType.VAR:
+                exp = Var(self.text())
+            elif kind == TokenType.NUM:
+                exp = Num(int(self.text()))
+            elif kind == TokenType.TRU:
+                exp = Bln(True)
+            elif kind == TokenType.FLS:
+                exp = Bln(False)
+            elif kind == TokenType.LPR:
+                self.cur_token_idx += 1
+                stack.append(("paren",))
+                goal = StackParser.FN_EXP
+                continue
+            else:
+                sys.exit(f"Parse error: unexpected token {self.text()!r}")
+            self.cur_token_idx += 1
+            return exp
+
+    def reduce(self, frame, exp, stack):
+        """
+        Plugs exp into the open construct 'frame'. Returns the resulting
+        expression, if the construct is complete. Otherwise, pushes the frames
+        that the construct still needs, and returns the kind of expression
+        that must be read next.
+        """
+        tag = frame[0]
+        if tag == "app":
+            if frame[1] is not None:
+                exp = App(frame[1], exp)
+            if self.kind() in StackParser.ATOMS:
+                stack.append(("app", exp))
+                return None, StackParser.VAL_TK
+            return exp, None
+        elif tag == "binary":
+            op = StackParser.BINARY.get(self.kind())
+            if op is not None and op[0] >= frame[1]:
+                self.cur_token_idx += 1
+                stack.append(("operator", frame[1], exp, op[1]))
+                stack.append(("binary", op[0] + 1))
+                return None, StackParser.UNARY_EXP
+            return exp, None
+        elif tag == "operator":
+            # Other operators of the same precedence might follow:
+            stack.append(("binary", frame[1]))
+            return frame[3](frame[2], exp), None
+        elif tag == "not":
+            return Not(exp), None
+        elif tag == "neg":
+            return Neg(exp), None
+        elif tag == "paren":
+            self.expect(TokenType.RPR)
+            return exp, None
+        elif tag == "fn":
+            return Fn(frame[1], exp), None
+        elif tag == "if_cond":
+            self.expect(TokenType.THN)
+            stack.append(("if_then", exp))
+            return None, StackParser.FN_EXP
+        elif tag == "if_then":
+            self.expect(TokenType.ELS)
+            stack.append(("if_else", frame[1], exp))
+            return None, StackParser.FN_EXP
+        elif tag == "if_else":
+            return IfThenElse(frame[1], frame[2], exp), None
+        elif tag == "let_def":
+            self.expect(TokenType.INX)
+            stack.append(("let_body", frame[1], exp))
+            return None, StackParser.FN_EXP
+        elif tag == "fun_def":
+            self.expect(TokenType.INX)
+            function = Fun(frame[1], frame[2], exp)
+            stack.append(("let_body", frame[1], function))
+            return None, StackParser.FN_EXP
+        elif tag == "let_body":
+            self.expect(TokenType.END)
+            return Let(frame[1], frame[2], exp), None
+
+
+class IncrementalParser(StackParser):
+    """
+    This parser keeps the source text, its tokens and its expression tree, so
+    that, after a small edit in the text, it can rebuild the tree without
+    lexing and parsing the whole source again:
+
+    1. Lexing restarts two tokens before the edit, and stops as soon as a new
+       token starts where an old token, after the edit, used to start. From
+       there on, the text is the same, and so are the tokens.
+    2. While parsing, the parser builds a tree of regions: each fn_exp is a
+       tuple (offset, exp, length, children), where offset is the index of
+       its first token, relative to the region that contains it, length is
+       its number of tokens, and children are the regions of the fn_exps
+       nested in it. A fn_exp is parsed the same way in every context. Thus,
+       if none of its tokens changed (nor the token that follows it), then
+       the parser reuses its region, and skips its tokens.
+
+    Hence, only the fn_exps that enclose the edit are parsed again, and the
+    other expressions are the same objects in the old and in the new tree.
+    Regions store relative positions, and the offsets of the tokens after
+    the edit are stored as distances to the end of the text. Thus, nothing
+    needs to be shifted after an edit. Example:
+
+    >>> p = IncrementalParser("let val x = 1 + 2 in x * (3 - x) end")
+    >>> old = p.tree
+    >>> new = p.edit(12, 1, "10")
+    >>> p.source
+    'let val x = 10 + 2 in x * (3 - x) end'
+    >>> new.exp_def.left.num, new.exp_body is old.exp_body
+    (10, True)
+
+    >>> old = new
+    >>> new = p.edit(27, 0, "4 - ")
+    >>> p.source
+    'let val x = 10 + 2 in x * (4 - 3 - x) end'
+    >>> new.exp_body.right.left.left.num, new.exp_def is old.exp_def
+    (4, True)
+
+    Edits might join or split tokens:
+
+    >>> p = IncrementalParser("if x < y then x else y")
+    >>> type(p.edit(6, 0, "=").cond).__name__
+    'Leq'
+    >>> type(p.edit(5, 2, "").cond).__name__
+    'App'
+    """
+
+    # Sorts regions by their offsets:
+    OFFSET = operator.itemgetter(0)
+
+    def __init__(self, source):
+        super().__init__([])
+        self.source = source
+        self.starts = None
+        self.root = None
+        self.tree = self.edit(0, 0, "")
+
+    def edit(self, offset, removed, inserted):
+        """
+        Replaces the 'removed' characters at 'offset' with the text
+        'inserted', and returns the new expression tree. If the new text does
+        not lex or parse, then this method exits, like the other parsers. The
+        parser keeps the new text, so that further edits can fix it.
+        """
+        size = len(self.source)
+        source = self.source[:offset] + inserted + self.source[offset + removed:]
+        tokens, starts, root = self.tokens, self.starts, self.root
+        # If lexing or parsing fails, then the next edit starts over:
+        self.source, self.starts, self.root = source, None, None
+        if starts is None:
+            tokens, starts, self.gap = [], [], 0
+        # Re-lex from two tokens before the edit, as an edit might change the
+        # token that precedes it, e.g., '<' + '=' becomes '<='.
+        first = max(self.count(starts, size, offset) - 2, 0)
+        self.move_gap(starts, size, first)
+        pos = size - starts[first] if first > 0 else 0
+        last = bisect.bisect_left(starts, offset + removed - size, first,
+                                  len(starts), key=operator.neg)
+        new_tokens, new_starts = [], []
+        kinds = TokenType.__members__
+        end = len(source)
+        for match in MASTER_REGEX.finditer(source, pos):
+            start = match.start()
+            if start >= offset + len(inserted):
+                # Tokens after the edit keep their distances to the end:
+                while last < len(starts) and end - starts[last] < start:
+                    last += 1
+                if last < len(starts) and end - starts[last] == start:
+                    break
+            name = match.lastgroup
+            if name == "WSP" or name == "COM" or name == "NLN":
+                continue
+            if name == "ERR":
+                sys.exit(f"Lexical error: {match.group()!r}")
+            text = match.group()
+            if name == "VAR":
+                text = sys.intern(text)
+            new_tokens.append(Token(text, kinds[name]))
+            new_starts.append(end - start)
+        else:
+            last = len(starts)
+        tokens[first:last] = new_tokens
+        starts[first:last] = new_starts
+        self.tokens, self.starts = tokens, starts
+        self.damage = (first, last, len(new_tokens))
+        self.path = [(0, root)] if root is not None else []
+        self.open = [(0, [])]
+        self.cur_token_idx = 0
+        self.tree = self.parse()
+        self.root = self.open[0][1][0]
+        return self.tree
+
+    def count(self, starts, size, offset):
+        """
+        Returns the number of tokens that start at or before 'offset'. The
+        tokens before self.gap store their offsets; the others store their
+        distances to the end of a text with 'size' characters.
+        """
+        gap = self.gap
+        if gap > 0 and starts[gap - 1] > offset:
+            return bisect.bisect_right(starts, offset, 0, gap)
+        return bisect.bisect_right(starts, offset - size, gap, len(starts),
+                                   key=operator.neg)
+
+    def move_gap(self, starts, size, gap):
+        """
+        Converts offsets into distances to the end of the text, or vice-versa,
+        so that only the tokens before 'gap' store their offsets.
+        """
+        for i in range(min(gap, self.gap), max(gap, self.gap)):
+            starts[i] = size - starts[i]
+        self.gap = gap
+
+    def find_region(self, begin):
+        """
+        Returns the region, in the old tree, of the fn_exp that starts at the
+        token 'begin', if the edit did not change any of its tokens, nor the
+        token that follows it.
+        """
+        first, last, size = self.damage
+        if begin < first:
+            old = begin
+        elif begin >= first + size:
+            old = begin - size + last - first
+        else:
+            return None
+        # The parser looks for regions from left to right. Thus, the path
+        # from the root to the last region found only needs to move forward:
+        path = self.path
+        while path and old >= path[-1][0] + path[-1][1][2]:
+            path.pop()
+        if not path:
+            return None
+        base, region = path[-1]
+        while base < old:
+            children = region[3]
+            i = bisect.bisect_right(children, old - base,
+                                    key=IncrementalParser.OFFSET) - 1
+            if i < 0:
+                return None
+            region = children[i]
+            base += region[0]
+            if old >= base + region[2]:
+                return None
+            path.append((base, region))
+        if old < first <= old + region[2]:
+            return None
+        return region
+
+    def enter_fn_exp(self, stack):
+        begin = self.cur_token_idx
+        region = self.find_region(begin)
+        parent, children = self.open[-1]
+        if region is not None:
+            _, exp, length, nested = region
+            children.append((begin - parent, exp, length, nested))
+            self.cur_token_idx = begin + length
+            return exp
+        stack.append(("region", begin))
+        self.open.append((begin, []))
+        return None
+
+    def reduce(self, frame, exp, stack):
+        if frame[0] == "region":
+            begin, nested = self.open.pop()
+            parent, children = self.open[-1]
+            length = self.cur_token_idx - begin
+            children.append((begin - parent, exp, length, nested))
+            return exp, None
+        return super().reduce(frame, exp, stack)
+
+
+class AstCache:
+    """
+    This class keeps parsed programs in a directory, so that running the same
+    program again does not need the lexer and the parser. Each program is a
+    file, named after a hash of its source text, that contains the tree in
+    the binary format of FlatTree.to_bytes. Loading a program takes a single
+    read. The cache keeps at most max_entries files, with at most max_bytes
+    in total, and evicts the least recently used files first. Recency is also
+    recorded in the modification time of the files, so that it survives
+    across runs. Example:
+
+    >>> import tempfile
+    >>> tmp = tempfile.TemporaryDirectory()
+    >>> cache = AstCache(tmp.name, max_entries=2)
+    >>> e = cache.parse("let val x = 2 in x * x end")
+    >>> e = cache.parse("let val x = 2 in x * x end")
+    >>> cache.hits, cache.misses, type(e).__name__, e.exp_def.num
+    (1, 1, 'Let', 2)
+
+    >>> _ = cache.parse("1")
+    >>> _ = cache.parse("2")
+    >>> len(cache), cache.load("let val x = 2 in x * x end") is None
+    (2, True)
+    >>> tmp.cleanup()
+    """
+
+    SUFFIX = ".ast"
+
+    def __init__(self, directory, max_entries=1024, max_bytes=64 << 20,
+                 parser=StackParser, lexer=RegexLexer):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.parser = parser
+        self.lexer = lexer
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        # The size of each file, from the least to the most recently used:
+        files = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(AstCache.SUFFIX):
+                stat = entry.stat()
+                files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        self.sizes = OrderedDict((name, size) for _, name, size in sorted(files))
+        self.total = sum(self.sizes.values())
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def key(self, source):
+        """
+        Returns the name of the file that caches the program 'source'.
+        """
+        digest = hashlib.blake2b(source.encode(), digest_size=16).hexdigest()
+        return digest + AstCache.SUFFIX
+
+    def load(self, source):
+        """
+        Returns the FlatTree of 'source', if it is in the cache, or None
+        otherwise. Files that cannot be read, or parsed, are discarded. The
+        file is looked up on disk, so entries written by other processes, or
+        by other AstCache objects, are found too:
+
+        >>> import tempfile
+        >>> tmp = tempfile.TemporaryDirectory()
+        >>> reader, writer = AstCache(tmp.name), AstCache(tmp.name)
+        >>> _ = writer.parse("1 + 2")
+        >>> reader.load("1 + 2").root.left.num, len(reader)
+        (1, 1)
+        >>> tmp.cleanup()
+        """
+        name = self.key(source)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            tree = FlatTree.from_bytes(data)
+            os.utime(path)
+        except FileNotFoundError:
+            # The file may have been evicted by another process:
+            self.total -= self.sizes.pop(name, 0)
+            return None
+        except (OSError, ValueError):
+            self.remove(name)
+            return None
+        # The entry becomes the most recently used. Its size is read again,
+        # as another process may have written or replaced the file:
+        self.total += len(data) - self.sizes.pop(name, 0)
+        self.sizes[name] = len(data)
+        self.evict()
+        return tree
+
+    def store(self, source, tree):
+        """
+        Writes the FlatTree of 'source' into the cache, and then evicts the
+        least recently used files, while the cache is too large.
+        """
+        name = self.key(source)
+        data = tree.to_bytes()
+        path = os.path.join(self.directory, name)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as file:
+            file.write(data)
+        os.replace(temp, path)
+        self.total += len(data) - self.sizes.pop(name, 0)
+        self.sizes[name] = len(data)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used files, while the cache is too large.
+        """
+        while self.sizes and (len(self.sizes) > self.max_entries
+                              or self.total > self.max_bytes):
+            self.remove(next(iter(self.sizes)))
+
+    def remove(self, name):
+        self.total -= self.sizes.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def parse(self, source):
+        """
+        Returns the expression tree of the program 'source'. It comes from
+        the cache, if possible. Otherwise, it is parsed, and then cached.
+        """
+        tree = self.load(source)
+        if tree is not None:
+            self.hits += 1
+            return tree.expression()
+        self.misses += 1
+        exp = self.parser(self.lexer(source).tokens()).parse()
+        self.store(source, FlatTree(exp))
+        return exp
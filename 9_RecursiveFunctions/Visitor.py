@@ -1,7 +1,16 @@
 import sys
+import copy
+from array import array
 from abc import ABC, abstractmethod
+import weakref
+from collections import OrderedDict
 from Expression import *
 
+# The methods left as exercises raise NotImplementedException. That name is
+# an alias of NotImplementedError, so an unfinished method raises an error
+# that the benchmarks can tell apart from a NameError in the code.
+NotImplementedException = NotImplementedError
+
 
 class Visitor(ABC):
     """
@@ -137,6 +146,20 @@ class RecFunction(Function):
         return f"Fun {self.name}({self.formal})"
 
 
+class TailCall:
+    """
+    This class represents a call in tail position that was not run yet. The
+    CompileVisitor returns it from a function body, so that the caller runs
+    the function, instead of growing the Python stack.
+    """
+
+    __slots__ = ("function", "actual")
+
+    def __init__(self, function, actual):
+        self.function = function
+        self.actual = actual
+
+
 class EvalVisitor(Visitor):
     """
     The EvalVisitor class evaluates logical and arithmetic expressions. The
@@ -287,4 +310,2212 @@ class EvalVisitor(Visitor):
         4
         """
         # TODO: Implement this method.
-        raise NotImplementedException
\ No newline at end of file
+        raise NotImplementedException
+
+class CompileVisitor(Visitor):
+    """
+    The CompileVisitor translates each expression, once, into a Python closure
+    that takes an environment and returns the value of that expression. Thus,
+    the cost of dispatching through 'accept' and 'visit_*' is paid only when
+    the tree is compiled, and not every time a function body runs. Function
+    bodies are compiled the first time they are applied, and the closures are
+    cached, so that recursive calls reuse them. The values are the same as in
+    the EvalVisitor: numbers, booleans, Function and RecFunction.
+
+    Calls in tail position do not grow the Python stack. The inherited
+    attribute tells if the expression is in tail position, i.e., if its value
+    is the value of the enclosing function body. Applications in tail position
+    return a TailCall instead of running the function, and the application
+    that called the enclosing body runs it in a loop.
+
+    Our language has no side effects, so applying a named function to the
+    same number or boolean always yields the same value. If memo_size is
+    positive, each RecFunction keeps a cache of up to memo_size results,
+    indexed by the actual parameter, and discards the least recently used
+    result when the cache is full. Only numbers and booleans are cached: each
+    call must build a new function value, which Eql tells apart from the
+    values of other calls. The fields 'hits' and 'misses' count the
+    lookups in these caches. The caches are weakly keyed by the RecFunction:
+    once a function value is no longer reachable, its cache goes away too.
+
+    Examples:
+    >>> e0 = Let('v', Add(Num(40), Num(2)), Mul(Var('v'), Var('v')))
+    >>> e1 = Not(Eql(e0, Num(1764)))
+    >>> cv = CompileVisitor()
+    >>> run = e1.accept(cv, False)
+    >>> run({})
+    False
+
+    >>> e0 = Let('v', Add(Num(40), Num(2)), Sub(Var('v'), Num(2)))
+    >>> e1 = Lth(e0, Var('x'))
+    >>> CompileVisitor().evaluate(e1, {'x': 41})
+    True
+
+    >>> body = IfThenElse(Leq(Var('n'), Num(1)), Num(1),\
+            Mul(Var('n'), App(Var('f'), Sub(Var('n'), Num(1)))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(Var('f'), Num(10)))
+    >>> CompileVisitor().evaluate(e0, {})
+    3628800
+
+    >>> e0 = Let('k', Fn('x', Fn('y', Var('x'))), App(App(Var('k'), Num(3)),\
+            Bln(True)))
+    >>> CompileVisitor().evaluate(e0, {})
+    3
+
+    >>> print(CompileVisitor().evaluate(Fun('f', 'v', Var('v')), {}))
+    Fun f(v)
+
+    >>> body = Fn('a', IfThenElse(Eql(Var('n'), Num(0)), Var('a'),\
+            App(App(Var('f'), Sub(Var('n'), Num(1))), Add(Var('a'), Var('n')))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(App(Var('f'), Num(100000)),\
+            Num(0)))
+    >>> CompileVisitor().evaluate(e0, {})
+    5000050000
+
+    >>> body = IfThenElse(Lth(Var('n'), Num(2)), Var('n'),\
+            Add(App(Var('f'), Sub(Var('n'), Num(1))),\
+                App(Var('f'), Sub(Var('n'), Num(2)))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(Var('f'), Num(90)))
+    >>> cv = CompileVisitor(memo_size=100)
+    >>> cv.evaluate(e0, {})
+    2880067194370816120
+    >>> cv.hits, cv.misses
+    (88, 91)
+    >>> import gc; _ = gc.collect()
+    >>> len(cv.caches)
+    0
+
+    >>> mk = App(Var('mk'), Num(1))
+    >>> e0 = Let('mk', Fun('mk', 'n', Fn('x', Var('n'))), Eql(mk, mk))
+    >>> CompileVisitor(memo_size=10).evaluate(e0, {})
+    False
+    """
+
+    def __init__(self, memo_size=0):
+        self.programs = {}
+        self.bodies = {}
+        self.memo_size = memo_size
+        self.caches = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, exp):
+        """
+        Returns the closure that evaluates 'exp'. Closures are cached per
+        expression node, so each node is compiled at most once.
+        """
+        code = self.programs.get(exp)
+        if code is None:
+            code = exp.accept(self, False)
+            self.programs[exp] = code
+        return code
+
+    def compile_body(self, exp):
+        """
+        Returns the closure that evaluates 'exp' as the body of a function,
+        i.e., in tail position. It may return a TailCall.
+        """
+        code = self.bodies.get(exp)
+        if code is None:
+            code = exp.accept(self, True)
+            self.bodies[exp] = code
+        return code
+
+    def evaluate(self, exp, env):
+        return self.compile(exp)(env)
+
+    def cache(self, fval, pval):
+        """
+        Returns the cache of results of fval, and the key of pval in it, or
+        (None, None) if the application of fval to pval is not memoized.
+        """
+        if type(pval) not in (int, bool) or not isinstance(fval, RecFunction):
+            return None, None
+        cache = self.caches.get(fval)
+        if cache is None:
+            cache = OrderedDict()
+            self.caches[fval] = cache
+        # The type is part of the key, because 1 == True in Python.
+        return cache, (pval, type(pval))
+
+    def remember(self, cache, key, val):
+        cache[key] = val
+        if len(cache) > self.memo_size:
+            cache.popitem(last=False)
+
+    def visit_var(self, exp, tail):
+        name = exp.identifier
+
+        def run(env):
+            if name in env:
+                return env[name]
+            sys.exit("Def error")
+        return run
+
+    def visit_bln(self, exp, tail):
+        value = exp.bln
+        return lambda env: value
+
+    def visit_num(self, exp, tail):
+        value = exp.num
+        return lambda env: value
+
+    def visit_eql(self, exp, tail):
+        left = exp.left.accept(self, False)
+        right = exp.right.accept(self, False)
+
+        def run(env):
+            val_left = left(env)
+            val_right = right(env)
+            if type(val_left) == type(val_right):
+                return val_left == val_right
+            sys.exit("Type error")
+        return run
+
+    def logic(self, exp, tail, short):
+        """
+        Compiles the boolean connectives. The right operand is evaluated only
+        if the left operand is not 'short', i.e., False for 'and' and True for
+        'or'.
+        """
+        left = exp.left.accept(self, False)
+        right = exp.right.accept(self, False)
+
+        def run(env):
+            val = left(env)
+            if type(val) is not bool:
+                sys.exit("Type error")
+            if val == short:
+                return val
+            val = right(env)
+            if type(val) is not bool:
+                sys.exit("Type error")
+            return val
+        return run
+
+    def visit_and(self, exp, tail):
+        return self.logic(exp, tail, False)
+
+    def visit_or(self, exp, tail):
+        return self.logic(exp, tail, True)
+
+    def arith(self, exp, tail, op):
+        """
+        Compiles a binary operation on numbers. Both operands must be integers
+        (booleans are not numbers in our language).
+        """
+        left = exp.left.accept(self, False)
+        right = exp.right.accept(self, False)
+
+        def run(env):
+            val_left = left(env)
+            val_right = right(env)
+            if type(val_left) is int and type(val_right) is int:
+                return op(val_left, val_right)
+            sys.exit("Type error")
+        return run
+
+    def visit_add(self, exp, tail):
+        return self.arith(exp, tail, int.__add__)
+
+    def visit_sub(self, exp, tail):
+        return self.arith(exp, tail, int.__sub__)
+
+    def visit_mul(self, exp, tail):
+        return self.arith(exp, tail, int.__mul__)
+
+    def visit_div(self, exp, tail):
+        return self.arith(exp, tail, int.__floordiv__)
+
+    def visit_mod(self, exp, tail):
+        return self.arith(exp, tail, int.__mod__)
+
+    def visit_leq(self, exp, tail):
+        return self.arith(exp, tail, int.__le__)
+
+    def visit_lth(self, exp, tail):
+        return self.arith(exp, tail, int.__lt__)
+
+    def visit_neg(self, exp, tail):
+        sub = exp.exp.accept(self, False)
+
+        def run(env):
+            val = sub(env)
+            if type(val) is int:
+                return -val
+            sys.exit("Type error")
+        return run
+
+    def visit_not(self, exp, tail):
+        sub = exp.exp.accept(self, False)
+
+        def run(env):
+            val = sub(env)
+            if type(val) is bool:
+                return not val
+            sys.exit("Type error")
+        return run
+
+    def visit_let(self, exp, tail):
+        name = exp.identifier
+        exp_def = exp.exp_def.accept(self, False)
+        exp_body = exp.exp_body.accept(self, tail)
+
+        def run(env):
+            new_env = dict(env)
+            new_env[name] = exp_def(env)
+            return exp_body(new_env)
+        return run
+
+    def visit_ifThenElse(self, exp, tail):
+        cond = exp.cond.accept(self, False)
+        e0 = exp.e0.accept(self, tail)
+        e1 = exp.e1.accept(self, tail)
+
+        def run(env):
+            val = cond(env)
+            if type(val) is not bool:
+                sys.exit("Type error")
+            return e0(env) if val else e1(env)
+        return run
+
+    def visit_fn(self, exp, tail):
+        formal = exp.formal
+        body = exp.body
+        return lambda env: Function(formal, body, env)
+
+    def visit_fun(self, exp, tail):
+        name = exp.name
+        formal = exp.formal
+        body = exp.body
+        return lambda env: RecFunction(name, formal, body, env)
+
+    def visit_app(self, exp, tail):
+        function = exp.function.accept(self, False)
+        actual = exp.actual.accept(self, False)
+        bodies = self.bodies
+        compile_body = self.compile_body
+
+        if tail:
+            def run_tail(env):
+                fval = function(env)
+                if not isinstance(fval, Function):
+                    sys.exit("Type error")
+                return TailCall(fval, actual(env))
+            return run_tail
+
+        def run(env):
+            fval = function(env)
+            if not isinstance(fval, Function):
+                sys.exit("Type error")
+            pval = actual(env)
+            while True:
+                new_env = dict(fval.env)
+                new_env[fval.formal] = pval
+                if isinstance(fval, RecFunction):
+                    new_env[fval.name] = fval
+                code = bodies.get(fval.body)
+                if code is None:
+                    code = compile_body(fval.body)
+                val = code(new_env)
+                if type(val) is not TailCall:
+                    return val
+                fval = val.function
+                pval = val.actual
+
+        if not self.memo_size:
+            return run
+
+        def run_memo(env):
+            fval = function(env)
+            if not isinstance(fval, Function):
+                sys.exit("Type error")
+            pval = actual(env)
+            # Only the result of the first call is stored: the calls in tail
+            # position that follow it are looked up, but not remembered.
+            first, first_key = self.cache(fval, pval)
+            cache, key = first, first_key
+            while True:
+                if cache is not None:
+                    if key in cache:
+                        self.hits += 1
+                        cache.move_to_end(key)
+                        val = cache[key]
+                        break
+                    self.misses += 1
+                new_env = dict(fval.env)
+                new_env[fval.formal] = pval
+                if isinstance(fval, RecFunction):
+                    new_env[fval.name] = fval
+                code = bodies.get(fval.body)
+                if code is None:
+                    code = compile_body(fval.body)
+                val = code(new_env)
+                if type(val) is not TailCall:
+                    break
+                fval = val.function
+                pval = val.actual
+                cache, key = self.cache(fval, pval)
+            # Function values are compared by identity, so a cached function
+            # would make two calls return the same value.
+            if first is not None and type(val) in (int, bool):
+                self.remember(first, first_key, val)
+            return val
+        return run_memo
+
+
+class ResolveVisitor(Visitor):
+    """
+    The ResolveVisitor computes the lexical address of every variable. It
+    returns a copy of the expression where each Var bound in the program
+    becomes a ResolvedVar(name, depth, slot), and each Let becomes a
+    ResolvedLet that knows the slot where its value is stored. Variables that
+    are not bound anywhere are kept as they are, so that their evaluation
+    fails with "Def error", like in the EvalVisitor.
+
+    Every function body has a frame: slot 0 points to the frame where the
+    function was created, and the other slots hold the parameter (and the
+    function itself, in the case of named functions) and the values of the
+    let expressions in the body. The inherited attribute is a triple
+    (names, level, size): names maps each visible identifier to its
+    (level, slot) binding, level is the number of enclosing functions, and
+    size is a one-element list with the number of slots of the current frame.
+
+    Example:
+    >>> e = Let('y', Num(2), Fn('x', Add(Var('x'), Var('y'))))
+    >>> r = ResolveVisitor().resolve(e, ['z'])
+    >>> r.slot, r.exp_body.body.left.depth, r.exp_body.body.left.slot
+    (2, 0, 1)
+    >>> r.exp_body.body.right.depth, r.exp_body.body.right.slot
+    (1, 2)
+    """
+
+    def resolve(self, exp, names=()):
+        """
+        Resolves exp in a frame whose slots 1, 2, ... hold the values of the
+        given names.
+        """
+        scope = {name: (0, slot) for slot, name in enumerate(names, 1)}
+        return exp.accept(self, (scope, 0, [len(scope) + 1]))
+
+    def visit_var(self, exp, arg):
+        names, level, _ = arg
+        if exp.identifier in names:
+            bound, slot = names[exp.identifier]
+            return ResolvedVar(exp.identifier, level - bound, slot)
+        return exp
+
+    def visit_bln(self, exp, arg):
+        return exp
+
+    def visit_num(self, exp, arg):
+        return exp
+
+    def binary(self, exp, arg):
+        return type(exp)(exp.left.accept(self, arg),
+                         exp.right.accept(self, arg))
+
+    def unary(self, exp, arg):
+        return type(exp)(exp.exp.accept(self, arg))
+
+    visit_eql = visit_and = visit_or = binary
+    visit_add = visit_sub = visit_mul = visit_div = visit_mod = binary
+    visit_leq = visit_lth = binary
+    visit_neg = visit_not = unary
+
+    def visit_let(self, exp, arg):
+        names, level, size = arg
+        exp_def = exp.exp_def.accept(self, arg)
+        slot = size[0]
+        size[0] += 1
+        names = {**names, exp.identifier: (level, slot)}
+        exp_body = exp.exp_body.accept(self, (names, level, size))
+        return ResolvedLet(exp.identifier, exp_def, exp_body, slot)
+
+    def visit_ifThenElse(self, exp, arg):
+        return IfThenElse(exp.cond.accept(self, arg),
+                          exp.e0.accept(self, arg),
+                          exp.e1.accept(self, arg))
+
+    def visit_fn(self, exp, arg):
+        names, level, _ = arg
+        names = {**names, exp.formal: (level + 1, 1)}
+        body = exp.body.accept(self, (names, level + 1, [2]))
+        return Fn(exp.formal, body)
+
+    def visit_fun(self, exp, arg):
+        names, level, _ = arg
+        # Like in the Prolog rule for applyrec, the name of the function
+        # shadows the parameter, if both are the same.
+        names = {**names, exp.formal: (level + 1, 2), exp.name: (level + 1, 1)}
+        body = exp.body.accept(self, (names, level + 1, [3]))
+        return Fun(exp.name, exp.formal, body)
+
+    def visit_app(self, exp, arg):
+        return App(exp.function.accept(self, arg),
+                   exp.actual.accept(self, arg))
+
+
+class FrameVisitor(Visitor):
+    """
+    The FrameVisitor evaluates expressions produced by the ResolveVisitor. The
+    inherited attribute is a frame: a list whose first element is the parent
+    frame. Reading a variable follows 'depth' parent pointers and then indexes
+    the frame, and creating a function just captures the current frame, so
+    neither operation hashes names or copies environments. Values are the same
+    as in the EvalVisitor: numbers, booleans, Function and RecFunction (whose
+    env is now a frame).
+
+    Like in the CompileVisitor, calls in tail position do not grow the Python
+    stack: visit_app runs function bodies through the method 'tail', which
+    returns the application in tail position as a TailCall, and runs it in a
+    loop.
+
+    Examples:
+    >>> e0 = Let('v', Add(Num(40), Num(2)), Sub(Var('v'), Num(2)))
+    >>> e1 = Lth(e0, Var('x'))
+    >>> FrameVisitor().evaluate(e1, {'x': 41})
+    True
+
+    >>> e0 = Let('w', Num(3), App(Var('f'), Num(1)))
+    >>> e1 = Let('f', Fn('v', Add(Var('v'), Var('w'))), e0)
+    >>> e2 = Let('w', Num(2), e1)
+    >>> FrameVisitor().evaluate(e2, {})
+    3
+
+    >>> body = IfThenElse(Leq(Var('n'), Num(1)), Num(1),\
+            Mul(Var('n'), App(Var('f'), Sub(Var('n'), Num(1)))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(Var('f'), Num(10)))
+    >>> FrameVisitor().evaluate(e0, {})
+    3628800
+
+    >>> e0 = Let('k', Fn('x', Fn('y', Var('x'))), App(App(Var('k'), Num(3)),\
+            Bln(True)))
+    >>> FrameVisitor().evaluate(e0, {})
+    3
+
+    >>> body = Fn('a', IfThenElse(Eql(Var('n'), Num(0)), Var('a'),\
+            App(App(Var('f'), Sub(Var('n'), Num(1))), Add(Var('a'), Var('n')))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(App(Var('f'), Num(100000)),\
+            Num(0)))
+    >>> FrameVisitor().evaluate(e0, {})
+    5000050000
+    """
+
+    def __init__(self):
+        self.resolver = ResolveVisitor()
+        self.trees = {}
+
+    def evaluate(self, exp, env):
+        """
+        Evaluates exp in the environment env, which maps names to values.
+        The resolved copy of exp is cached, so it is computed only once for
+        each set of names in env.
+        """
+        names = tuple(env)
+        tree = self.trees.get((exp, names))
+        if tree is None:
+            tree = self.resolver.resolve(exp, names)
+            self.trees[(exp, names)] = tree
+        return tree.accept(self, [None, *env.values()])
+
+    def visit_var(self, exp, frame):
+        try:
+            depth = exp.depth
+        except AttributeError:
+            sys.exit("Def error")
+        while depth:
+            frame = frame[0]
+            depth -= 1
+        return frame[exp.slot]
+
+    def visit_bln(self, exp, frame):
+        return exp.bln
+
+    def visit_num(self, exp, frame):
+        return exp.num
+
+    def visit_eql(self, exp, frame):
+        val_left = exp.left.accept(self, frame)
+        val_right = exp.right.accept(self, frame)
+        if type(val_left) == type(val_right):
+            return val_left == val_right
+        else:
+            sys.exit("Type error")
+
+    def logic(self, exp, frame, short):
+        val = exp.left.accept(self, frame)
+        if type(val) is not bool:
+            sys.exit("Type error")
+        if val == short:
+            return val
+        val = exp.right.accept(self, frame)
+        if type(val) is not bool:
+            sys.exit("Type error")
+        return val
+
+    def visit_and(self, exp, frame):
+        return self.logic(exp, frame, False)
+
+    def visit_or(self, exp, frame):
+        return self.logic(exp, frame, True)
+
+    def arith(self, exp, frame, op):
+        val_left = exp.left.accept(self, frame)
+        val_right = exp.right.accept(self, frame)
+        if type(val_left) is int and type(val_right) is int:
+            return op(val_left, val_right)
+        sys.exit("Type error")
+
+    def visit_add(self, exp, frame):
+        return self.arith(exp, frame, int.__add__)
+
+    def visit_sub(self, exp, frame):
+        return self.arith(exp, frame, int.__sub__)
+
+    def visit_mul(self, exp, frame):
+        return self.arith(exp, frame, int.__mul__)
+
+    def visit_div(self, exp, frame):
+        return self.arith(exp, frame, int.__floordiv__)
+
+    def visit_mod(self, exp, frame):
+        return self.arith(exp, frame, int.__mod__)
+
+    def visit_leq(self, exp, frame):
+        return self.arith(exp, frame, int.__le__)
+
+    def visit_lth(self, exp, frame):
+        return self.arith(exp, frame, int.__lt__)
+
+    def visit_neg(self, exp, frame):
+        val = exp.exp.accept(self, frame)
+        if type(val) is int:
+            return -val
+        sys.exit("Type error")
+
+    def visit_not(self, exp, frame):
+        val = exp.exp.accept(self, frame)
+        if type(val) is bool:
+            return not val
+        sys.exit("Type error")
+
+    def bind(self, exp, frame):
+        """
+        Evaluates the definition of the let expression exp, and stores its
+        value in the slot of exp.
+        """
+        val = exp.exp_def.accept(self, frame)
+        # Frames grow on demand: each let of a function body has its own
+        # slot, and a let runs at most once per activation of the body.
+        slot = exp.slot
+        if slot >= len(frame):
+            frame.extend([None] * (slot + 1 - len(frame)))
+        frame[slot] = val
+
+    def branch(self, exp, frame):
+        """
+        Evaluates the condition of exp, and returns the branch to be taken.
+        """
+        val = exp.cond.accept(self, frame)
+        if type(val) is not bool:
+            sys.exit("Type error")
+        return exp.e0 if val else exp.e1
+
+    def visit_let(self, exp, frame):
+        self.bind(exp, frame)
+        return exp.exp_body.accept(self, frame)
+
+    def visit_ifThenElse(self, exp, frame):
+        return self.branch(exp, frame).accept(self, frame)
+
+    def visit_fn(self, exp, frame):
+        return Function(exp.formal, exp.body, frame)
+
+    def visit_fun(self, exp, frame):
+        return RecFunction(exp.name, exp.formal, exp.body, frame)
+
+    def tail(self, exp, frame):
+        """
+        Evaluates exp in tail position, i.e., as the body of a function. Lets
+        and conditionals are unfolded in a loop, and an application is not
+        run: it is returned as a TailCall, which visit_app runs.
+        """
+        while True:
+            if isinstance(exp, Let):
+                self.bind(exp, frame)
+                exp = exp.exp_body
+            elif isinstance(exp, IfThenElse):
+                exp = self.branch(exp, frame)
+            elif isinstance(exp, App):
+                fval = exp.function.accept(self, frame)
+                if not isinstance(fval, Function):
+                    sys.exit("Type error")
+                return TailCall(fval, exp.actual.accept(self, frame))
+            else:
+                return exp.accept(self, frame)
+
+    def visit_app(self, exp, frame):
+        fval = exp.function.accept(self, frame)
+        if not isinstance(fval, Function):
+            sys.exit("Type error")
+        pval = exp.actual.accept(self, frame)
+        while True:
+            if isinstance(fval, RecFunction):
+                val = self.tail(fval.body, [fval.env, fval, pval])
+            else:
+                val = self.tail(fval.body, [fval.env, pval])
+            if type(val) is not TailCall:
+                return val
+            fval = val.function
+            pval = val.actual
+
+
+(CONST, LOCAL, OUTER, UNDEF, STORE, ADD, SUB, MUL, DIV, MOD, LEQ, LTH, EQL,
+ NEG, NOT, AND, OR, BOOL, JUMP, JUMPF, FN, FUN, FUNC, CALL, TAILCALL, RET,
+ HALT) = range(27)
+
+NAMES = ("CONST", "LOCAL", "OUTER", "UNDEF", "STORE", "ADD", "SUB", "MUL",
+         "DIV", "MOD", "LEQ", "LTH", "EQL", "NEG", "NOT", "AND", "OR", "BOOL",
+         "JUMP", "JUMPF", "FN", "FUN", "FUNC", "CALL", "TAILCALL",
+         "RET", "HALT")
+
+
+class Code:
+    """
+    This class represents a program compiled to bytecode: the opcodes, the
+    operands, the table of constants, and the size of the frame of the main
+    program. Each instruction has an opcode, stored in an array of bytes, and
+    an operand, stored in an array of integers. Operands are slots of frames,
+    targets of jumps, or indices into the table of constants. Function bodies
+    are stored after the main program; constants of FN and FUN describe them
+    by tuples such as (name, formal, entry, size), where entry is the index of
+    the first instruction of the body, and size is the number of slots of its
+    frame. The instructions are:
+
+        * CONST k: pushes consts[k]
+        * LOCAL s: pushes the value in slot s of the current frame
+        * OUTER k: pushes the value at the address (depth, slot) = consts[k]
+        * UNDEF k: fails with "Def error" (consts[k] is a name that is not
+          bound)
+        * STORE s: pops a value and stores it in slot s of the current frame
+        * ADD, SUB, MUL, DIV, MOD, LEQ, LTH, EQL: pop two values, push the
+          result
+        * NEG, NOT: pop a value, push the result
+        * AND t, OR t: if the top of the stack decides the result, jumps to
+          t; otherwise, pops it
+        * BOOL: checks that the top of the stack is a boolean
+        * JUMP t: jumps to t
+        * JUMPF t: pops a boolean, and jumps to t if it is False
+        * FN k, FUN k: push a Function or RecFunction whose body is described
+          in consts[k], and whose environment is the current frame
+        * FUNC: checks that the top of the stack is a function
+        * CALL: pops an actual parameter and a function, and jumps into the
+          body of the function, with a new frame
+        * TAILCALL: like CALL, but the function returns to the caller of the
+          current function
+        * RET: returns from the current function
+        * HALT: stops the machine; the result is on the top of the stack
+    """
+
+    def __init__(self):
+        self.ops = array('B')
+        self.args = array('i')
+        self.consts = []
+        self.size = 1
+
+    def __len__(self):
+        return len(self.ops)
+
+    def emit(self, op, arg=0):
+        """
+        Adds an instruction to the end of the program, and returns its index.
+        """
+        self.ops.append(op)
+        self.args.append(arg)
+        return len(self.ops) - 1
+
+    def const(self, value):
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def patch(self, index):
+        """
+        Makes the jump at the given index target the next instruction.
+        """
+        self.args[index] = len(self.ops)
+
+    def dis(self):
+        """
+        Returns a textual representation of the program.
+
+        Example:
+        >>> e = Let('v', Num(3), Add(Var('v'), Var('x')))
+        >>> print(Compiler().compile(e, ['x']).dis())
+        0: CONST 0
+        1: STORE 2
+        2: LOCAL 2
+        3: LOCAL 1
+        4: ADD
+        5: HALT
+        """
+        lines = []
+        with_arg = (CONST, LOCAL, OUTER, UNDEF, STORE, AND, OR, JUMP, JUMPF,
+                    FN, FUN)
+        for i, (op, arg) in enumerate(zip(self.ops, self.args)):
+            if op in with_arg:
+                lines.append(f"{i}: {NAMES[op]} {arg}")
+            else:
+                lines.append(f"{i}: {NAMES[op]}")
+        return "\n".join(lines)
+
+
+class Compiler(Visitor):
+    """
+    The Compiler translates expressions into bytecode. It visits the copy of
+    the expression produced by the ResolveVisitor, so each variable already
+    knows its (depth, slot) address. The inherited attribute is a one-element
+    list with the size of the frame of the function being compiled. Bodies of
+    functions are compiled after the code that creates them, so that the main
+    program comes first.
+
+    Example:
+    >>> e = Let('f', Fn('x', Mul(Var('x'), Var('y'))), App(Var('f'), Num(6)))
+    >>> code = Compiler().compile(e, ['y'])
+    >>> print(code.dis())
+    0: FN 0
+    1: STORE 2
+    2: LOCAL 2
+    3: CONST 1
+    4: CALL
+    5: HALT
+    6: LOCAL 1
+    7: OUTER 2
+    8: MUL
+    9: RET
+    >>> code.consts
+    [(None, 'x', 6, 2), 6, (1, 1)]
+    """
+
+    BINARY = {"Add": ADD, "Sub": SUB, "Mul": MUL, "Div": DIV, "Mod": MOD,
+              "Leq": LEQ, "Lth": LTH, "Eql": EQL}
+
+    def compile(self, exp, names=()):
+        """
+        Compiles exp into a program whose main frame holds, in slots 1, 2,
+        ..., the values of the given names.
+        """
+        self.code = Code()
+        self.pending = []
+        size = [len(names) + 1]
+        ResolveVisitor().resolve(exp, names).accept(self, size)
+        self.code.emit(HALT)
+        self.code.size = size[0]
+        while self.pending:
+            index, body, size = self.pending.pop()
+            name, formal, _, _ = self.code.consts[index]
+            entry = len(self.code)
+            body.accept(self, size)
+            self.code.emit(RET)
+            self.tail_calls(entry)
+            self.code.consts[index] = (name, formal, entry, size[0])
+        return self.code
+
+    def tail_calls(self, entry):
+        """
+        Finds the calls in tail position in the function body that starts at
+        entry, and that ends at the last instruction. A jump to RET is a RET,
+        and a CALL followed by RET is a TAILCALL.
+
+        Example:
+        >>> body = IfThenElse(Var('n'), App(Var('f'), Num(1)), Num(0))
+        >>> e = Fun('f', 'n', body)
+        >>> print(Compiler().compile(e).dis())
+        0: FUN 0
+        1: HALT
+        2: LOCAL 2
+        3: JUMPF 8
+        4: LOCAL 1
+        5: CONST 1
+        6: TAILCALL
+        7: RET
+        8: CONST 2
+        9: RET
+        """
+        ops = self.code.ops
+        args = self.code.args
+        for i in range(entry, len(ops)):
+            if ops[i] == JUMP and ops[args[i]] == RET:
+                ops[i] = RET
+        for i in range(entry, len(ops) - 1):
+            if ops[i] == CALL and ops[i + 1] == RET:
+                ops[i] = TAILCALL
+
+    def visit_var(self, exp, size):
+        try:
+            depth = exp.depth
+        except AttributeError:
+            self.code.emit(UNDEF, self.code.const(exp.identifier))
+            return
+        if depth == 0:
+            self.code.emit(LOCAL, exp.slot)
+        else:
+            self.code.emit(OUTER, self.code.const((depth, exp.slot)))
+
+    def visit_bln(self, exp, size):
+        self.code.emit(CONST, self.code.const(exp.bln))
+
+    def visit_num(self, exp, size):
+        self.code.emit(CONST, self.code.const(exp.num))
+
+    def binary(self, exp, size):
+        exp.left.accept(self, size)
+        exp.right.accept(self, size)
+        self.code.emit(self.BINARY[type(exp).__name__])
+
+    visit_eql = visit_add = visit_sub = visit_mul = binary
+    visit_div = visit_mod = visit_leq = visit_lth = binary
+
+    def logic(self, exp, size, op):
+        exp.left.accept(self, size)
+        jump = self.code.emit(op)
+        exp.right.accept(self, size)
+        self.code.emit(BOOL)
+        self.code.patch(jump)
+
+    def visit_and(self, exp, size):
+        self.logic(exp, size, AND)
+
+    def visit_or(self, exp, size):
+        self.logic(exp, size, OR)
+
+    def visit_neg(self, exp, size):
+        exp.exp.accept(self, size)
+        self.code.emit(NEG)
+
+    def visit_not(self, exp, size):
+        exp.exp.accept(self, size)
+        self.code.emit(NOT)
+
+    def visit_let(self, exp, size):
+        exp.exp_def.accept(self, size)
+        self.code.emit(STORE, exp.slot)
+        size[0] = max(size[0], exp.slot + 1)
+        exp.exp_body.accept(self, size)
+
+    def visit_ifThenElse(self, exp, size):
+        exp.cond.accept(self, size)
+        jump_else = self.code.emit(JUMPF)
+        exp.e0.accept(self, size)
+        jump_end = self.code.emit(JUMP)
+        self.code.patch(jump_else)
+        exp.e1.accept(self, size)
+        self.code.patch(jump_end)
+
+    def visit_fn(self, exp, size):
+        index = self.code.const((None, exp.formal, None, None))
+        self.pending.append((index, exp.body, [2]))
+        self.code.emit(FN, index)
+
+    def visit_fun(self, exp, size):
+        index = self.code.const((exp.name, exp.formal, None, None))
+        self.pending.append((index, exp.body, [3]))
+        self.code.emit(FUN, index)
+
+    def visit_app(self, exp, size):
+        exp.function.accept(self, size)
+        # Like in the EvalVisitor, an application of a value that is not a
+        # function fails before the actual parameter is evaluated. CALL checks
+        # it anyway, so we only need FUNC if the actual parameter may fail.
+        actual = exp.actual
+        if not isinstance(actual, (Num, Bln, Fn, ResolvedVar)):
+            self.code.emit(FUNC)
+        actual.accept(self, size)
+        self.code.emit(CALL)
+
+
+class VM:
+    """
+    This class implements the virtual machine that runs bytecode. The values
+    are the same as in the EvalVisitor: numbers, booleans, Function and
+    RecFunction. The body of a function value is the pair (entry, size) of
+    its code, and its environment is the frame where it was created. Frames
+    are lists, like in the FrameVisitor: slot 0 points to the frame where the
+    function was created. Calls do not use the Python stack, so the depth of
+    the recursion is bounded only by the available memory, and tail calls do
+    not use memory at all.
+
+    Examples:
+    >>> e0 = Let('v', Add(Num(40), Num(2)), Sub(Var('v'), Num(2)))
+    >>> e1 = Lth(e0, Var('x'))
+    >>> VM().evaluate(e1, {'x': 41})
+    True
+
+    >>> e0 = Let('w', Num(3), App(Var('f'), Num(1)))
+    >>> e1 = Let('f', Fn('v', Add(Var('v'), Var('w'))), e0)
+    >>> e2 = Let('w', Num(2), e1)
+    >>> VM().evaluate(e2, {})
+    3
+
+    >>> body = IfThenElse(Leq(Var('n'), Num(1)), Num(1),\
+            Mul(Var('n'), App(Var('f'), Sub(Var('n'), Num(1)))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(Var('f'), Num(10)))
+    >>> VM().evaluate(e0, {})
+    3628800
+
+    >>> e0 = Let('k', Fn('x', Fn('y', Var('x'))), App(App(Var('k'), Num(3)),\
+            Bln(True)))
+    >>> VM().evaluate(e0, {})
+    3
+
+    >>> print(VM().evaluate(Fun('f', 'v', Var('v')), {}))
+    Fun f(v)
+
+    Deep recursion does not use the Python stack:
+    >>> body = IfThenElse(Eql(Var('n'), Num(0)), Num(0),\
+            Add(Var('n'), App(Var('f'), Sub(Var('n'), Num(1)))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(Var('f'), Num(100000)))
+    >>> VM().evaluate(e0, {})
+    5000050000
+    """
+
+    def __init__(self):
+        self.compiler = Compiler()
+        self.programs = {}
+
+    def evaluate(self, exp, env):
+        """
+        Evaluates exp in the environment env, which maps names to values.
+        Each expression is compiled only once for each set of names in env.
+        """
+        names = tuple(env)
+        code = self.programs.get((exp, names))
+        if code is None:
+            code = self.compiler.compile(exp, names)
+            self.programs[(exp, names)] = code
+        return self.run(code, list(env.values()))
+
+    def run(self, code, values):
+        """
+        Runs the program, with the given values in the slots 1, 2, ... of the
+        main frame, and returns the value on the top of the stack.
+        """
+        # Lists are faster to index than arrays, so we decode the program
+        # once, before the dispatch loop.
+        ops = code.ops.tolist()
+        args = code.args.tolist()
+        consts = code.consts
+        frame = [None, *values]
+        frame.extend([None] * (code.size - len(frame)))
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        calls = []
+        pc = 0
+        while True:
+            op = ops[pc]
+            arg = args[pc]
+            pc += 1
+            if op == LOCAL:
+                push(frame[arg])
+            elif op == CONST:
+                push(consts[arg])
+            elif op <= EQL and op >= ADD:
+                right = pop()
+                left = stack[-1]
+                if op == EQL:
+                    if type(left) != type(right):
+                        sys.exit("Type error")
+                    stack[-1] = left == right
+                    continue
+                if type(left) is not int or type(right) is not int:
+                    sys.exit("Type error")
+                if op == ADD:
+                    stack[-1] = left + right
+                elif op == SUB:
+                    stack[-1] = left - right
+                elif op == MUL:
+                    stack[-1] = left * right
+                elif op == LTH:
+                    stack[-1] = left < right
+                elif op == LEQ:
+                    stack[-1] = left <= right
+                elif op == DIV:
+                    stack[-1] = left // right
+                else:
+                    stack[-1] = left % right
+            elif op == JUMPF:
+                val = pop()
+                if type(val) is not bool:
+                    sys.exit("Type error")
+                if not val:
+                    pc = arg
+            elif op == CALL:
+                pval = pop()
+                fval = pop()
+                if not isinstance(fval, Function):
+                    sys.exit("Type error")
+                calls.append((pc, frame))
+                pc, size = fval.body
+                if isinstance(fval, RecFunction):
+                    frame = [fval.env, fval, pval]
+                else:
+                    frame = [fval.env, pval]
+                if size > len(frame):
+                    frame.extend([None] * (size - len(frame)))
+            elif op == RET:
+                pc, frame = calls.pop()
+            elif op == TAILCALL:
+                pval = pop()
+                fval = pop()
+                if not isinstance(fval, Function):
+                    sys.exit("Type error")
+                pc, size = fval.body
+                if isinstance(fval, RecFunction):
+                    frame = [fval.env, fval, pval]
+                else:
+                    frame = [fval.env, pval]
+                if size > len(frame):
+                    frame.extend([None] * (size - len(frame)))
+            elif op == JUMP:
+                pc = arg
+            elif op == OUTER:
+                depth, slot = consts[arg]
+                env = frame
+                while depth:
+                    env = env[0]
+                    depth -= 1
+                push(env[slot])
+            elif op == STORE:
+                frame[arg] = pop()
+            elif op == FUN:
+                name, formal, entry, size = consts[arg]
+                push(RecFunction(name, formal, (entry, size), frame))
+            elif op == FN:
+                _, formal, entry, size = consts[arg]
+                push(Function(formal, (entry, size), frame))
+            elif op == AND or op == OR:
+                val = stack[-1]
+                if type(val) is not bool:
+                    sys.exit("Type error")
+                if val == (op == OR):
+                    pc = arg
+                else:
+                    pop()
+            elif op == FUNC:
+                if not isinstance(stack[-1], Function):
+                    sys.exit("Type error")
+            elif op == BOOL:
+                if type(stack[-1]) is not bool:
+                    sys.exit("Type error")
+            elif op == NEG:
+                val = stack[-1]
+                if type(val) is not int:
+                    sys.exit("Type error")
+                stack[-1] = -val
+            elif op == NOT:
+                val = stack[-1]
+                if type(val) is not bool:
+                    sys.exit("Type error")
+                stack[-1] = not val
+            elif op == UNDEF:
+                sys.exit("Def error")
+            else:
+                return pop()
+
+
+class ConvertVisitor(ResolveVisitor):
+    """
+    The ConvertVisitor does closure conversion. Like the ResolveVisitor, it
+    gives each variable a lexical address, but slot 0 of a function frame no
+    longer points to the frame where the function was created. It holds,
+    instead, a tuple with the values of the free variables of the function.
+    Thus, every variable is either a local (depth 0), or an entry of that
+    tuple (depth 1), and a closure keeps alive only the values that its body
+    may read. Each Fn becomes a ClosureFn, and each Fun becomes a ClosureFun,
+    whose 'captures' are evaluated in the enclosing frame to build the tuple.
+    Functions without free variables are lambda-lifted: their value is built
+    once, here, and every evaluation of the function returns it. Eql compares
+    functions by identity, so sharing the value would make two evaluations of
+    such a function equal. Thus, if the expression has an Eql whose operands
+    might both be functions, every evaluation creates a new value instead.
+
+    The inherited attribute is a quadruple (names, level, size, captured),
+    where the first three fields are like in the ResolveVisitor, and
+    captured maps each free variable of the current function to its index
+    in the tuple.
+
+    Example:
+    >>> e = Let('y', Num(2), Let('z', Num(3),\
+            Fn('x', Add(Var('x'), Var('z')))))
+    >>> f = ConvertVisitor().resolve(e).exp_body.exp_body
+    >>> [(v.identifier, v.depth, v.slot) for v in f.captures]
+    [('z', 0, 2)]
+    >>> f.body.right.depth, f.body.right.slot
+    (1, 0)
+
+    >>> e = Fn('x', Fn('y', Var('y')))
+    >>> f = ConvertVisitor().resolve(e)
+    >>> f.captures, f.value is None, f.body.captures, f.body.value is None
+    ((), False, (), False)
+
+    >>> f = ConvertVisitor().resolve(Eql(e, e))
+    >>> f.left.value is None, f.left.body.value is None
+    (True, True)
+    """
+
+    # Expressions whose values are never functions.
+    SCALARS = (Num, Bln, Add, Sub, Mul, Div, Mod, Neg, Eql, Leq, Lth, And, Or,
+               Not)
+
+    def resolve(self, exp, names=()):
+        """
+        Converts exp in a frame whose slots 1, 2, ... hold the values of the
+        given names.
+        """
+        scope = {name: (0, slot) for slot, name in enumerate(names, 1)}
+        self.lifted = []
+        self.compares_functions = False
+        exp = exp.accept(self, (scope, 0, [len(scope) + 1], {}))
+        if not self.compares_functions:
+            for fn, value in self.lifted:
+                fn.value = value
+        return exp
+
+    def visit_var(self, exp, arg):
+        names, level, _, captured = arg
+        if exp.identifier not in names:
+            return exp
+        bound, slot = names[exp.identifier]
+        if bound == level:
+            return ResolvedVar(exp.identifier, 0, slot)
+        index = captured.setdefault(exp.identifier, len(captured))
+        return ResolvedVar(exp.identifier, 1, index)
+
+    def visit_let(self, exp, arg):
+        names, level, size, captured = arg
+        exp_def = exp.exp_def.accept(self, arg)
+        slot = size[0]
+        size[0] += 1
+        names = {**names, exp.identifier: (level, slot)}
+        exp_body = exp.exp_body.accept(self, (names, level, size, captured))
+        return ResolvedLet(exp.identifier, exp_def, exp_body, slot)
+
+    def captures(self, captured, arg):
+        """
+        Reads the free variables of a function in the enclosing frame. This
+        may, in turn, add them to the free variables of the enclosing
+        function.
+        """
+        return tuple(Var(name).accept(self, arg) for name in captured)
+
+    def visit_eql(self, exp, arg):
+        if not isinstance(exp.left, self.SCALARS) and \
+                not isinstance(exp.right, self.SCALARS):
+            self.compares_functions = True
+        return super().visit_eql(exp, arg)
+
+    def visit_fn(self, exp, arg):
+        names, level, _, _ = arg
+        names = {**names, exp.formal: (level + 1, 1)}
+        captured = {}
+        body = exp.body.accept(self, (names, level + 1, [2], captured))
+        captures = self.captures(captured, arg)
+        fn = ClosureFn(exp.formal, body, captures)
+        if not captures:
+            self.lifted.append((fn, Function(exp.formal, body, ())))
+        return fn
+
+    def visit_fun(self, exp, arg):
+        names, level, _, _ = arg
+        # Like in the Prolog rule for applyrec, the name of the function
+        # shadows the parameter, if both are the same.
+        names = {**names, exp.formal: (level + 1, 2), exp.name: (level + 1, 1)}
+        captured = {}
+        body = exp.body.accept(self, (names, level + 1, [3], captured))
+        captures = self.captures(captured, arg)
+        fn = ClosureFun(exp.name, exp.formal, body, captures)
+        if not captures:
+            value = RecFunction(exp.name, exp.formal, body, ())
+            self.lifted.append((fn, value))
+        return fn
+
+
+class ClosureVisitor(FrameVisitor):
+    """
+    The ClosureVisitor evaluates expressions produced by the ConvertVisitor.
+    It works like the FrameVisitor, except that the env of a function value
+    is the tuple with the values of its free variables, instead of the frame
+    where the function was created. A lifted function evaluates to the value
+    that the ConvertVisitor built for it, unless the expression might compare
+    functions with Eql: then each evaluation creates a new value, and Eql
+    tells them apart, as the EvalVisitor does.
+
+    Examples:
+    >>> e0 = Let('w', Num(3), App(Var('f'), Num(1)))
+    >>> e1 = Let('f', Fn('v', Add(Var('v'), Var('w'))), e0)
+    >>> e2 = Let('w', Num(2), e1)
+    >>> ClosureVisitor().evaluate(e2, {})
+    3
+
+    >>> e0 = Let('k', Fn('x', Fn('y', Var('x'))), App(App(Var('k'), Num(3)),\
+            Bln(True)))
+    >>> ClosureVisitor().evaluate(e0, {})
+    3
+
+    >>> e0 = Let('a', Num(1), Let('b', Num(2), Fn('x', Var('b'))))
+    >>> ClosureVisitor().evaluate(e0, {}).env
+    (2,)
+
+    >>> e0 = Let('mk', Fn('x', Fn('y', Var('y'))),\
+            Eql(App(Var('mk'), Num(1)), App(Var('mk'), Num(2))))
+    >>> ClosureVisitor().evaluate(e0, {})
+    False
+
+    >>> body = IfThenElse(Leq(Var('n'), Num(1)), Var('k'),\
+            Mul(Var('n'), App(Var('f'), Sub(Var('n'), Num(1)))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(Var('f'), Num(10)))
+    >>> ClosureVisitor().evaluate(e0, {'k': 1})
+    3628800
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.resolver = ConvertVisitor()
+
+    def visit_fn(self, exp, frame):
+        if exp.value is not None:
+            return exp.value
+        env = tuple([var.accept(self, frame) for var in exp.captures])
+        return Function(exp.formal, exp.body, env)
+
+    def visit_fun(self, exp, frame):
+        if exp.value is not None:
+            return exp.value
+        env = tuple([var.accept(self, frame) for var in exp.captures])
+        return RecFunction(exp.name, exp.formal, exp.body, env)
+
+
+class CEKMachine(Visitor):
+    """
+    The CEKMachine evaluates expressions following the Prolog rules in
+    Expression.py, but without recursion in Python. Its state has three
+    parts: the Control, which is either an expression to evaluate or a value;
+    the Environment, a dictionary like in the EvalVisitor; and the
+    Kontinuation, a list of frames that tell what to do with the next value.
+    Each visit method runs one step: it returns the value of an atomic
+    expression, or it pushes a frame and returns the pair (exp, env) of the
+    sub-expression that must be evaluated next. Each frame is a tuple whose
+    first element is the method that receives the value. Function bodies and
+    the branches of conditionals do not push frames, so tail calls run in
+    constant space, and other calls use only the heap.
+
+    Examples:
+    >>> e0 = Let('v', Add(Num(40), Num(2)), Sub(Var('v'), Num(2)))
+    >>> e1 = Lth(e0, Var('x'))
+    >>> CEKMachine().evaluate(e1, {'x': 41})
+    True
+
+    >>> e0 = Let('w', Num(3), App(Var('f'), Num(1)))
+    >>> e1 = Let('f', Fn('v', Add(Var('v'), Var('w'))), e0)
+    >>> e2 = Let('w', Num(2), e1)
+    >>> CEKMachine().evaluate(e2, {})
+    3
+
+    >>> e0 = Let('k', Fn('x', Fn('y', Var('x'))), App(App(Var('k'), Num(3)),\
+            Bln(True)))
+    >>> CEKMachine().evaluate(e0, {})
+    3
+
+    >>> body = IfThenElse(Eql(Var('n'), Num(0)), Num(0),\
+            Add(Var('n'), App(Var('f'), Sub(Var('n'), Num(1)))))
+    >>> e0 = Let('f', Fun('f', 'n', body), App(Var('f'), Num(100000)))
+    >>> CEKMachine().evaluate(e0, {})
+    5000050000
+
+    The same program, with a recursion depth of 10**6, runs in
+    depth_benchmark(), which is not a doctest because it takes a few seconds.
+    """
+
+    def evaluate(self, exp, env):
+        # Values of the language are never tuples, so a tuple in the
+        # control is always an expression that must still be evaluated.
+        self.kont = kont = []
+        control = (exp, env)
+        while True:
+            while type(control) is tuple:
+                exp, env = control
+                control = exp.accept(self, env)
+            if not kont:
+                return control
+            frame = kont.pop()
+            control = frame[0](control, frame)
+
+    def visit_var(self, exp, env):
+        if exp.identifier in env:
+            return env[exp.identifier]
+        else:
+            sys.exit("Def error")
+
+    def visit_bln(self, exp, env):
+        return exp.bln
+
+    def visit_num(self, exp, env):
+        return exp.num
+
+    def binary(self, exp, env, finish):
+        self.kont.append((self.right, exp, env, finish))
+        return (exp.left, env)
+
+    def right(self, val, frame):
+        _, exp, env, finish = frame
+        self.kont.append((finish, val))
+        return (exp.right, env)
+
+    def visit_eql(self, exp, env):
+        return self.binary(exp, env, self.finish_eql)
+
+    def finish_eql(self, val, frame):
+        if type(frame[1]) == type(val):
+            return frame[1] == val
+        else:
+            sys.exit("Type error")
+
+    def visit_and(self, exp, env):
+        self.kont.append((self.logic, exp, env, False))
+        return (exp.left, env)
+
+    def visit_or(self, exp, env):
+        self.kont.append((self.logic, exp, env, True))
+        return (exp.left, env)
+
+    def logic(self, val, frame):
+        _, exp, env, short = frame
+        if type(val) is not bool:
+            sys.exit("Type error")
+        if val == short:
+            return val
+        self.kont.append((self.finish_bool,))
+        return (exp.right, env)
+
+    def finish_bool(self, val, frame):
+        if type(val) is not bool:
+            sys.exit("Type error")
+        return val
+
+    def visit_add(self, exp, env):
+        return self.binary(exp, env, self.finish_add)
+
+    def visit_sub(self, exp, env):
+        return self.binary(exp, env, self.finish_sub)
+
+    def visit_mul(self, exp, env):
+        return self.binary(exp, env, self.finish_mul)
+
+    def visit_div(self, exp, env):
+        return self.binary(exp, env, self.finish_div)
+
+    def visit_mod(self, exp, env):
+        return self.binary(exp, env, self.finish_mod)
+
+    def visit_leq(self, exp, env):
+        return self.binary(exp, env, self.finish_leq)
+
+    def visit_lth(self, exp, env):
+        return self.binary(exp, env, self.finish_lth)
+
+    def numbers(self, left, right):
+        if type(left) is not int or type(right) is not int:
+            sys.exit("Type error")
+
+    def finish_add(self, val, frame):
+        self.numbers(frame[1], val)
+        return frame[1] + val
+
+    def finish_sub(self, val, frame):
+        self.numbers(frame[1], val)
+        return frame[1] - val
+
+    def finish_mul(self, val, frame):
+        self.numbers(frame[1], val)
+        return frame[1] * val
+
+    def finish_div(self, val, frame):
+        self.numbers(frame[1], val)
+        return frame[1] // val
+
+    def finish_mod(self, val, frame):
+        self.numbers(frame[1], val)
+        return frame[1] % val
+
+    def finish_leq(self, val, frame):
+        self.numbers(frame[1], val)
+        return frame[1] <= val
+
+    def finish_lth(self, val, frame):
+        self.numbers(frame[1], val)
+        return frame[1] < val
+
+    def visit_neg(self, exp, env):
+        self.kont.append((self.finish_neg,))
+        return (exp.exp, env)
+
+    def finish_neg(self, val, frame):
+        if type(val) is not int:
+            sys.exit("Type error")
+        return -val
+
+    def visit_not(self, exp, env):
+        self.kont.append((self.finish_not,))
+        return (exp.exp, env)
+
+    def finish_not(self, val, frame):
+        if type(val) is not bool:
+            sys.exit("Type error")
+        return not val
+
+    def visit_let(self, exp, env):
+        self.kont.append((self.let_body, exp, env))
+        return (exp.exp_def, env)
+
+    def let_body(self, val, frame):
+        _, exp, env = frame
+        new_env = dict(env)
+        new_env[exp.identifier] = val
+        return (exp.exp_body, new_env)
+
+    def visit_ifThenElse(self, exp, env):
+        self.kont.append((self.branch, exp, env))
+        return (exp.cond, env)
+
+    def branch(self, val, frame):
+        _, exp, env = frame
+        if type(val) is not bool:
+            sys.exit("Type error")
+        return (exp.e0, env) if val else (exp.e1, env)
+
+    def visit_fn(self, exp, env):
+        return Function(exp.formal, exp.body, env)
+
+    def visit_fun(self, exp, env):
+        return RecFunction(exp.name, exp.formal, exp.body, env)
+
+    def visit_app(self, exp, env):
+        self.kont.append((self.actual, exp, env))
+        return (exp.function, env)
+
+    def actual(self, fval, frame):
+        _, exp, env = frame
+        if not isinstance(fval, Function):
+            sys.exit("Type error")
+        self.kont.append((self.apply, fval))
+        return (exp.actual, env)
+
+    def apply(self, pval, frame):
+        fval = frame[1]
+        new_env = dict(fval.env)
+        new_env[fval.formal] = pval
+        if isinstance(fval, RecFunction):
+            new_env[fval.name] = fval
+        return (fval.body, new_env)
+
+
+class FoldVisitor(Visitor):
+    """
+    The FoldVisitor simplifies an expression before it is evaluated. It
+    returns a new expression where:
+
+    1. Operations whose operands are constants of the right type are replaced
+       by their values, e.g., 2 * 3 becomes 6.
+    2. Identities are simplified: x * 1, 1 * x, x + 0, 0 + x and x - 0 become
+       x, and not (not x) becomes x.
+    3. Conditionals whose condition is a constant are replaced by one of
+       their branches.
+
+    The simplified expression has the same behavior as the original one. In
+    particular, divisions by zero are not folded, and the identities only
+    apply if x is known to be a number (or a boolean, for 'not'), so that
+    type errors still happen at run time.
+
+    Examples:
+    >>> e = Add(Mul(Num(2), Num(3)), Mul(Neg(Var('x')), Sub(Num(4), Num(3))))
+    >>> f = e.accept(FoldVisitor(), None)
+    >>> type(f).__name__, f.left.num, type(f.right).__name__
+    ('Add', 6, 'Neg')
+
+    >>> e = Mul(Add(Var('x'), Num(1)), Add(Num(0), Num(1)))
+    >>> f = e.accept(FoldVisitor(), None)
+    >>> type(f).__name__, type(f.left).__name__, f.right.num
+    ('Add', 'Var', 1)
+
+    >>> e = IfThenElse(Lth(Num(2), Num(3)), Var('a'), Div(Num(1), Num(0)))
+    >>> e.accept(FoldVisitor(), None).identifier
+    'a'
+
+    >>> e = Div(Num(1), Sub(Num(2), Num(2)))
+    >>> f = e.accept(FoldVisitor(), None)
+    >>> type(f).__name__, f.left.num, f.right.num
+    ('Div', 1, 0)
+
+    >>> e = Not(Not(Leq(Var('x'), Num(2))))
+    >>> type(e.accept(FoldVisitor(), None)).__name__
+    'Leq'
+    """
+
+    def numeric(self, exp):
+        """
+        Tells if exp certainly evaluates to a number (if it evaluates at all).
+        """
+        return isinstance(exp, (Num, Add, Sub, Mul, Div, Mod, Neg))
+
+    def boolean(self, exp):
+        """
+        Tells if exp certainly evaluates to a boolean (if it evaluates at all).
+        """
+        return isinstance(exp, (Bln, Eql, Leq, Lth, And, Or, Not))
+
+    def visit_var(self, exp, arg):
+        return exp
+
+    def visit_bln(self, exp, arg):
+        return exp
+
+    def visit_num(self, exp, arg):
+        return exp
+
+    def fold(self, exp, arg, op):
+        """
+        Folds the binary expression exp, if both operands are numbers.
+        Otherwise, returns a copy of exp with simplified operands.
+        """
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Num and type(right) is Num:
+            val = op(left.num, right.num)
+            return Num(val) if type(val) is int else Bln(val)
+        return type(exp)(left, right)
+
+    def visit_eql(self, exp, arg):
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Num and type(right) is Num:
+            return Bln(left.num == right.num)
+        if type(left) is Bln and type(right) is Bln:
+            return Bln(left.bln == right.bln)
+        return Eql(left, right)
+
+    def logic(self, exp, arg, short):
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Bln:
+            if left.bln == short:
+                return left
+            if self.boolean(right):
+                return right
+        return type(exp)(left, right)
+
+    def visit_and(self, exp, arg):
+        return self.logic(exp, arg, False)
+
+    def visit_or(self, exp, arg):
+        return self.logic(exp, arg, True)
+
+    def visit_add(self, exp, arg):
+        f = self.fold(exp, arg, int.__add__)
+        if type(f) is Add:
+            if type(f.right) is Num and f.right.num == 0 and \
+                    self.numeric(f.left):
+                return f.left
+            if type(f.left) is Num and f.left.num == 0 and \
+                    self.numeric(f.right):
+                return f.right
+        return f
+
+    def visit_sub(self, exp, arg):
+        f = self.fold(exp, arg, int.__sub__)
+        if type(f) is Sub and type(f.right) is Num and f.right.num == 0 and \
+                self.numeric(f.left):
+            return f.left
+        return f
+
+    def visit_mul(self, exp, arg):
+        f = self.fold(exp, arg, int.__mul__)
+        if type(f) is Mul:
+            if type(f.right) is Num and f.right.num == 1 and \
+                    self.numeric(f.left):
+                return f.left
+            if type(f.left) is Num and f.left.num == 1 and \
+                    self.numeric(f.right):
+                return f.right
+        return f
+
+    def division(self, exp, arg, op):
+        left = exp.left.accept(self, arg)
+        right = exp.right.accept(self, arg)
+        if type(left) is Num and type(right) is Num and right.num != 0:
+            return Num(op(left.num, right.num))
+        return type(exp)(left, right)
+
+    def visit_div(self, exp, arg):
+        return self.division(exp, arg, int.__floordiv__)
+
+    def visit_mod(self, exp, arg):
+        return self.division(exp, arg, int.__mod__)
+
+    def visit_leq(self, exp, arg):
+        return self.fold(exp, arg, int.__le__)
+
+    def visit_lth(self, exp, arg):
+        return self.fold(exp, arg, int.__lt__)
+
+    def visit_neg(self, exp, arg):
+        sub = exp.exp.accept(self, arg)
+        if type(sub) is Num:
+            return Num(-sub.num)
+        return Neg(sub)
+
+    def visit_not(self, exp, arg):
+        sub = exp.exp.accept(self, arg)
+        if type(sub) is Bln:
+            return Bln(not sub.bln)
+        if type(sub) is Not and self.boolean(sub.exp):
+            return sub.exp
+        return Not(sub)
+
+    def visit_let(self, exp, arg):
+        return Let(exp.identifier, exp.exp_def.accept(self, arg),
+                   exp.exp_body.accept(self, arg))
+
+    def visit_ifThenElse(self, exp, arg):
+        cond = exp.cond.accept(self, arg)
+        if type(cond) is Bln:
+            branch = exp.e0 if cond.bln else exp.e1
+            return branch.accept(self, arg)
+        return IfThenElse(cond, exp.e0.accept(self, arg),
+                          exp.e1.accept(self, arg))
+
+    def visit_fn(self, exp, arg):
+        return Fn(exp.formal, exp.body.accept(self, arg))
+
+    def visit_fun(self, exp, arg):
+        return Fun(exp.name, exp.formal, exp.body.accept(self, arg))
+
+    def visit_app(self, exp, arg):
+        return App(exp.function.accept(self, arg), exp.actual.accept(self, arg))
+
+
+class SubstVisitor(Visitor):
+    """
+    The SubstVisitor replaces the only free use of the variable 'name' by the
+    expression 'exp'. It assumes that this use is not inside a function body.
+    The inherited attribute tells if the use would be captured, i.e., if we
+    are inside a let that binds a free variable of 'exp'. In this case, the
+    substitution is not valid, and the field 'captured' becomes True.
+    """
+
+    def __init__(self, name, exp, free):
+        self.name = name
+        self.exp = exp
+        self.free = free
+        self.captured = False
+
+    def visit_var(self, exp, blocked):
+        if exp.identifier == self.name:
+            self.captured = self.captured or blocked
+            return self.exp
+        return exp
+
+    def visit_bln(self, exp, blocked):
+        return exp
+
+    def visit_num(self, exp, blocked):
+        return exp
+
+    def binary(self, exp, blocked):
+        return type(exp)(exp.left.accept(self, blocked),
+                         exp.right.accept(self, blocked))
+
+    def unary(self, exp, blocked):
+        return type(exp)(exp.exp.accept(self, blocked))
+
+    visit_eql = visit_and = visit_or = binary
+    visit_add = visit_sub = visit_mul = visit_div = visit_mod = binary
+    visit_leq = visit_lth = binary
+    visit_neg = visit_not = unary
+
+    def visit_let(self, exp, blocked):
+        exp_def = exp.exp_def.accept(self, blocked)
+        if exp.identifier == self.name:
+            return Let(exp.identifier, exp_def, exp.exp_body)
+        blocked = blocked or exp.identifier in self.free
+        return Let(exp.identifier, exp_def, exp.exp_body.accept(self, blocked))
+
+    def visit_ifThenElse(self, exp, blocked):
+        return IfThenElse(exp.cond.accept(self, blocked),
+                          exp.e0.accept(self, blocked),
+                          exp.e1.accept(self, blocked))
+
+    def visit_fn(self, exp, blocked):
+        return exp
+
+    def visit_fun(self, exp, blocked):
+        return exp
+
+    def visit_app(self, exp, blocked):
+        return App(exp.function.accept(self, blocked),
+                   exp.actual.accept(self, blocked))
+
+
+class InlineLetVisitor(Visitor):
+    """
+    The InlineLetVisitor removes let bindings that are never used, and
+    replaces bindings that are used only once by their definitions. It only
+    does so if the definition is pure, i.e., if evaluating it never fails and
+    always terminates. Thus, 'let x = 1 div 0 in 2' keeps its binding. Uses
+    inside function bodies count as many uses, because the body may run many
+    times.
+
+    Each visit returns a triple (exp, uses, kind): the simplified expression,
+    a dictionary that counts the uses of each free variable of it, like the
+    set of free variables of the UseDefVisitor in 5_Visitors, and the kind of
+    the expression: None if it is not pure, or else "num", "bool", "fn" or
+    "any", telling what we know about its value. The inherited attribute maps
+    the names of the variables in scope to their kinds. We do not call the
+    UseDefVisitor itself: it is an exercise that 5_Visitors leaves for the
+    students to implement, and a set of free variables does not tell a
+    binding used once from a binding used many times.
+
+    Examples:
+    >>> e = Let('x', Num(2), Let('y', Num(3), Add(Var('x'), Var('x'))))
+    >>> f = InlineLetVisitor().inline(e)
+    >>> type(f).__name__, f.identifier, type(f.exp_body).__name__
+    ('Let', 'x', 'Add')
+
+    >>> e = Let('x', Add(Num(2), Var('z')), Mul(Var('x'), Num(3)))
+    >>> f = InlineLetVisitor().inline(e, ['z'])
+    >>> type(f).__name__
+    'Let'
+
+    >>> e = Let('x', Sub(Num(2), Num(3)), Mul(Var('x'), Num(3)))
+    >>> f = InlineLetVisitor().inline(e)
+    >>> type(f).__name__, type(f.left).__name__
+    ('Mul', 'Sub')
+
+    >>> e = Let('x', Div(Num(2), Num(0)), Num(3))
+    >>> type(InlineLetVisitor().inline(e)).__name__
+    'Let'
+
+    >>> e = Let('x', Num(2), Fn('y', Add(Var('x'), Var('y'))))
+    >>> type(InlineLetVisitor().inline(e)).__name__
+    'Let'
+    """
+
+    def inline(self, exp, names=()):
+        """
+        Simplifies exp, assuming that the given names are bound to values.
+        """
+        return exp.accept(self, {name: "any" for name in names})[0]
+
+    def merge(self, *uses):
+        total = {}
+        for use in uses:
+            for name, count in use.items():
+                total[name] = total.get(name, 0) + count
+        return total
+
+    def function(self, uses, *names):
+        """
+        Returns the uses of the free variables of a function whose body has
+        the given uses, and whose parameters are the given names. Uses count
+        twice, because the body may run many times.
+        """
+        return {name: 2 * count for name, count in uses.items()
+                if name not in names}
+
+    def visit_var(self, exp, kinds):
+        return exp, {exp.identifier: 1}, kinds.get(exp.identifier)
+
+    def visit_bln(self, exp, kinds):
+        return exp, {}, "bool"
+
+    def visit_num(self, exp, kinds):
+        return exp, {}, "num"
+
+    def binary(self, exp, kinds, operand, result):
+        """
+        Simplifies a binary expression. It is pure if both operands are pure
+        and of the given kind.
+        """
+        left, left_uses, left_kind = exp.left.accept(self, kinds)
+        right, right_uses, right_kind = exp.right.accept(self, kinds)
+        kind = None
+        if left_kind == operand and right_kind == operand:
+            kind = result
+        return type(exp)(left, right), self.merge(left_uses, right_uses), kind
+
+    def visit_eql(self, exp, kinds):
+        left, left_uses, left_kind = exp.left.accept(self, kinds)
+        right, right_uses, right_kind = exp.right.accept(self, kinds)
+        kind = None
+        if left_kind == right_kind and left_kind in ("num", "bool"):
+            kind = "bool"
+        return Eql(left, right), self.merge(left_uses, right_uses), kind
+
+    def visit_and(self, exp, kinds):
+        return self.binary(exp, kinds, "bool", "bool")
+
+    def visit_or(self, exp, kinds):
+        return self.binary(exp, kinds, "bool", "bool")
+
+    def visit_add(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "num")
+
+    def visit_sub(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "num")
+
+    def visit_mul(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "num")
+
+    def division(self, exp, kinds):
+        new, uses, kind = self.binary(exp, kinds, "num", "num")
+        if type(new.right) is not Num or new.right.num == 0:
+            kind = None
+        return new, uses, kind
+
+    visit_div = visit_mod = division
+
+    def visit_leq(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "bool")
+
+    def visit_lth(self, exp, kinds):
+        return self.binary(exp, kinds, "num", "bool")
+
+    def visit_neg(self, exp, kinds):
+        sub, uses, kind = exp.exp.accept(self, kinds)
+        return Neg(sub), uses, "num" if kind == "num" else None
+
+    def visit_not(self, exp, kinds):
+        sub, uses, kind = exp.exp.accept(self, kinds)
+        return Not(sub), uses, "bool" if kind == "bool" else None
+
+    def visit_let(self, exp, kinds):
+        name = exp.identifier
+        exp_def, def_uses, def_kind = exp.exp_def.accept(self, kinds)
+        body_kinds = {**kinds, name: def_kind or "any"}
+        body, body_uses, body_kind = exp.exp_body.accept(self, body_kinds)
+        count = body_uses.pop(name, 0)
+        if def_kind is not None and count == 0:
+            return body, body_uses, body_kind
+        if def_kind is not None and count == 1:
+            subst = SubstVisitor(name, exp_def, def_uses)
+            new_body = body.accept(subst, False)
+            if not subst.captured:
+                return new_body, self.merge(def_uses, body_uses), body_kind
+        kind = body_kind if def_kind is not None else None
+        return Let(name, exp_def, body), self.merge(def_uses, body_uses), kind
+
+    def visit_ifThenElse(self, exp, kinds):
+        cond, cond_uses, cond_kind = exp.cond.accept(self, kinds)
+        e0, e0_uses, e0_kind = exp.e0.accept(self, kinds)
+        e1, e1_uses, e1_kind = exp.e1.accept(self, kinds)
+        kind = None
+        if cond_kind == "bool" and e0_kind and e1_kind:
+            kind = e0_kind if e0_kind == e1_kind else "any"
+        uses = self.merge(cond_uses, e0_uses, e1_uses)
+        return IfThenElse(cond, e0, e1), uses, kind
+
+    def visit_fn(self, exp, kinds):
+        body, uses, _ = exp.body.accept(self, {**kinds, exp.formal: "any"})
+        return Fn(exp.formal, body), self.function(uses, exp.formal), "fn"
+
+    def visit_fun(self, exp, kinds):
+        body_kinds = {**kinds, exp.name: "fn", exp.formal: "any"}
+        body, uses, _ = exp.body.accept(self, body_kinds)
+        uses = self.function(uses, exp.name, exp.formal)
+        return Fun(exp.name, exp.formal, body), uses, "fn"
+
+    def visit_app(self, exp, kinds):
+        function, function_uses, _ = exp.function.accept(self, kinds)
+        actual, actual_uses, _ = exp.actual.accept(self, kinds)
+        uses = self.merge(function_uses, actual_uses)
+        return App(function, actual), uses, None
+
+
+class Binding:
+    """
+    This class represents the binding of a variable in the BetaVisitor. If
+    the variable is bound to a function literal, 'fn' is that literal, and
+    'captured' maps its free variables to their bindings, and 'size' is the
+    size of the let that replaces a call to it.
+    """
+
+    __slots__ = ("fn", "captured", "size")
+
+    def __init__(self, fn=None, captured=None, size=0):
+        self.fn = fn
+        self.captured = captured
+        self.size = size
+
+
+class BetaVisitor(Visitor):
+    """
+    The BetaVisitor replaces applications of anonymous functions by let
+    bindings. An application such as '(fn x => e0) e1' becomes
+    'let x = e1 in e0', which evaluates to the same value, but does not
+    create a closure, nor call it. If a variable f is bound to a function
+    literal by a let, then calls 'f e1' are replaced in the same way, with a
+    copy of the body of f, as long as the body has at most 'max_size' nodes,
+    and its free variables still have the same bindings at the call site. If
+    all the uses of f are replaced, the let that binds f is removed.
+
+    Each visit returns a triple (exp, free, size): the new expression, the
+    set of its free variables, and its number of nodes. The inherited
+    attribute maps the variables in scope to their Binding.
+
+    Examples:
+    >>> e = App(Fn('x', Add(Var('x'), Num(1))), Num(3))
+    >>> f = BetaVisitor().reduce(e)
+    >>> type(f).__name__, f.identifier, f.exp_def.num
+    ('Let', 'x', 3)
+
+    >>> e = Let('f', Fn('x', Mul(Var('x'), Var('y'))),\
+            Add(App(Var('f'), Num(2)), App(Var('f'), Num(3))))
+    >>> f = BetaVisitor().reduce(e)
+    >>> type(f).__name__, type(f.left).__name__, type(f.right).__name__
+    ('Add', 'Let', 'Let')
+
+    >>> e = Let('f', Fn('x', Mul(Var('x'), Var('y'))),\
+            Let('y', Num(2), App(Var('f'), Num(3))))
+    >>> type(BetaVisitor().reduce(e)).__name__
+    'Let'
+
+    >>> e = Let('f', Fn('x', Mul(Var('x'), Var('y'))),\
+            Add(App(Var('f'), Num(2)), App(Var('f'), Num(3))))
+    >>> f = BetaVisitor(max_size=2).reduce(e)
+    >>> type(f).__name__, type(f.exp_body.left).__name__
+    ('Let', 'App')
+    """
+
+    def __init__(self, max_size=20):
+        self.max_size = max_size
+
+    def reduce(self, exp):
+        return exp.accept(self, {})[0]
+
+    def visit_var(self, exp, scope):
+        return exp, {exp.identifier}, 1
+
+    def visit_bln(self, exp, scope):
+        return exp, set(), 1
+
+    def visit_num(self, exp, scope):
+        return exp, set(), 1
+
+    def binary(self, exp, scope):
+        left, left_free, left_size = exp.left.accept(self, scope)
+        right, right_free, right_size = exp.right.accept(self, scope)
+        return (type(exp)(left, right), left_free | right_free,
+                left_size + right_size + 1)
+
+    def unary(self, exp, scope):
+        sub, free, size = exp.exp.accept(self, scope)
+        return type(exp)(sub), free, size + 1
+
+    visit_eql = visit_and = visit_or = binary
+    visit_add = visit_sub = visit_mul = visit_div = visit_mod = binary
+    visit_leq = visit_lth = binary
+    visit_neg = visit_not = unary
+
+    def visit_let(self, exp, scope):
+        name = exp.identifier
+        exp_def, def_free, def_size = exp.exp_def.accept(self, scope)
+        binding = Binding()
+        if type(exp_def) is Fn and def_size - 1 <= self.max_size:
+            captured = {v: scope.get(v) for v in def_free}
+            binding = Binding(exp_def, captured, def_size)
+        body, body_free, body_size = \
+            exp.exp_body.accept(self, {**scope, name: binding})
+        if binding.fn is not None and name not in body_free:
+            # Every call was replaced, and creating a closure has no effect.
+            return body, body_free, body_size
+        free = def_free | (body_free - {name})
+        return Let(name, exp_def, body), free, def_size + body_size + 1
+
+    def visit_ifThenElse(self, exp, scope):
+        cond, cond_free, cond_size = exp.cond.accept(self, scope)
+        e0, e0_free, e0_size = exp.e0.accept(self, scope)
+        e1, e1_free, e1_size = exp.e1.accept(self, scope)
+        return (IfThenElse(cond, e0, e1), cond_free | e0_free | e1_free,
+                cond_size + e0_size + e1_size + 1)
+
+    def visit_fn(self, exp, scope):
+        body, free, size = \
+            exp.body.accept(self, {**scope, exp.formal: Binding()})
+        return Fn(exp.formal, body), free - {exp.formal}, size + 1
+
+    def visit_fun(self, exp, scope):
+        body_scope = {**scope, exp.name: Binding(), exp.formal: Binding()}
+        body, free, size = exp.body.accept(self, body_scope)
+        free = free - {exp.name, exp.formal}
+        return Fun(exp.name, exp.formal, body), free, size + 1
+
+    def visit_app(self, exp, scope):
+        actual, actual_free, actual_size = exp.actual.accept(self, scope)
+        function = exp.function
+        if type(function) is Var and function.identifier in scope:
+            known = scope[function.identifier]
+            if known.fn is not None and all(
+                    scope.get(v) is binding
+                    for v, binding in known.captured.items()):
+                # The copy keeps the tree free of shared nodes.
+                body = copy.deepcopy(known.fn.body)
+                free = actual_free | set(known.captured)
+                return (Let(known.fn.formal, actual, body), free,
+                        known.size + actual_size)
+        function, function_free, function_size = function.accept(self, scope)
+        if type(function) is Fn:
+            size = function_size + actual_size
+            free = actual_free | function_free
+            return Let(function.formal, actual, function.body), free, size
+        return (App(function, actual), function_free | actual_free,
+                function_size + actual_size + 1)
+
+
+def benchmark(n=20, visitors=(EvalVisitor, CompileVisitor, FrameVisitor,
+                             CEKMachine, VM), repeat=3):
+    """
+    Prints how long each visitor takes to evaluate two recursive programs: the
+    n-th Fibonacci number, and the sum of 1..(10 * n) via a recursive
+    function. Visitors that are not implemented yet are skipped. To use it,
+    do, for instance:
+
+    python3 -c "import Visitor; Visitor.benchmark()"
+    """
+    import time
+
+    def call(f, e):
+        return App(Var(f), e)
+
+    fib = Let('fib', Fun('fib', 'n', IfThenElse(Lth(Var('n'), Num(2)),
+              Var('n'), Add(call('fib', Sub(Var('n'), Num(1))),
+                            call('fib', Sub(Var('n'), Num(2)))))),
+              call('fib', Num(n)))
+    tri = Let('tri', Fun('tri', 'n', IfThenElse(Eql(Var('n'), Num(0)),
+              Num(0), Add(Var('n'), call('tri', Sub(Var('n'), Num(1)))))),
+              call('tri', Num(10 * n)))
+    # The tree-walking visitor spends a few Python frames per level of 'tri'.
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+    for name, program in (("fib", fib), ("tri", tri)):
+        for visitor in visitors:
+            best = None
+            for _ in range(repeat):
+                begin = time.perf_counter()
+                try:
+                    if hasattr(visitor, "evaluate"):
+                        value = visitor().evaluate(program, {})
+                    else:
+                        value = program.accept(visitor(), {})
+                except NotImplementedError:
+                    value = None
+                elapsed = time.perf_counter() - begin
+                if best is None or elapsed < best:
+                    best = elapsed
+            if value is None:
+                print(f"{name} {visitor.__name__}: not implemented")
+            else:
+                print(f"{name} {visitor.__name__}: {value}, {best:.3f}s")
+
+
+def loop_benchmark(n=10**6, visitors=(EvalVisitor, CompileVisitor,
+                                      FrameVisitor, ClosureVisitor,
+                                      CEKMachine, VM), repeat=3):
+    """
+    Prints how long each visitor takes to run a tail-recursive loop with n
+    iterations: a curried function that sums 1..n into an accumulator.
+    Visitors that are not implemented yet, or that run out of Python stack,
+    are skipped. To use it, do, for instance:
+
+    python3 -c "import Visitor; Visitor.loop_benchmark()"
+    """
+    import time
+
+    step = App(App(Var('loop'), Sub(Var('n'), Num(1))), Add(Var('a'), Var('n')))
+    body = Fn('a', IfThenElse(Eql(Var('n'), Num(0)), Var('a'), step))
+    program = Let('loop', Fun('loop', 'n', body),
+                  App(App(Var('loop'), Num(n)), Num(0)))
+    for visitor in visitors:
+        best = None
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            try:
+                if hasattr(visitor, "evaluate"):
+                    value = visitor().evaluate(program, {})
+                else:
+                    value = program.accept(visitor(), {})
+            except NotImplementedError:
+                value = "not implemented"
+            except RecursionError:
+                value = "stack overflow"
+            elapsed = time.perf_counter() - begin
+            if best is None or elapsed < best:
+                best = elapsed
+        if isinstance(value, str):
+            print(f"loop {visitor.__name__}: {value}")
+        else:
+            print(f"loop {visitor.__name__}: {value}, {best:.3f}s")
+
+
+def depth_benchmark(n=10**6, visitors=(FrameVisitor, CEKMachine, VM)):
+    """
+    Prints how long each visitor takes to evaluate a recursive function that
+    is not tail recursive, and that sums 1..n, so that the recursion gets n
+    calls deep. Visitors that run out of Python stack are skipped. To use it,
+    do, for instance:
+
+    python3 -c "import Visitor; Visitor.depth_benchmark()"
+    """
+    import time
+
+    body = IfThenElse(Eql(Var('n'), Num(0)), Num(0),
+                      Add(Var('n'), App(Var('f'), Sub(Var('n'), Num(1)))))
+    program = Let('f', Fun('f', 'n', body), App(Var('f'), Num(n)))
+    for visitor in visitors:
+        begin = time.perf_counter()
+        try:
+            value = visitor().evaluate(program, {})
+        except RecursionError:
+            print(f"depth {visitor.__name__}: stack overflow")
+            continue
+        elapsed = time.perf_counter() - begin
+        print(f"depth {visitor.__name__}: {value}, {elapsed:.3f}s")
+
+def closure_benchmark(n=2000, visitors=(FrameVisitor, ClosureVisitor)):
+    """
+    Prints how much memory each visitor keeps alive in the value of a program
+    that builds a chain of n closures. Each closure only needs the next one,
+    but the frame of the function that creates it also has other values.
+    To use it, do, for instance:
+
+    python3 -c "import Visitor; Visitor.closure_benchmark()"
+    """
+    import tracemalloc
+
+    def call(f, e):
+        return App(Var(f), e)
+
+    step = Fn('x', Add(call('g', Var('x')), Num(1)))
+    body = IfThenElse(Eql(Var('n'), Num(0)), Fn('x', Var('x')),
+                      Let('m', Mul(Var('n'), Var('n')),
+                          Let('g', call('build', Sub(Var('n'), Num(1))),
+                              step)))
+    program = Let('build', Fun('build', 'n', body), call('build', Var('n')))
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+    for visitor in visitors:
+        ev = visitor()
+        ev.evaluate(program, {'n': 1})
+        tracemalloc.start()
+        chain = ev.evaluate(program, {'n': n})
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        value = ev.evaluate(App(Var('f'), Num(0)), {'f': chain})
+        print(f"closures {visitor.__name__}: {value}, {size // 1024}KB")